@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+#
+# Build context benchmarks: context scan (TagFile) and tar upload throughput
+#
+# Creates synthetic build contexts (100 small files per directory) and measures
+# - how long TagFile takes to find the newest file
+# - how fast _fillTar() streams the context through Request.write() (to a sink
+#   that discards the data, so only rocker's side is measured)
+# - how fast a cached context (see rocker.contextcache) is replayed using
+#   Request.writeFile() (including the digest it's looked up by)
+#
+# Creating the larger contexts takes a while, so they're kept in contextDir (if
+# given) and reused by subsequent runs.
+#
+# usage: python3 -m benchmarks.buildcontext [contextDir] [fileCount...]
+#
+
+from benchmarks.timing import bestOf, withRate
+from rocker import contextcache, image
+from rocker.restclient import Request
+
+import os
+import shutil
+import socket
+import sys
+import tarfile
+import tempfile
+import threading
+
+FILE_COUNTS = [1000, 100000, 1000000]
+FILES_PER_DIR = 100
+FILE_SIZE = 256
+
+# Creates (or reuses) a synthetic build context with `count` files and returns its path
+def createContext(baseDir, count):
+	path = os.path.join(baseDir, 'context-{0}'.format(count))
+	marker = os.path.join(path, '.complete')
+	if os.path.exists(marker):
+		return path
+
+	shutil.rmtree(path, ignore_errors=True)
+	os.makedirs(path)
+	with open(os.path.join(path, 'Dockerfile'), 'w') as f:
+		f.write("FROM debian\nADD . /app\n")
+
+	content = b'x'*FILE_SIZE
+	for i in range(count):
+		if i % FILES_PER_DIR == 0:
+			dirPath = os.path.join(path, 'd{0:05d}'.format(i // FILES_PER_DIR))
+			os.makedirs(dirPath)
+		with open(os.path.join(dirPath, 'f{0}'.format(i % FILES_PER_DIR)), 'wb') as f:
+			f.write(content)
+
+	with open(marker, 'w'):
+		pass
+	return path
+
+# UNIX socket server discarding chunked request bodies (and responding with an empty chunked response)
+class Sink:
+	def __init__(self, path):
+		self.path = path
+		self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._server.bind(path)
+		self._server.listen(5)
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+
+	def close(self):
+		self._server.close()
+
+	def _run(self):
+		while True:
+			try:
+				conn, _ = self._server.accept()
+			except OSError:
+				break
+
+			with conn:
+				# The request ends with the final (empty) chunk (preceded by the last data chunk's CRLF).
+				# The data is discarded without parsing it (tar data won't contain that byte sequence)
+				tail = b''
+				while True:
+					data = conn.recv(1024*1024)
+					if len(data) == 0:
+						break
+					tail = (tail+data)[-7:]
+					if tail == b'\r\n0\r\n\r\n':
+						break
+				conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n')
+
+# Streams the context to the sink (the same way image.build() does) and returns the number of bytes sent
+def upload(sink, contextPath):
+	with Request('unix://'+sink.path).doPost('/build?rm=1&t=benchmark') as req:
+		req.enableChunkedMode()
+		tar = tarfile.open(mode='w', fileobj=req)
+		image._fillTar(tar, contextPath)
+		resp = req.send()
+		while resp.readChunk() != None:
+			pass
+		return req.tell()
+
+# Replays a cached context to the sink (the same way image.build() does with the context cache enabled)
+def uploadCached(sink, contextPath, cache):
+	with Request('unix://'+sink.path).doPost('/build?rm=1&t=benchmark') as req:
+		req.enableChunkedMode()
+		with cache.open(contextcache.getDigest(contextPath)) as f:
+			req.writeFile(f, os.fstat(f.fileno()).st_size)
+		resp = req.send()
+		while resp.readChunk() != None:
+			pass
+		return req.tell()
+
+# Stores the context in the cache (and returns the number of bytes sent)
+def fillCache(sink, contextPath, cache):
+	with Request('unix://'+sink.path).doPost('/build?rm=1&t=benchmark') as req:
+		req.enableChunkedMode()
+		with cache.write(contextcache.getDigest(contextPath), req) as writer:
+			tar = tarfile.open(mode='w', fileobj=writer)
+			image._fillTar(tar, contextPath)
+			writer.commit()
+		resp = req.send()
+		while resp.readChunk() != None:
+			pass
+		return req.tell()
+
+def run(contextDir=None, fileCounts=FILE_COUNTS, runs=3):
+	tmpDir = None
+	if contextDir == None:
+		tmpDir = contextDir = tempfile.mkdtemp(prefix='rocker-benchmark')
+	sink = Sink(os.path.join(tempfile.mkdtemp(prefix='rocker-sink'), 'sink.sock'))
+	cache = contextcache.ContextCache(os.path.join(os.path.dirname(sink.path), 'contexts'), 1024**4)
+
+	rc = {}
+	try:
+		for count in fileCounts:
+			path = createContext(contextDir, count)
+			rc['context scan ({0} files)'.format(count)] = withRate(bestOf(lambda: image.TagFile(path), runs), 'filesPerSec', count)
+
+			size = upload(sink, path)
+			result = withRate(bestOf(lambda: upload(sink, path), runs), 'filesPerSec', count)
+			rc['tar upload ({0} files)'.format(count)] = withRate(result, 'MBps', size/1e6)
+
+			fillCache(sink, path, cache)
+			result = withRate(bestOf(lambda: uploadCached(sink, path, cache), runs), 'filesPerSec', count)
+			rc['cached upload ({0} files)'.format(count)] = withRate(result, 'MBps', size/1e6)
+	finally:
+		sink.close()
+		shutil.rmtree(os.path.dirname(sink.path), ignore_errors=True)
+		if tmpDir != None:
+			shutil.rmtree(tmpDir, ignore_errors=True)
+
+	return rc
+
+def main(args):
+	contextDir = None
+	fileCounts = FILE_COUNTS
+	if len(args) > 0:
+		contextDir = args[0]
+	if len(args) > 1:
+		fileCounts = [int(a) for a in args[1:]]
+
+	for name, result in run(contextDir, fileCounts).items():
+		print("{0:<32} {1:>10.2f}ms {2:>12.0f} files/s".format(name, result['seconds']*1000, result['filesPerSec']))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+#
+# restclient benchmarks: response header parsing, chunked decoding and large JSON bodies
+#
+# The responses are sent over a socketpair (by a writer thread if they don't fit
+# into the socket buffer), so these numbers show restclient's parsing overhead
+# without any daemon in between.
+#
+# usage: python3 -m benchmarks.client
+#
+
+from benchmarks.timing import bestOf, withRate
+from rocker.restclient import Response
+
+import json
+import socket
+import sys
+import threading
+
+# typical response headers sent by the docker daemon
+HEADERS = b''.join([
+	b'HTTP/1.1 200 OK\r\n',
+	b'Api-Version: 1.41\r\n',
+	b'Content-Type: application/json\r\n',
+	b'Docker-Experimental: false\r\n',
+	b'Ostype: linux\r\n',
+	b'Server: Docker/20.10.7 (linux)\r\n',
+	b'Date: Mon, 01 Jan 2021 12:00:00 GMT\r\n'
+])
+
+CHUNK_SIZES = [64, 1024, 16*1024, 64*1024]
+CHUNKED_TOTAL = 4*1024*1024
+JSON_SIZES = [1024*1024, 16*1024*1024]
+
+# Sends data to the socket (using a separate thread, so it can be larger than the socket buffer)
+def _feed(sock, data):
+	thread = threading.Thread(target=sock.sendall, args=(data,))
+	thread.start()
+	return thread
+
+# Parses `count` small responses (which makes the header parsing dominate)
+def headerParsing(count=1000):
+	resp = HEADERS + b'Content-Length: 2\r\n\r\n{}'
+	a, b = socket.socketpair()
+
+	def parse():
+		for _ in range(count):
+			a.sendall(resp)
+			Response(b).readAll()
+
+	try:
+		return withRate(bestOf(parse), 'responsesPerSec', count)
+	finally:
+		a.close()
+		b.close()
+
+# Reads a chunked response of CHUNKED_TOTAL bytes (sent in chunks of chunkSize bytes)
+def chunkedDecoding(chunkSize, total=CHUNKED_TOTAL):
+	chunk = b'x'*chunkSize
+	frame = "{0:x}\r\n".format(chunkSize).encode('ascii') + chunk + b'\r\n'
+	data = HEADERS + b'Transfer-Encoding: chunked\r\n\r\n' + frame*(total//chunkSize) + b'0\r\n\r\n'
+
+	def read(arg):
+		a, b, writer = arg
+		resp = Response(b)
+		while resp.readChunk() != None:
+			pass
+		writer.join()
+		a.close()
+		b.close()
+
+	def setup():
+		a, b = socket.socketpair()
+		return a, b, _feed(a, data)
+
+	return withRate(bestOf(read, setup=setup), 'MBps', total/1e6)
+
+# Reads and decodes a JSON list of containers (~size bytes)
+def largeJson(size):
+	item = {"Id": "e"*64, "Names": ["/app"], "Image": "acme/app:latest", "ImageID": "sha256:"+"a"*64,
+		"Command": "app", "Created": 1451649600, "State": "running", "Status": "Up 2 hours",
+		"Labels": {"zone.coding.rocker.fileHash": "f"*64}, "Ports": [{"PrivatePort": 80, "PublicPort": 8080, "Type": "tcp"}]}
+	itemSize = len(json.dumps(item))+2
+	body = json.dumps([item]*(size//itemSize)).encode('utf8')
+	data = HEADERS + 'Content-Length: {0}\r\n\r\n'.format(len(body)).encode('ascii') + body
+
+	def read(arg):
+		a, b, writer = arg
+		Response(b).getObject()
+		writer.join()
+		a.close()
+		b.close()
+
+	def setup():
+		a, b = socket.socketpair()
+		return a, b, _feed(a, data)
+
+	return withRate(bestOf(read, setup=setup), 'MBps', len(body)/1e6)
+
+def run(chunkSizes=CHUNK_SIZES, jsonSizes=JSON_SIZES):
+	rc = {}
+	rc['header parsing'] = headerParsing()
+	for size in chunkSizes:
+		rc['chunked decoding ({0}B chunks)'.format(size)] = chunkedDecoding(size)
+	for size in jsonSizes:
+		rc['large JSON ({0}MB)'.format(size//(1024*1024))] = largeJson(size)
+	return rc
+
+def main(args):
+	for name, result in run().items():
+		print("{0:<36} {1:>10.2f}ms".format(name, result['seconds']*1000))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
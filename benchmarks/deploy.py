@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+#
+# End-to-end `rocker run` benchmark against the fake docker daemon (tests/fakedaemon.py)
+#
+# Deploys a project of N containers whose dependencies (links) form a binary tree
+# (container i links to containers 2i+1 and 2i+2), so `rocker run node0` deploys
+# all of them. Measures both the initial deployment and a no-op run (where
+# nothing has changed).
+#
+# The fleet scenarios deploy the same project to several fake daemons at once
+# (see rocker.fleet). Note that the fake daemons run in the benchmark's process
+# (i.e. share its CPU time), so for large host counts this measures rocker's
+# CPU overhead per host rather than the (latency bound) rollout time.
+#
+# The cold host scenarios deploy containers that each use a different image the
+# daemon doesn't have yet (pulls are slowed down using chunkDelay), with and without
+# pulling them up front (see rocker.prefetch).
+#
+# usage: python3 -m benchmarks.deploy [nodeCount...]
+#
+
+from benchmarks.timing import bestOf, withRate
+from rocker import container, fleet, prefetch
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+
+from io import StringIO
+from unittest.mock import patch
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+NODE_COUNTS = [10, 50, 200]
+HOST_COUNTS = [1, 4, 16]
+COLD_IMAGE_COUNT = 8
+
+# Writes N .rocker files (node0..node<N-1>) to path
+def createProject(path, count):
+	for i in range(count):
+		links = ['node{0}'.format(c) for c in [2*i+1, 2*i+2] if c < count]
+		with open(os.path.join(path, 'node{0}.rocker'.format(i)), 'w') as f:
+			json.dump({"image": "debian", "links": links, "env": {"NODE": str(i)}}, f)
+
+# Writes N .rocker files (cold0..cold<N-1>), each using its own image (cold0 links to all the others)
+def createColdProject(path, count):
+	for i in range(count):
+		links = ['cold{0}'.format(c) for c in range(1, count)] if i == 0 else []
+		with open(os.path.join(path, 'cold{0}.rocker'.format(i)), 'w') as f:
+			json.dump({"image": "image{0}".format(i), "links": links}, f)
+
+def _startDaemon(latency, chunkSize=None, chunkDelay=0, images=['debian']):
+	daemon = FakeDaemon(latency=latency, chunkSize=chunkSize, chunkDelay=chunkDelay)
+	daemon.start()
+	for name in images:
+		daemon.addImage(name)
+	return daemon
+
+def _deploy(daemon):
+	r = Rocker(daemon.getUrl())
+	try:
+		container.run('node0', r=r)
+	finally:
+		daemon.stop()
+
+def _deployCold(daemon, usePrefetch):
+	r = Rocker(daemon.getUrl())
+	try:
+		if usePrefetch:
+			prefetch.run(['cold0'], r=r)
+		container.run('cold0', r=r)
+	finally:
+		daemon.stop()
+
+def _deployFleet(daemons):
+	hosts = [('host{0}'.format(i), d.getUrl()) for i, d in enumerate(daemons)]
+	try:
+		fleet.run(hosts, lambda r: container.run('node0', r=r), parallel=len(hosts), r=Rocker(daemons[0].getUrl()))
+	finally:
+		for d in daemons:
+			d.stop()
+
+# The fleet scenarios use fleetLatency (to simulate remote daemons)
+def run(nodeCounts=NODE_COUNTS, latency=0, runs=3, hostCounts=HOST_COUNTS, fleetLatency=.002):
+	rc = {}
+	origCwd = os.getcwd()
+	tmpDir = tempfile.mkdtemp(prefix='rocker-benchmark')
+
+	try:
+		# keep the version cache (and the benchmark's output) to ourselves
+		with patch.dict('os.environ', {'XDG_CACHE_HOME': tmpDir}), patch('sys.stdout', new=StringIO()):
+			for count in nodeCounts:
+				projectDir = os.path.join(tmpDir, 'project-{0}'.format(count))
+				os.makedirs(projectDir)
+				createProject(projectDir, count)
+				os.chdir(projectDir)
+
+				rc['deploy ({0} containers)'.format(count)] = withRate(bestOf(_deploy, runs, setup=lambda: _startDaemon(latency)), 'containersPerSec', count)
+
+				# no-op run (everything's up to date)
+				daemon = _startDaemon(latency)
+				try:
+					r = Rocker(daemon.getUrl())
+					container.run('node0', r=r)
+					rc['no-op run ({0} containers)'.format(count)] = withRate(bestOf(lambda: container.run('node0', r=r), runs), 'containersPerSec', count)
+				finally:
+					daemon.stop()
+
+			if len(nodeCounts) > 0:
+				# fleet deploys (of the smallest project)
+				os.chdir(os.path.join(tmpDir, 'project-{0}'.format(nodeCounts[0])))
+				for hostCount in hostCounts:
+					setup = lambda: [_startDaemon(fleetLatency) for _ in range(hostCount)]
+					rc['fleet deploy ({0} hosts, {1} containers)'.format(hostCount, nodeCounts[0])] = withRate(bestOf(_deployFleet, runs, setup=setup), 'containersPerSec', hostCount*nodeCounts[0])
+
+			# cold host (each pull takes a couple of slow writes)
+			coldDir = os.path.join(tmpDir, 'project-cold')
+			os.makedirs(coldDir)
+			createColdProject(coldDir, COLD_IMAGE_COUNT)
+			os.chdir(coldDir)
+			setup = lambda: _startDaemon(0, chunkSize=256, chunkDelay=.005, images=[])
+			for name, usePrefetch in [('cold deploy', False), ('cold deploy with prefetch', True)]:
+				rc['{0} ({1} images)'.format(name, COLD_IMAGE_COUNT)] = withRate(bestOf(lambda d: _deployCold(d, usePrefetch), runs, setup=setup), 'containersPerSec', COLD_IMAGE_COUNT)
+	finally:
+		os.chdir(origCwd)
+		shutil.rmtree(tmpDir, ignore_errors=True)
+
+	return rc
+
+def main(args):
+	nodeCounts = NODE_COUNTS
+	if len(args) > 0:
+		nodeCounts = [int(a) for a in args]
+
+	for name, result in run(nodeCounts).items():
+		print("{0:<40} {1:>10.2f}ms {2:>10.1f} containers/s".format(name, result['seconds']*1000, result['containersPerSec']))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+#
+# Memory benchmark: bytes per Image/Container/Port/Volume object
+#
+# Compares rocker's (slotted) data classes with the ones of the baseline revision
+# (the last one before they got __slots__, loaded from git) and shows how much
+# retaining the raw inspect data costs.
+#
+# Containers are measured right after Container.fromApiJson() (nothing but the id,
+# name, image, creation date and state decoded yet) and once all of their lazily
+# decoded fields have been accessed (at which point the retained Config and HostConfig
+# parts of the inspect data are dropped).
+# The baseline's Container decoded everything right away (and fewer fields), which is
+# what fromApiJson(lazy=False) does now.
+#
+# usage: python3 -m benchmarks.memory [--baseline=REV] [count]
+#
+
+from rocker.container import Container
+from rocker.image import Image
+from rocker.rocker import Rocker
+
+import gc
+import getopt
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+import types
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (shortened) `GET /images/{name}/json` response
+IMAGE_JSON = json.dumps({
+	"Id": "sha256:" + "a"*64,
+	"RepoTags": ["acme/app:latest"],
+	"RepoDigests": ["acme/app@sha256:" + "b"*64],
+	"Parent": "",
+	"Comment": "",
+	"Created": "2016-01-01T12:00:00.000000000Z",
+	"Container": "c"*64,
+	"ContainerConfig": {
+		"Hostname": "c"*12, "User": "", "Env": ["PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"],
+		"Cmd": ["/bin/sh", "-c", "#(nop) CMD [\"app\"]"], "Labels": {}
+	},
+	"DockerVersion": "1.12.0",
+	"Author": "",
+	"Config": {
+		"Hostname": "c"*12, "User": "", "Env": ["PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"],
+		"Cmd": ["app"], "Labels": {}, "ExposedPorts": {"80/tcp": {}}
+	},
+	"Architecture": "amd64",
+	"Os": "linux",
+	"Size": 123456789,
+	"VirtualSize": 123456789,
+	"GraphDriver": {"Name": "overlay2", "Data": {"LowerDir": "/var/lib/docker/overlay2/" + "d"*64 + "/diff"}},
+	"RootFS": {"Type": "layers", "Layers": ["sha256:" + str(i)*64 for i in range(5)]}
+})
+
+# (shortened) `GET /containers/{name}/json` response
+CONTAINER_JSON = json.dumps({
+	"Id": "e"*64,
+	"Created": "2016-01-01T12:00:00.000000000Z",
+	"Name": "/app",
+	"Image": "sha256:" + "a"*64,
+	"State": {"Status": "running", "Running": True, "Paused": False, "Pid": 1234, "ExitCode": 0},
+	"Config": {
+		"Env": ["PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin", "APP_ENV=production"],
+		"Cmd": ["app"], "Labels": {"zone.coding.rocker.fileHash": "f"*64}
+	},
+	"HostConfig": {
+		"Binds": ["/docker/app/data:/data"], "NetworkMode": "bridge",
+		"PortBindings": {"80/tcp": [{"HostIp": "", "HostPort": "8080"}]},
+		"RestartPolicy": {"Name": "always", "MaximumRetryCount": 0},
+		"CapAdd": ["NET_ADMIN"], "ExtraHosts": ["db:10.0.0.2"], "Privileged": False
+	}
+})
+
+# Returns the module at the given git revision (e.g. the baseline's rocker/container.py),
+# or None if it can't be loaded (not a git checkout, unknown revision, ...)
+#
+# The module is loaded under a different name, so its imports (e.g. `from rocker import rocker`)
+# use the current versions of the other modules.
+def loadRevision(path, rev):
+	try:
+		src = subprocess.run(['git', 'show', '{0}:{1}'.format(rev, path)], cwd=PROJECT_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+		rc = types.ModuleType('baseline.{0}'.format(os.path.splitext(os.path.basename(path))[0]))
+		exec(compile(src, '{0}:{1}'.format(rev, path), 'exec'), rc.__dict__)
+		return rc
+	except Exception:
+		return None
+
+# Returns the last revision before Container got __slots__ (or None if it can't be found)
+def getBaselineRevision():
+	try:
+		commits = subprocess.run(['git', 'log', '--reverse', '--format=%H', '-S__slots__', '--', 'rocker/container.py'],
+			cwd=PROJECT_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.split()
+		if len(commits) > 0:
+			return commits[0]+'^'
+	except (OSError, subprocess.CalledProcessError):
+		pass
+	return None
+
+# Accesses all of a Container's lazily decoded fields (and returns it)
+def decodeAll(ctr):
+	for attr in Container._API_DECODERS:
+		getattr(ctr, attr)
+	return ctr
+
+# Returns the average number of bytes retained by each object created by factory()
+def measure(factory, count):
+	gc.collect()
+	tracemalloc.start()
+	start = tracemalloc.get_traced_memory()[0]
+
+	objects = [factory() for _ in range(count)]
+
+	gc.collect()
+	rc = (tracemalloc.get_traced_memory()[0] - start) / count
+	tracemalloc.stop()
+
+	del objects
+	return rc
+
+# Returns the bytes per object of each scenario
+#
+# baseline is the git revision to compare with (default: see getBaselineRevision()).
+# The baseline rows are omitted if it can't be loaded.
+def run(count=10000, baseline=None):
+	r = Rocker()
+	if baseline == None:
+		baseline = getBaselineRevision()
+
+	scenarios = []
+
+	oldContainer = oldImage = None
+	if baseline != None:
+		oldContainer = loadRevision('rocker/container.py', baseline)
+		oldImage = loadRevision('rocker/image.py', baseline)
+	if oldImage != None:
+		scenarios.append(('Image (baseline)', lambda: oldImage.Image(json.loads(IMAGE_JSON))))
+	scenarios += [
+		('Image (slots, raw data)', lambda: Image(json.loads(IMAGE_JSON), keepRawData=True)),
+		('Image (slots)', lambda: Image(json.loads(IMAGE_JSON))),
+	]
+
+	if oldContainer != None:
+		scenarios.append(('Container (baseline)', lambda: oldContainer.Container.fromApiJson(json.loads(CONTAINER_JSON), r)))
+	scenarios += [
+		('Container (slots)', lambda: Container.fromApiJson(json.loads(CONTAINER_JSON), r)),
+		('Container (slots, decoded)', lambda: decodeAll(Container.fromApiJson(json.loads(CONTAINER_JSON), r))),
+	]
+
+	if oldContainer != None:
+		scenarios.append(('Port (baseline)', lambda: oldContainer.Container.Port({'int': 80, 'ext': 8080})))
+	scenarios.append(('Port (slots)', lambda: Container.Port({'int': 80, 'ext': 8080})))
+
+	if oldContainer != None:
+		scenarios.append(('Volume (baseline)', lambda: oldContainer.Container.Volume('/data', '/docker/app/data')))
+	scenarios.append(('Volume (slots)', lambda: Container.Volume('/data', '/docker/app/data')))
+
+	rc = {}
+	for name, factory in scenarios:
+		rc[name] = measure(factory, count)
+	return rc
+
+def main(args):
+	try:
+		opts, args = getopt.gnu_getopt(args, '', ['baseline='])
+	except getopt.GetoptError as e:
+		sys.exit(str(e))
+
+	baseline = None
+	for opt, value in opts:
+		if opt == '--baseline':
+			baseline = value
+
+	count = 10000
+	if len(args) > 0:
+		count = int(args[0])
+
+	results = run(count, baseline)
+
+	print("{0:<28} {1:>14}".format("object", "bytes/object"))
+	for name, bytesPerObject in results.items():
+		print("{0:<28} {1:>14.1f}".format(name, bytesPerObject))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+#
+# Startup benchmark: measures rocker's import time using `python -X importtime`
+#
+# Fails (exit code 1) if importing rocker takes longer than the given budget
+# (in milliseconds) or if it pulls in any of the modules known to be slow (and
+# not needed at startup).
+#
+# usage: python3 -m benchmarks.startup [budgetMs] [runs]
+#
+
+import os
+import subprocess
+import sys
+
+# modules that must not be imported at startup
+FORBIDDEN = ['pkg_resources', 'distutils', 'setuptools', 'tarfile', 'hashlib', 'importlib.metadata', 'rocker.container', 'rocker.image']
+
+DEFAULT_BUDGET_MS = 100
+
+# Runs `python -X importtime -c 'import rocker'` and returns the cumulative import
+# time of the rocker package (in milliseconds) and the names of all imported modules
+def measure():
+	projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import rocker'], cwd=projectDir, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+	rc = None
+	modules = set()
+	for line in proc.stderr.splitlines():
+		if not line.startswith('import time:') or '|' not in line:
+			continue
+		_, cumulative, name = line[len('import time:'):].split('|')
+		name = name.strip()
+		modules.add(name)
+		if name == 'rocker':
+			rc = int(cumulative) / 1000.0
+
+	return rc, modules
+
+def run(runs=5):
+	times = []
+	modules = set()
+	for _ in range(runs):
+		t, modules = measure()
+		times.append(t)
+	return {'importMs': min(times), 'importMsMax': max(times), 'modules': len(modules), 'forbidden': sorted(set(FORBIDDEN) & modules)}
+
+def main(args):
+	budget = DEFAULT_BUDGET_MS
+	runs = 5
+	if len(args) > 0:
+		budget = float(args[0])
+	if len(args) > 1:
+		runs = int(args[1])
+
+	result = run(runs)
+	print("import rocker: {importMs:.1f}ms (best of {runs}, worst: {importMsMax:.1f}ms), {modules} modules".format(runs=runs, **result))
+
+	rc = 0
+	if result['importMs'] > budget:
+		print("FAIL: import time exceeds the budget of {0}ms".format(budget))
+		rc = 1
+	if len(result['forbidden']) > 0:
+		print("FAIL: slow modules imported at startup: {0}".format(', '.join(result['forbidden'])))
+		rc = 1
+
+	return rc
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+#
+# `rocker stats` overhead benchmark against the fake docker daemon (tests/fakedaemon.py)
+#
+# Follows the stats streams of N containers (the fake daemon sends 10 samples per
+# container per second, ten times as many as docker) for a few seconds and measures
+# the CPU time rocker's event loop used (i.e. the time.thread_time() of the main
+# thread - the fake daemon's threads aren't counted).
+#
+# usage: python3 -m benchmarks.stats [containerCount...]
+#
+
+from rocker.restclient import Request
+from rocker.rocker import Rocker
+from rocker.stats import StatsCollector, formatTable
+from tests.fakedaemon import FakeDaemon
+
+from unittest.mock import patch
+
+import shutil
+import sys
+import tempfile
+import time
+
+CONTAINER_COUNTS = [10, 100]
+
+def run(containerCounts=CONTAINER_COUNTS, duration=2):
+	rc = {}
+	tmpDir = tempfile.mkdtemp(prefix='rocker-benchmark')
+
+	try:
+		with patch.dict('os.environ', {'XDG_CACHE_HOME': tmpDir}):
+			for count in containerCounts:
+				with FakeDaemon(statsInterval=.1) as daemon:
+					daemon.addImage('debian')
+					names = ['ctr{0}'.format(i) for i in range(count)]
+					for name in names:
+						with Request(daemon.getUrl()) as req:
+							req.doPost('/containers/create?name={0}'.format(name)).send({'Image': 'debian'}).getObject()
+						with Request(daemon.getUrl()) as req:
+							req.doPost('/containers/{0}/start'.format(name)).send()
+
+					collector = StatsCollector(names, Rocker(daemon.getUrl()))
+					start = time.thread_time()
+					collector.run(formatTable, interval=.5, iterations=int(duration/.5))
+					cpu = time.thread_time()-start
+
+				rc['stats ({0} containers, {1}s)'.format(count, duration)] = {'seconds': cpu, 'cpuPercent': cpu*100.0/duration}
+	finally:
+		shutil.rmtree(tmpDir, ignore_errors=True)
+
+	return rc
+
+def main(args):
+	counts = CONTAINER_COUNTS
+	if len(args) > 0:
+		counts = [int(a) for a in args]
+
+	for name, result in run(counts).items():
+		print("{0:<30} {1:>10.2f}ms CPU {2:>6.1f}%".format(name, result['seconds']*1000, result['cpuPercent']))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
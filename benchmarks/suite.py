@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+#
+# Runs all the benchmarks and saves the results as JSON (for comparison across commits)
+#
+# usage: python3 -m benchmarks.suite [options]
+#
+# options:
+#   --quick             Only run the smaller scenarios
+#   --only=a,b          Only run the given benchmarks (client, buildcontext, deploy, stats, startup, memory)
+#   --save=FILE         Where to save the results (default: .benchmarks/<commit>.json)
+#   --compare=FILE      Compare the results with an earlier run
+#   --context-dir=DIR   Keep the synthetic build contexts in DIR (creating the large ones takes a while)
+#
+
+from benchmarks import buildcontext, client, deploy, memory, startup, stats
+
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARKS = ['client', 'buildcontext', 'deploy', 'stats', 'startup', 'memory']
+
+# Returns the current commit ID (with a '-dirty' suffix if there are uncommitted changes; or None if it's not a git checkout)
+def getCommit():
+	projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	try:
+		rc = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=projectDir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+		status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=projectDir, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+		if len(status.strip()) > 0:
+			rc += '-dirty'
+		return rc
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run(only=BENCHMARKS, quick=False, contextDir=None):
+	results = {}
+
+	if 'client' in only:
+		if quick:
+			results.update(client.run(chunkSizes=[1024, 64*1024], jsonSizes=[1024*1024]))
+		else:
+			results.update(client.run())
+	if 'buildcontext' in only:
+		results.update(buildcontext.run(contextDir, [1000] if quick else buildcontext.FILE_COUNTS))
+	if 'deploy' in only:
+		results.update(deploy.run([10] if quick else deploy.NODE_COUNTS, hostCounts=[1, 4] if quick else deploy.HOST_COUNTS))
+	if 'stats' in only:
+		results.update(stats.run([10] if quick else stats.CONTAINER_COUNTS, 1 if quick else 2))
+	if 'startup' in only:
+		result = startup.run(3 if quick else 5)
+		results['import rocker'] = {'seconds': result['importMs']/1000, 'max': result['importMsMax']/1000, 'modules': result['modules']}
+	if 'memory' in only:
+		for name, bytesPerObject in memory.run(1000 if quick else 10000).items():
+			results['memory: {0}'.format(name)] = {'bytesPerObject': bytesPerObject}
+
+	return {
+		'meta': {
+			'commit': getCommit(),
+			'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'quick': quick
+		},
+		'results': results
+	}
+
+# Prints the results (and the change relative to the `baseline` results, if given)
+#
+# For durations, a positive change means the benchmark got slower
+def printResults(results, baseline=None):
+	header = "{0:<40} {1:>12}".format('benchmark', 'result')
+	if baseline != None:
+		header += " {0:>12} {1:>8}".format('baseline', 'change')
+	print(header)
+
+	for name, result in results['results'].items():
+		key = 'seconds' if 'seconds' in result else 'bytesPerObject'
+		value = result[key]
+		line = "{0:<40} {1:>12}".format(name, _format(key, value))
+
+		if baseline != None and name in baseline['results'] and key in baseline['results'][name]:
+			old = baseline['results'][name][key]
+			change = ''
+			if old > 0:
+				change = "{0:+.1f}%".format((value-old)/old*100)
+			line += " {0:>12} {1:>8}".format(_format(key, old), change)
+		print(line)
+
+def _format(key, value):
+	if key == 'seconds':
+		return "{0:.2f}ms".format(value*1000)
+	return "{0:.1f}B".format(value)
+
+def main(args):
+	opts, args = getopt.gnu_getopt(args, '', ['quick', 'only=', 'save=', 'compare=', 'context-dir='])
+	only = BENCHMARKS
+	quick = False
+	savePath = None
+	comparePath = None
+	contextDir = None
+
+	for opt, value in opts:
+		if opt == '--quick':
+			quick = True
+		elif opt == '--only':
+			only = value.split(',')
+		elif opt == '--save':
+			savePath = value
+		elif opt == '--compare':
+			comparePath = value
+		elif opt == '--context-dir':
+			contextDir = value
+
+	baseline = None
+	if comparePath != None:
+		with open(comparePath) as f:
+			baseline = json.load(f)
+
+	results = run(only, quick, contextDir)
+
+	if savePath == None:
+		savePath = os.path.join('.benchmarks', '{0}.json'.format(results['meta']['commit'] or time.strftime('%Y%m%d-%H%M%S')))
+	if os.path.dirname(savePath) != '':
+		os.makedirs(os.path.dirname(savePath), exist_ok=True)
+	with open(savePath, 'w') as f:
+		json.dump(results, f, indent=2, sort_keys=True)
+
+	printResults(results, baseline)
+	print("\nResults saved to '{0}'".format(savePath))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,29 @@
+# Timing helpers shared by the benchmarks
+
+import statistics
+import time
+
+# Runs fn() `runs` times and returns the best/median/worst duration (in seconds)
+#
+# If setup is given, it's called before each run (without being timed) and its
+# return value is passed to fn()
+def bestOf(fn, runs=5, setup=None):
+	times = []
+	for _ in range(runs):
+		arg = None
+		if setup != None:
+			arg = setup()
+
+		start = time.perf_counter()
+		if setup != None:
+			fn(arg)
+		else:
+			fn()
+		times.append(time.perf_counter() - start)
+
+	return {'seconds': min(times), 'median': statistics.median(times), 'max': max(times), 'runs': runs}
+
+# Adds a throughput value (amount per second, based on the best run) to a bestOf() result
+def withRate(result, key, amount):
+	result[key] = amount / result['seconds'] if result['seconds'] > 0 else None
+	return result
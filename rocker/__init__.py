@@ -5,72 +5,106 @@
 # try 'rocker help' for usage information.
 #
 
-from rocker import commands, restclient
-from rocker.commands import help
-from rocker.rocker import Rocker
-
-import pkgutil
+# Keep the imports here to a minimum (they slow down rocker's startup).
+# Command modules (and whatever they need) will be imported on demand.
+from rocker import metrics, profiler, restclient, trace
+from rocker.commands import COMMANDS, isStreaming
+from rocker.rocker import Rocker, getCacheDir
+
+import importlib
+import os
 import sys
 
-_commands = None
-
+# Imports and returns the module implementing the given command
 def getCommand(name):
-	global _commands
-
-	listCommands() # prefetch commands
-
-	if not name in _commands:
+	if not name in COMMANDS:
 		raise Exception("Unknown command: {0}".format(name))
 
-	m = _commands[name].find_module(name).load_module(name)
+	m = importlib.import_module('rocker.commands.{0}'.format(name))
 
 	# make sure the module contains all the necessary functions+attributes
-	for identifier in ['run', 'shortDesc']:
+	for identifier in ['run']:
 		if not identifier in dir(m):
 			raise Exception("Module {0} needs a '{1}' function/attribute".format(name, identifier))
 
 	return m
 
 def listCommands():
-	global _commands
-	if _commands == None:
-		cmds = {}
-		for importer, name, isPkg in pkgutil.iter_modules(commands.__path__):
-			cmds[name] = importer
-
-		_commands = cmds
-
-	return _commands.keys()
+	return COMMANDS.keys()
 
 def main():
 	rocker = Rocker()
 
 	args = rocker.getopt()
 
-	if rocker.getVerbosity() < 3:
-		try:
-			return runCommand(args, rocker)
-		except restclient.HttpResponseError as e:
-			rocker.error("Docker error (code: {0}): {1}".format(e.getCode(), str(e.getData(), "utf8")))
-			return 1
-		except restclient.SocketError as e:
-			rocker.error(e.message)
-	else:
-		return _debugWrapper(runCommand, args, rocker)
-
+	# forward the command to `rocker serve` (if it's running)
+	#
+	# The server runs one command at a time, so commands that won't finish on their
+	# own (`logs -f`, `stats`) are always run locally
+	if len(args) > 0 and not args[0] in ['help', 'serve'] and not isStreaming(args):
+		socketPath = getServerSocket()
+		if socketPath != None and os.path.exists(socketPath):
+			from rocker import server
+			rc = server.forward(sys.argv[1:], socketPath)
+			if rc != None:
+				return rc
+
+	# optional on-disk index of parsed .rocker files
+	indexPath = os.getenv('ROCKER_INDEX')
+	if indexPath:
+		from rocker import container
+		container.enableConfigIndex(indexPath)
+
+	return execute(args, rocker)
+
+# Runs the given command (and handles errors)
+#
+# The command runs inside a profiler session (if --profile was given).
+# If tracing (--trace=FILE) or metrics (--stats, --stats-file=FILE) were enabled,
+# they're written once the command's done
+def execute(args, rocker):
+	try:
+		with profiler.session(args[0] if len(args) > 0 else None):
+			if rocker.getVerbosity() < 3:
+				try:
+					return runCommand(args, rocker)
+				except restclient.HttpResponseError as e:
+					rocker.error("Docker error (code: {0}): {1}".format(e.getCode(), str(e.getData(), "utf8")))
+					return 1
+				except restclient.SocketError as e:
+					rocker.error(e.message)
+			else:
+				return _debugWrapper(runCommand, args, rocker)
+	finally:
+		trace.finish()
+		metrics.finish()
+
+# Returns the path of the `rocker serve` socket
+#
+# It can be set using the ROCKER_SERVER environment variable (and defaults to
+# ~/.cache/rocker/serve.sock). Set it to an empty string to disable forwarding
+# commands to the server (in which case None will be returned).
+def getServerSocket():
+	rc = os.getenv('ROCKER_SERVER')
+	if rc == None:
+		rc = os.path.join(getCacheDir(), 'serve.sock')
+	elif rc == '':
+		rc = None
+	return rc
 
 def runCommand(args, rocker):
 	if len(args) < 1:
-		help.usage("Missing command!")
+		getCommand('help').usage("Missing command!")
 	cmd = args[0]
 
-	module = getCommand(cmd)
-	if module != None:
-		module.run(args, rocker)
+	rc = None
+	if cmd in COMMANDS:
+		rc = getCommand(cmd).run(args, rocker)
 	else:
-		help.usage("Unknown command: '{0}'".format(cmd))
+		getCommand('help').usage("Unknown command: '{0}'".format(cmd))
 
 	rocker.printQueuedMessages()
+	return rc
 
 def _debugWrapper(fn, *fnArgs):
 	try:
@@ -0,0 +1,373 @@
+from rocker.container import Container
+from rocker.restclient import HttpResponseError
+from rocker.rocker import getDefault, getErrorMessage, runParallel
+
+import glob
+import json
+import os
+import posixpath
+import queue
+import shutil
+import threading
+import time
+import urllib.parse
+import zlib
+
+# Volume backups (`rocker backup` and `rocker restore`)
+#
+# A container's backup consists of one gzipped tar file per volume (as returned by
+# docker's GET /containers/{name}/archive API) and a manifest.json file listing the
+# volumes. Backups are stored in <backupDir>/<container>/<timestamp>/ (and only renamed
+# to that path once they're complete).
+#
+# The data is streamed straight from the socket to the disk (and back):
+# - backup() reads the response into a small pool of reusable buffers, which are
+#   handed over to a compressor thread (see Compressor). zlib releases the GIL, so
+#   compression overlaps with the socket I/O.
+# - restore() decompresses the files in a separate thread (see Decompressor) and
+#   uploads the decompressed pieces using a chunked PUT request.
+#
+# Both directions use bounded queues, so memory usage stays constant (about
+# BUFFER_COUNT*BUFFER_SIZE bytes per container) regardless of the volumes' size.
+
+BUFFER_SIZE = 256*1024
+BUFFER_COUNT = 8
+COMPRESS_LEVEL = 6
+DEFAULT_DIR = 'backups'
+
+# Compresses data (in gzip format) in a separate thread and writes it to a file
+#
+# Usage:
+#
+# c = Compressor(path)
+# try:
+#     buff = c.getBuffer() # blocks while all the buffers are in use
+#     count = fillBuffer(buff)
+#     c.write(buff, count) # hands the buffer over to the compressor thread
+#     ...
+# finally:
+#     c.close() # waits for the compressor thread (and raises its exception, if any)
+class Compressor:
+	def __init__(self, path, level=COMPRESS_LEVEL, bufferSize=BUFFER_SIZE, bufferCount=BUFFER_COUNT):
+		self._file = open(path, 'wb')
+		self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits=31: gzip header and trailer
+		self._error = None
+		self._size = 0
+
+		# the buffer pool limits the number of queued buffers (and therefore the memory usage)
+		self._free = queue.Queue()
+		for _ in range(bufferCount):
+			self._free.put(bytearray(bufferSize))
+		self._queue = queue.Queue()
+
+		self._thread = threading.Thread(target=self._run, name='compress', daemon=True)
+		self._thread.start()
+
+	# Waits for the compressor thread to finish and closes the file
+	def close(self):
+		if self._thread == None:
+			return
+
+		self._queue.put(None)
+		self._thread.join()
+		self._thread = None
+		self._file.close()
+
+		if self._error != None:
+			raise self._error
+
+	# Returns an unused buffer (waits for one if necessary)
+	def getBuffer(self):
+		rc = self._free.get()
+		if self._error != None:
+			raise self._error
+		return rc
+
+	# Returns the number of (uncompressed) bytes written so far
+	def getSize(self):
+		return self._size
+
+	# Queues the first `count` bytes of buff (a buffer returned by getBuffer()) for compression
+	#
+	# buff mustn't be modified afterwards
+	def write(self, buff, count):
+		self._size += count
+		self._queue.put((buff, count))
+
+	def _run(self):
+		try:
+			while True:
+				item = self._queue.get()
+				if item == None:
+					break
+
+				buff, count = item
+				self._file.write(self._compressor.compress(memoryview(buff)[:count]))
+				self._free.put(buff)
+
+			self._file.write(self._compressor.flush())
+		except Exception as e:
+			self._error = e
+
+			# keep returning the buffers (so the producer doesn't block forever)
+			self._free.put(bytearray(0))
+			while item != None:
+				item = self._queue.get()
+				self._free.put(bytearray(0))
+
+# Reads and decompresses a gzip file in a separate thread
+#
+# Iterating over a Decompressor yields the decompressed data in pieces of at most
+# bufferSize bytes. At most queueSize pieces are decompressed ahead.
+# Call close() when you're done (even if you stopped iterating early).
+class Decompressor:
+	def __init__(self, path, bufferSize=BUFFER_SIZE, queueSize=BUFFER_COUNT):
+		self._path = path
+		self._bufferSize = bufferSize
+		self._queue = queue.Queue(queueSize)
+		self._stopped = threading.Event()
+		self._error = None
+
+		self._thread = threading.Thread(target=self._run, name='decompress', daemon=True)
+		self._thread.start()
+
+	def __iter__(self):
+		while True:
+			data = self._queue.get()
+			if data == None:
+				break
+			yield data
+
+		if self._error != None:
+			raise self._error
+
+	# Stops the decompressor thread (and waits for it)
+	def close(self):
+		self._stopped.set()
+		while self._thread.is_alive():
+			# unblock the thread (if it's waiting for queue space)
+			try:
+				self._queue.get(timeout=.1)
+			except queue.Empty:
+				pass
+		self._thread.join()
+
+	# Puts data into the queue (returns False if close() was called)
+	def _put(self, data):
+		while not self._stopped.is_set():
+			try:
+				self._queue.put(data, timeout=.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def _run(self):
+		try:
+			decompressor = zlib.decompressobj(31)
+			with open(self._path, 'rb') as f:
+				while True:
+					data = f.read(self._bufferSize)
+					if len(data) == 0:
+						break
+
+					# limit the output size (compressed data may expand a lot)
+					while len(data) > 0:
+						out = decompressor.decompress(data, self._bufferSize)
+						data = decompressor.unconsumed_tail
+						if len(out) > 0 and not self._put(out):
+							return
+
+			out = decompressor.flush()
+			if len(out) > 0:
+				self._put(out)
+			if not decompressor.eof:
+				raise ValueError("Incomplete backup file: '{0}'".format(self._path))
+		except Exception as e:
+			self._error = e
+		finally:
+			self._put(None)
+
+# Backs up the volumes of the given containers
+#
+# The containers' volumes are taken from their .rocker files. Up to `parallel`
+# containers will be backed up concurrently (each of them in its own output lane).
+#
+# Returns True if all the backups were successful
+def backup(names, backupDir=DEFAULT_DIR, parallel=1, r=None):
+	if r == None:
+		r = getDefault()
+
+	return _forEach(names, lambda name, lr: backupContainer(name, backupDir, lr), parallel, r)
+
+# Backs up a single container's volumes and returns the backup's path
+# (None if the container has no volumes, False if the backup failed)
+def backupContainer(name, backupDir=DEFAULT_DIR, r=None):
+	if r == None:
+		r = getDefault()
+
+	volumes = [v.tgt for v in Container.fromRockerFile(name, r).getVolumes()]
+	if len(volumes) == 0:
+		r.info("Skipping {0} - no volumes".format(name))
+		return None
+
+	basePath = path = os.path.join(backupDir, name, time.strftime('%Y%m%d-%H%M%S'))
+	i = 1
+	while os.path.exists(path) or os.path.exists(path+'.tmp'):
+		# more than one backup per second
+		path = "{0}-{1}".format(basePath, i)
+		i += 1
+
+	tmpPath = path+'.tmp'
+	os.makedirs(tmpPath)
+	manifest = {'container': name, 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'volumes': []}
+
+	try:
+		with r.phase('backup', name):
+			for volume in volumes:
+				fileName = _getFileName(volume)
+				r.info("Backing up {0}:{1}".format(name, volume))
+
+				size = _download(name, volume, os.path.join(tmpPath, fileName), r)
+				manifest['volumes'].append({'path': volume, 'file': fileName, 'size': size})
+
+		with open(os.path.join(tmpPath, 'manifest.json'), 'w') as f:
+			json.dump(manifest, f, indent=2)
+		os.rename(tmpPath, path)
+	except HttpResponseError as e:
+		shutil.rmtree(tmpPath, ignore_errors=True)
+		r.error("Backup of {0} failed: {1}".format(name, getErrorMessage(e)), exitCode=None)
+		return False
+	except BaseException:
+		shutil.rmtree(tmpPath, ignore_errors=True)
+		raise
+
+	r.info("Backup written to '{0}'".format(path))
+	return path
+
+# Returns the path of the given container's latest (complete) backup (or None)
+def findLatest(name, backupDir=DEFAULT_DIR):
+	rc = sorted(glob.glob(os.path.join(glob.escape(backupDir), glob.escape(name), '*', 'manifest.json')))
+	if len(rc) == 0:
+		return None
+	return os.path.dirname(rc[-1])
+
+# Restores the volumes of the given containers (from their latest backup)
+#
+# Returns True if all of them were restored successfully
+def restore(names, backupDir=DEFAULT_DIR, parallel=1, r=None):
+	if r == None:
+		r = getDefault()
+
+	return _forEach(names, lambda name, lr: restoreContainer(name, backupDir=backupDir, r=lr), parallel, r)
+
+# Restores a container's volumes from the given backup (defaults to the latest one)
+#
+# Returns True on success
+def restoreContainer(name, backupPath=None, backupDir=DEFAULT_DIR, r=None):
+	if r == None:
+		r = getDefault()
+
+	if backupPath == None:
+		backupPath = findLatest(name, backupDir)
+		if backupPath == None:
+			r.error("No backup found for '{0}' (in '{1}')".format(name, backupDir), exitCode=None)
+			return False
+
+	with open(os.path.join(backupPath, 'manifest.json')) as f:
+		manifest = json.load(f)
+
+	try:
+		with r.phase('restore', name):
+			for volume in manifest['volumes']:
+				r.info("Restoring {0}:{1} (from '{2}')".format(name, volume['path'], backupPath))
+				_upload(name, volume['path'], os.path.join(backupPath, os.path.basename(volume['file'])), r)
+	except HttpResponseError as e:
+		r.error("Restoring {0} failed: {1}".format(name, getErrorMessage(e)), exitCode=None)
+		return False
+
+	return True
+
+# Streams a volume's tar archive into a gzip file (returns the uncompressed size)
+def _download(name, volume, path, r):
+	with r.createRequest() as req:
+		resp = req.doGet('/containers/{0}/archive?path={1}'.format(urllib.parse.quote(name, safe=''), urllib.parse.quote(volume, safe=''))).send()
+
+		compressor = Compressor(path)
+		try:
+			while True:
+				buff = compressor.getBuffer()
+				count = _fill(resp, buff)
+				compressor.write(buff, count)
+				if count < len(buff):
+					break # EOF
+		finally:
+			compressor.close()
+
+	return compressor.getSize()
+
+# Reads response data into buff until it's full (or the response has ended)
+#
+# Returns the number of bytes read
+def _fill(resp, buff):
+	view = memoryview(buff)
+	rc = 0
+	while rc < len(buff):
+		count = resp.readInto(view[rc:])
+		if count == 0:
+			break
+		rc += count
+	return rc
+
+# Returns the backup file name for the given volume path (e.g. 'var_lib_mysql.tar.gz')
+def _getFileName(volume):
+	rc = posixpath.normpath(volume).strip('/').replace('/', '_')
+	return (rc or 'root')+'.tar.gz'
+
+# Runs fn(name, r) for each of the given names (up to `parallel` of them concurrently,
+# each in its own output lane) and returns True unless one of them failed (i.e. returned
+# False or raised an exception)
+def _forEach(names, fn, parallel, r):
+	results = {}
+
+	def call(name, r):
+		try:
+			results[name] = fn(name, r)
+		except (FileNotFoundError, ValueError) as e:
+			r.error("{0}: {1}".format(name, e), exitCode=None)
+			results[name] = False
+
+	if parallel <= 1 or len(names) <= 1:
+		for name in names:
+			call(name, r)
+		return all(results[name] != False for name in names)
+
+	def worker(name):
+		with r.lane(name) as lr:
+			try:
+				call(name, lr)
+			except Exception as e:
+				lr.error("{0}: {1}".format(name, e), exitCode=None)
+
+	runParallel(names, worker, parallel)
+
+	r.printQueuedMessages()
+	return all(results.get(name, False) != False for name in names)
+
+# Uploads a gzipped tar file to a container (extracting it into the volume's parent directory)
+def _upload(name, volume, path, r):
+	parent = posixpath.dirname(posixpath.normpath(volume))
+
+	with r.createRequest() as req:
+		req.doPut('/containers/{0}/archive?path={1}'.format(urllib.parse.quote(name, safe=''), urllib.parse.quote(parent, safe='')))
+		req.setHeader('Content-Type', 'application/x-tar')
+		req.enableChunkedMode()
+
+		decompressor = Decompressor(path)
+		try:
+			for data in decompressor:
+				req.write(data)
+		finally:
+			decompressor.close()
+
+		req.send()
@@ -0,0 +1,74 @@
+# Static command table (command name -> short description)
+#
+# The table allows rocker to find its commands (and print usage information)
+# without having to scan and import all the command modules.
+# Each command is implemented in a module of the same name (which needs
+# to provide a `run(args, rocker)` function).
+COMMANDS = {
+	'backup': """[--dir=DIR] [--parallel=N] [containerName...]
+Backs up the volumes of the given containers (defaults to all .rocker files in the current directory)
+to DIR/<container>/<timestamp>/ (DIR defaults to 'backups'). Use --parallel to back up N containers at once.""",
+
+	'build': """[--build-arg=KEY=VALUE]... [--label=KEY=VALUE]... [--cache-from=IMAGE,...] [--target=STAGE] [--pull] [--no-cache] <image path>
+Builds the docker image in the specified subdir. The options are applied on top of the ones in
+the image's rocker-build.json file (--no-cache always rebuilds the image).""",
+
+	'gc': """[-n|--dry-run] [--volumes] [--parallel=N]
+Removes what the project in the current directory doesn't need any more: superseded images built by rocker,
+stopped rocker containers without .rocker file and their anonymous volumes (--volumes: all unused anonymous volumes).
+Use --dry-run to list them (and the disk space they use) without removing anything.""",
+
+	'help': "\nPrints this information",
+
+	'logs': """[-f|--follow] [--tail=N] [containerName...]
+Shows the output of the given containers (defaults to all .rocker files in the current directory).
+Multiple containers are followed concurrently (with their names as line prefix).""",
+
+	'rerun': """<containerName>
+Same as run, but instead of failing if a container already exists, it will ask whether to recreate it.""",
+
+	'restore': """[--dir=DIR] [--from=PATH] [--parallel=N] containerName...
+Restores the volumes of the given containers from their latest backup (in DIR, see backup)
+or from the backup at PATH.""",
+
+	'run': """[--hosts=HOST,...|--hosts-file=FILE] [--parallel=N] [--pull-parallel=N] <container.rocker>...
+Creates and starts the specified containers. Will build underlying images first.
+Will skip any container/image that hasn't been changed.
+Missing images (and base images of the project's Dockerfiles) are pulled up front, up to N (default: 4) at once.
+With --hosts (or a hosts file, one per line), the containers are deployed to each of the given Docker daemons
+(URLs like unix:///path/docker.sock, optionally prefixed with 'name=') - up to N (default: 8) at once.""",
+
+	'serve': """
+Starts a long-running rocker server. Subsequent rocker commands will be forwarded
+to it (which allows it to keep parsed .rocker files and docker's inspect data cached).
+Set ROCKER_SERVER to change the server socket's path (or to '' to disable forwarding).""",
+
+	'stats': """[--no-stream] [--interval=SECONDS] [containerName...]
+Shows the CPU, memory and network usage of the given containers (defaults to all .rocker files
+in the current directory). Use --output=jsonl to get one JSON object per container and interval.""",
+
+	'version': """
+Prints version information for rocker and the Docker daemon
+(try -v or -vv to increase detail)"""
+}
+
+# Returns True if the given command line won't finish on its own (i.e. `logs -f` and
+# `stats` without --no-stream)
+#
+# Those commands aren't forwarded to `rocker serve` (which runs one command at a time).
+# The options are parsed here (and not in the command modules) to avoid importing them
+# on startup, so keep them in sync with logs.run() and stats.run().
+def isStreaming(args):
+	import getopt
+
+	try:
+		if args[0] == 'logs':
+			opts, _ = getopt.gnu_getopt(args[1:], 'f', ['follow', 'tail='])
+			return any(opt in ['-f', '--follow'] for opt, _ in opts)
+		elif args[0] == 'stats':
+			opts, _ = getopt.gnu_getopt(args[1:], '', ['no-stream', 'interval='])
+			return not any(opt == '--no-stream' for opt, _ in opts)
+	except getopt.GetoptError:
+		pass # the command will print its usage information
+
+	return False
@@ -0,0 +1,33 @@
+from rocker import backup
+from rocker.commands import help
+
+import getopt
+import glob
+
+def run(args, r):
+	try:
+		opts, names = getopt.gnu_getopt(args[1:], '', ['dir=', 'parallel='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	backupDir = backup.DEFAULT_DIR
+	parallel = 1
+	for opt, value in opts:
+		if opt == '--dir':
+			backupDir = value
+		elif opt == '--parallel':
+			if not value.isdigit() or int(value) < 1:
+				help.usage("--parallel expects a positive number")
+			parallel = int(value)
+
+	# strip the .rocker extension (if given)
+	names = [n[:-7] if n.endswith('.rocker') else n for n in names]
+
+	if len(names) == 0:
+		# default to all the containers of the project
+		names = sorted(n[:-7] for n in glob.glob('*.rocker'))
+		if len(names) == 0:
+			help.usage("'backup' expects at least one container name (or a directory containing .rocker files)")
+
+	if not backup.backup(names, backupDir, parallel, r):
+		return 1
@@ -1,10 +1,37 @@
 from rocker import image
 from rocker.commands import help
 
-shortDesc = """<image path>
-Builds the docker image in the specified subdir"""
+import getopt
 
 def run(args, r):
-	if len(args) != 2:
-		help.usage(None, "'build' expects exactly one argument (the image path)")
-	image.build(args[1], rocker=r)
+	try:
+		opts, extra = getopt.gnu_getopt(args[1:], '', ['build-arg=', 'cache-from=', 'label=', 'no-cache', 'pull', 'target='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	if len(extra) != 1:
+		help.usage("'build' expects exactly one argument (the image path)")
+
+	options = image.BuildOptions()
+	for opt, value in opts:
+		if opt in ['--build-arg', '--label']:
+			key, sep, value = value.partition('=')
+			if sep == '' or len(key) == 0:
+				help.usage("{0} expects KEY=VALUE".format(opt))
+			if opt == '--build-arg':
+				options.args[key] = value
+			else:
+				options.labels[key] = value
+		elif opt == '--cache-from':
+			options.cacheFrom += [i.strip() for i in value.split(',') if len(i.strip()) > 0]
+		elif opt == '--no-cache':
+			options.noCache = True
+		elif opt == '--pull':
+			options.pull = True
+		elif opt == '--target':
+			options.target = value
+
+	try:
+		image.build(extra[0], rocker=r, options=options)
+	except ValueError as e:
+		r.error(str(e))
@@ -0,0 +1,36 @@
+from rocker import gc
+from rocker.commands import help
+
+import getopt
+
+def run(args, r):
+	try:
+		opts, extra = getopt.gnu_getopt(args[1:], 'n', ['dry-run', 'parallel=', 'volumes'])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	if len(extra) > 0:
+		help.usage("'gc' doesn't expect any arguments")
+
+	dryRun = False
+	includeVolumes = False
+	parallel = gc.DEFAULT_PARALLEL
+	for opt, value in opts:
+		if opt in ['-n', '--dry-run']:
+			dryRun = True
+		elif opt == '--volumes':
+			includeVolumes = True
+		elif opt == '--parallel':
+			if not value.isdigit() or int(value) < 1:
+				help.usage("--parallel expects a positive number")
+			parallel = int(value)
+
+	r.checkApiVersion(gc.MIN_API_VERSION, failMsg="'gc' requires Docker API v{0} or newer".format(gc.MIN_API_VERSION))
+
+	garbage = gc.find(includeVolumes=includeVolumes, r=r)
+	if dryRun:
+		gc.report(garbage, r)
+	elif len(garbage) == 0:
+		r.info("Nothing to remove")
+	elif len(gc.remove(garbage, parallel, r)) > 0:
+		return 1
@@ -1,7 +1,6 @@
-import rocker
-import sys
+from rocker.commands import COMMANDS
 
-shortDesc = "\nPrints this information"
+import sys
 
 # print usage information
 # if errorMsg is None, the usage info will be written to stdout and the app will exit with code 0
@@ -17,17 +16,32 @@ def usage(errMsg=None):
 
 	out.write("USAGE: {0} <command> [arguments]\n\nCOMMANDS:\n".format(sys.argv[0]))
 
-	cmds = list(rocker.listCommands())
+	cmds = list(COMMANDS.keys())
 	cmds.sort()
 	for cmd in cmds:
-		mod = rocker.getCommand(cmd)
-		desc = mod.shortDesc.replace('\n', '\n\t\t')
+		desc = COMMANDS[cmd].replace('\n', '\n\t\t')
 		out.write("\t{0} {1}\n".format(cmd, desc))
 
 	out.write("""
 OPTIONS:
 	-v (can be specified multiple times)
 		Increase output verbosity
+	--output=text|jsonl
+		Output format. 'jsonl' prints one JSON object per event (with timestamp, phase,
+		object name, duration and the Docker daemon's messages) without any color codes.
+	--profile=cprofile|sample
+		Profile the command. 'cprofile' writes a .pstats file, 'sample' periodically samples
+		all threads' call stacks and writes them in the collapsed format used by flame graph tools.
+	--profile-out=FILE
+		Profile output file (default: rocker-<command>-<timestamp>.pstats/.folded)
+	--stats
+		Print per endpoint Docker API request stats (count, bytes, send() calls,
+		select() waits and latency percentiles) to stderr when the command is done
+	--stats-file=FILE
+		Write the same stats to FILE in Prometheus' text format (e.g. for node_exporter's textfile collector)
+	--trace=FILE
+		Record the time spent in each step (context scan, upload, daemon, pulls, inspects, ...)
+		and write it to FILE as Chrome trace events (open it in chrome://tracing or ui.perfetto.dev)
 """.format(sys.argv[0]))
 	if errMsg != None:
 		sys.exit(1)
@@ -0,0 +1,33 @@
+from rocker import logs
+from rocker.commands import help
+
+import getopt
+import glob
+
+def run(args, r):
+	try:
+		opts, names = getopt.gnu_getopt(args[1:], 'f', ['follow', 'tail='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	follow = False
+	tail = 'all'
+	for opt, value in opts:
+		if opt in ['-f', '--follow']:
+			follow = True
+		elif opt == '--tail':
+			if value != 'all' and not value.isdigit():
+				help.usage("--tail expects a number (or 'all')")
+			tail = value
+
+	# strip the .rocker extension (if given)
+	names = [n[:-7] if n.endswith('.rocker') else n for n in names]
+
+	if len(names) == 0:
+		# default to all the containers of the project
+		names = sorted(n[:-7] for n in glob.glob('*.rocker'))
+		if len(names) == 0:
+			help.usage("'logs' expects at least one container name (or a directory containing .rocker files)")
+
+	if not logs.show(names, follow, tail, r):
+		return 1
@@ -1,9 +1,6 @@
 from rocker import container
 from rocker.commands import help
 
-shortDesc = """<containerName>
-Same as run, but instead of failing if a container already exists, it will ask whether to recreate it."""
-
 def run(args, r):
 	if len(args) != 2:
 		help.usage("'run' expects exactly one argument (the container name)")
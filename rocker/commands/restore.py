@@ -0,0 +1,39 @@
+from rocker import backup
+from rocker.commands import help
+
+import getopt
+
+def run(args, r):
+	try:
+		opts, names = getopt.gnu_getopt(args[1:], '', ['dir=', 'from=', 'parallel='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	backupDir = backup.DEFAULT_DIR
+	backupPath = None
+	parallel = 1
+	for opt, value in opts:
+		if opt == '--dir':
+			backupDir = value
+		elif opt == '--from':
+			backupPath = value
+		elif opt == '--parallel':
+			if not value.isdigit() or int(value) < 1:
+				help.usage("--parallel expects a positive number")
+			parallel = int(value)
+
+	# strip the .rocker extension (if given)
+	names = [n[:-7] if n.endswith('.rocker') else n for n in names]
+
+	if len(names) == 0:
+		help.usage("'restore' expects at least one container name")
+
+	if backupPath != None:
+		if len(names) != 1:
+			help.usage("--from can only be used when restoring a single container")
+		rc = backup.restoreContainer(names[0], backupPath, r=r)
+	else:
+		rc = backup.restore(names, backupDir, parallel, r)
+
+	if not rc:
+		return 1
@@ -1,17 +1,53 @@
-from rocker import container
+from rocker import container, fleet, prefetch
 from rocker.commands import help
 
-shortDesc = """<container.rocker>
-Creates and starts the specified container. Will build underlying images first.
-Will skip any container/image that hasn't been changed."""
+import getopt
 
 def run(args, r):
-	if len(args) != 2:
-		help.usage("'run' expects exactly one argument (the container name)")
-	name = args[1]
+	try:
+		opts, names = getopt.gnu_getopt(args[1:], '', ['hosts=', 'hosts-file=', 'parallel=', 'pull-parallel='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	hosts = None
+	parallel = fleet.DEFAULT_PARALLEL
+	pullParallel = prefetch.DEFAULT_PARALLEL
+	try:
+		for opt, value in opts:
+			if opt == '--hosts':
+				hosts = fleet.parseHosts(value)
+			elif opt == '--hosts-file':
+				hosts = fleet.readHostsFile(value)
+			elif opt == '--parallel':
+				if not value.isdigit() or int(value) < 1:
+					help.usage("--parallel expects a positive number")
+				parallel = int(value)
+			elif opt == '--pull-parallel':
+				if not value.isdigit() or int(value) < 1:
+					help.usage("--pull-parallel expects a positive number")
+				pullParallel = int(value)
+	except (OSError, ValueError) as e:
+		help.usage(str(e))
+
+	if len(names) == 0:
+		help.usage("'run' expects at least one argument (the container name)")
 
 	#container.run expects a container name as parameter => strip the extension
-	if name.endswith('.rocker'):
-		name = name[:-7]
+	names = [n[:-7] if n.endswith('.rocker') else n for n in names]
+
+	def deploy(r):
+		# pull missing images concurrently first (instead of one by one while deploying)
+		prefetch.run(names, pullParallel, r)
+
+		rc = False
+		for name in names:
+			if container.run(name, r=r):
+				rc = True
+		return rc
 
-	container.run(name, r=r)
+	if hosts == None:
+		deploy(r)
+	else:
+		results = fleet.run(hosts, deploy, parallel, r)
+		if any(result.status not in ['changed', 'unchanged'] for result in results):
+			return 1
@@ -0,0 +1,17 @@
+from rocker import getServerSocket, server
+from rocker.commands import help
+
+def run(args, r):
+	if len(args) != 1:
+		help.usage("'serve' doesn't expect any arguments")
+
+	socketPath = getServerSocket()
+	if socketPath == None:
+		r.error("ROCKER_SERVER is empty, can't start the server")
+		return 1
+
+	r.info("Listening at '{0}' (press Ctrl+C to stop)".format(socketPath))
+	try:
+		server.Server(socketPath, r).serve()
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,39 @@
+from rocker import stats
+from rocker.commands import help
+
+import getopt
+import glob
+
+def run(args, r):
+	try:
+		opts, names = getopt.gnu_getopt(args[1:], '', ['no-stream', 'interval='])
+	except getopt.GetoptError as e:
+		help.usage(str(e))
+
+	stream = True
+	interval = 1
+	for opt, value in opts:
+		if opt == '--no-stream':
+			stream = False
+		elif opt == '--interval':
+			try:
+				interval = float(value)
+			except ValueError:
+				interval = 0
+			if interval <= 0:
+				help.usage("--interval expects a positive number of seconds")
+
+	# strip the .rocker extension (if given)
+	names = [n[:-7] if n.endswith('.rocker') else n for n in names]
+
+	if len(names) == 0:
+		# default to all the containers of the project
+		names = sorted(n[:-7] for n in glob.glob('*.rocker'))
+		if len(names) == 0:
+			help.usage("'stats' expects at least one container name (or a directory containing .rocker files)")
+
+	try:
+		if not stats.show(names, stream, interval, r):
+			return 1
+	except KeyboardInterrupt:
+		pass
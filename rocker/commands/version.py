@@ -1,6 +1,2 @@
-shortDesc = """
-Prints version information for rocker and the Docker daemon
-(try -v or -vv to increase detail)"""
-
 def run(args, r):
 	r.printVersion()
@@ -1,6 +1,8 @@
-from rocker import image, rocker
+from rocker import image, locks, rocker, trace
 from rocker.restclient import HttpResponseError
 
+import atexit
+import copy
 import hashlib
 import json
 import os
@@ -9,6 +11,8 @@ import sys
 # data class representing a Docker container
 class Container:
 	class Port:
+		__slots__ = ['proto', 'int', 'ext', 'extIp']
+
 		def __init__(self, data):
 			if type(data) == int: # format: 123 (simply a number)
 				self.proto = 'tcp'
@@ -34,11 +38,166 @@ class Container:
 			else:
 				Container._putValue(rc, 'int', self.int)
 				Container._putValue(rc, 'ext', self.ext)
-				Container._putValue(rc, 'proto', self.proto)
+				if self.proto != 'tcp': # tcp is the default
+					Container._putValue(rc, 'proto', self.proto)
 				Container._putValue(rc, 'extIp', self.extIp)
 			return rc
 
+	class Logging:
+		__slots__ = ['driver', 'maxSize', 'maxFile', 'mode', 'maxBufferSize', 'options']
+
+		# rocker option name -> docker log-opt name
+		OPTIONS = {
+			'maxSize': 'max-size',
+			'maxFile': 'max-file',
+			'mode': 'mode',
+			'maxBufferSize': 'max-buffer-size'
+		}
+
+		# Defaults for log options that haven't been set explicitly (but only if the
+		# container's logging has been configured at all - either in its .rocker file or
+		# in the project's rocker-defaults.json).
+		#
+		# They keep json-file logs from growing indefinitely and make sure a slow log
+		# consumer can't block the container's stdout.
+		DEFAULTS = {
+			'json-file': {'maxSize': '10m', 'maxFile': 3, 'mode': 'non-blocking', 'maxBufferSize': '4m'},
+			'local': {'maxSize': '10m', 'maxFile': 3, 'mode': 'non-blocking', 'maxBufferSize': '4m'},
+			'*': {'mode': 'non-blocking', 'maxBufferSize': '4m'}
+		}
+
+		def __init__(self, data):
+			if type(data) == str: # format: "driverName"
+				data = {'driver': data}
+			elif type(data) != dict: # format: {"driver": "json-file", "maxSize": "10m", ...}
+				raise ValueError("Unsupported 'logging' format: {0}".format(data))
+
+			data = dict(data)
+			self.driver = Container._getValue(data, 'driver', defaultValue='json-file')
+			self.maxSize = Container._getValue(data, 'maxSize')
+			self.maxFile = Container._getValue(data, 'maxFile')
+			self.mode = Container._getValue(data, 'mode')
+			self.maxBufferSize = Container._getValue(data, 'maxBufferSize')
+			self.options = Container._getValue(data, 'options', defaultValue={})
+
+			if len(data) > 0:
+				raise ValueError("Unsupported 'logging' keys: {0}".format(', '.join(data.keys())))
+
+			# validate
+			if type(self.driver) != str or len(self.driver) == 0:
+				raise ValueError("Invalid log driver: {0}".format(self.driver))
+			if self.maxSize != None:
+				if self.driver not in ['json-file', 'local']:
+					raise ValueError("'maxSize' isn't supported by the '{0}' log driver".format(self.driver))
+				Container._parseSize(self.maxSize)
+			if self.maxFile != None:
+				if self.driver not in ['json-file', 'local']:
+					raise ValueError("'maxFile' isn't supported by the '{0}' log driver".format(self.driver))
+				if type(self.maxFile) != int or self.maxFile < 1:
+					raise ValueError("'maxFile' has to be a positive number: {0}".format(self.maxFile))
+			if self.mode not in [None, 'blocking', 'non-blocking']:
+				raise ValueError("Log mode has to be either 'blocking' or 'non-blocking': {0}".format(self.mode))
+			if self.maxBufferSize != None:
+				if self.mode == 'blocking':
+					raise ValueError("'maxBufferSize' can only be used in 'non-blocking' mode")
+				Container._parseSize(self.maxBufferSize)
+			if type(self.options) != dict:
+				raise ValueError("Expected log 'options' to be a map: {0}".format(self.options))
+
+		# Creates a Logging object from docker's HostConfig.LogConfig format
+		@staticmethod
+		def fromApiFormat(data):
+			rc = {'driver': data['Type']}
+			options = {}
+
+			if 'Config' in data and data['Config'] != None:
+				for key, value in data['Config'].items():
+					if key == 'max-file' and value.isdigit():
+						rc['maxFile'] = int(value)
+					elif key in Container.Logging.OPTIONS.values():
+						for rockerKey, apiKey in Container.Logging.OPTIONS.items():
+							if key == apiKey:
+								rc[rockerKey] = value
+					else:
+						options[key] = value
+
+			if len(options) > 0:
+				rc['options'] = options
+
+			return Container.Logging(rc)
+
+		def toApiFormat(self):
+			config = {}
+
+			if self.driver != 'none':
+				defaults = Container.Logging.DEFAULTS['*']
+				if self.driver in Container.Logging.DEFAULTS:
+					defaults = Container.Logging.DEFAULTS[self.driver]
+
+				for key, apiKey in Container.Logging.OPTIONS.items():
+					value = getattr(self, key)
+					if value == None and key in defaults and not (key == 'maxBufferSize' and self.mode == 'blocking'):
+						value = defaults[key]
+					if value != None:
+						config[apiKey] = str(value) # docker expects string values
+
+				for key, value in self.options.items():
+					config[key] = str(value)
+
+			return {'Type': self.driver, 'Config': config}
+
+		def toRockerFormat(self):
+			rc = {'driver': self.driver}
+
+			for key in Container.Logging.OPTIONS.keys():
+				Container._putValue(rc, key, getattr(self, key))
+			Container._putValue(rc, 'options', self.options)
+
+			return rc
+
+	class Ulimit:
+		__slots__ = ['name', 'soft', 'hard']
+
+		# resource limits supported by Docker (see `man 2 setrlimit`)
+		NAMES = ['core', 'cpu', 'data', 'fsize', 'locks', 'memlock', 'msgqueue', 'nice', 'nofile', 'nproc', 'rss', 'rtprio', 'rttime', 'sigpending', 'stack']
+
+		def __init__(self, name, data):
+			if not name in Container.Ulimit.NAMES:
+				raise ValueError("Unsupported ulimit: '{0}' (expected one of: {1})".format(name, ', '.join(Container.Ulimit.NAMES)))
+			self.name = name
+
+			if type(data) == int: # format: 1234 (soft and hard limit)
+				self.soft = data
+				self.hard = data
+			elif type(data) == dict: # format: {"soft": 1024, "hard": 4096}
+				if not 'soft' in data:
+					raise ValueError("Missing soft limit ('soft') for ulimit '{0}': {1}".format(name, data))
+				if not 'hard' in data:
+					raise ValueError("Missing hard limit ('hard') for ulimit '{0}': {1}".format(name, data))
+				self.soft = data['soft']
+				self.hard = data['hard']
+			else:
+				raise ValueError("Unsupported ulimit format for '{0}': {1}".format(name, data))
+
+			# -1 means 'unlimited'
+			for limit in [self.soft, self.hard]:
+				if type(limit) != int or limit < -1:
+					raise ValueError("Invalid limit for ulimit '{0}': {1}".format(name, limit))
+			if self.hard != -1 and (self.soft == -1 or self.soft > self.hard):
+				raise ValueError("Soft limit exceeds hard limit for ulimit '{0}': {1}".format(name, data))
+
+		def toApiFormat(self):
+			return {'Name': self.name, 'Soft': self.soft, 'Hard': self.hard}
+
+		def toRockerFormat(self):
+			if self.soft == self.hard:
+				return self.soft
+			else:
+				return {'soft': self.soft, 'hard': self.hard}
+
 	class Volume:
+		__slots__ = ['src', 'tgt', 'ro']
+
 		def __init__(self, tgt, src=None, ro=False):
 			self.src = src
 			self.tgt = tgt
@@ -53,23 +212,37 @@ class Container:
 				rc['ro'] = self.ro
 			return rc
 
-	def __init__(self, r=rocker.Rocker()):
+	__slots__ = [
+		'_id', '_name', '_image', '_created', '_caps', '_env', '_hosts', '_labels', '_links', '_logging',
+		'_netMode', '_ports', '_privileged', '_raw', '_restart', '_shmSize', '_state', '_sysctls', '_tmpfs',
+		'_ulimits', '_volumes', '_volumesFrom', '_cmd', '_entrypoint', '_depends', '_rocker', '_apiConfig'
+	]
+
+	def __init__(self, r=None):
+		if r == None:
+			r = rocker.getDefault()
+
 		self._id = None
 		self._name = None
 		self._image = None
 
 		self._created = None
-		self._caps = []
+		self._caps = None
 		self._env = {}
-		self._hosts = {}
-		self._labels = {}
+		self._hosts = None
+		self._labels = None
 		self._links = {}
+		self._logging = None
 		self._netMode = None
 		self._ports = []
 		self._privileged = None
 		self._raw = None
 		self._restart = None
+		self._shmSize = None
 		self._state = None
+		self._sysctls = {}
+		self._tmpfs = {}
+		self._ulimits = []
 		self._volumes = []
 		self._volumesFrom = None
 
@@ -79,6 +252,7 @@ class Container:
 		self._depends = set()
 
 		self._rocker = r
+		self._apiConfig = None # (Config, HostConfig) inspect data (for containers created by fromApiJson(), until everything's been decoded)
 
 	def getId(self):
 		return self._id
@@ -107,6 +281,9 @@ class Container:
 	def getLinks(self):
 		return self._links
 
+	def getLogging(self):
+		return self._logging
+
 	def getNetworkMode(self):
 		return self._netMode
 
@@ -122,9 +299,21 @@ class Container:
 	def getRestartPolicy(self):
 		return self._restart
 
+	def getShmSize(self):
+		return self._shmSize
+
 	def getState(self):
 		return self._state
 
+	def getSysctls(self):
+		return self._sysctls
+
+	def getTmpfs(self):
+		return self._tmpfs
+
+	def getUlimits(self):
+		return self._ulimits
+
 	def getVolumes(self):
 		return self._volumes
 
@@ -136,67 +325,273 @@ class Container:
 		return self._depends
 
 	# Create a Container object from Docker's remote API format
+	#
+	# Only the fields needed by pretty much every caller (id, name, image, creation date and state)
+	# are set right away. All the others will be decoded from the inspect data the first time
+	# they're accessed (see __getattr__()). Only the 'Config' and 'HostConfig' parts of the
+	# inspect data are kept for that (and only until everything's been decoded).
+	#
+	# Set lazy to False to decode everything right away (e.g. when keeping lots of Container
+	# objects around), in which case no inspect data is retained at all.
 	@staticmethod
-	def fromApiJson(json, r=rocker.Rocker()):
-		json = dict(json) # copy data (as _getValue() will mutate its contents)
-		rc = Container(r)
+	def fromApiJson(json, r=None, lazy=True):
+		if r == None:
+			r = rocker.getDefault()
+
+		rc = Container.__new__(Container)
+		rc._apiConfig = (json.get('Config') or {}, json.get('HostConfig') or {})
+		rc._rocker = r
+
 		rc._id = json['Id']
-		rc._name = Container._getValue(json, 'Name')
+		rc._name = json.get('Name')
 		rc._image = json['Image']
 
 		rc._created = json['Created'] # TODO parse date
-		rc._state = Container._getValue(json, 'State') # TODO parse value map
-
-		if 'Config' in json:
-			config = json['Config']
-			if 'Env' in config and type(config['Env']) == list:
-				# environment variables
-				rc._env = {}
-				for e in config['Env']:
-					var, value = e.split('=', 1)
-					rc._env[var] = value
-
-		if 'HostConfig' in json:
-			hostConfig = json['HostConfig']
-			rc._netMode = Container._getValue(hostConfig, 'NetworkMode')
-
-			if 'CapAdd' in hostConfig and type(hostConfig['CapAdd']) == list:
-				for c in hostConfig['CapAdd']:
-					rc._caps.append(c)
-			if 'CapDrop' in hostConfig and type(hostConfig['CapDrop']) == list:
-				for c in hostConfig['CapDrop']:
-					rc._caps.append('-{0}'.format(c))
-			if 'ExtraHosts' in hostConfig and type(hostConfig['ExtraHosts']) == list:
-				hosts = {}
-				for h in hostConfig['ExtraHosts']:
-					h = h.split(':')
-					if len(h) != 2:
-						raise ValueError("ExtraHosts entry expected to have exactly one colon: {0}".format(hostConfig['ExtraHosts']))
-					hosts[h[0]] = h[1]
-				rc._hosts = hosts
-			if 'Privileged' in hostConfig:
-				rc._privileged = hostConfig['Privileged'] == True
-
-		# TODO parse links
-		# TODO parse ports
-		# TODO parse restart policy
-		# TODO parse volumes
-		# TODO parse volumesFrom
-
-		# TODO init dependencies
-
-		rc._cmd = Container._getValue(json, 'Cmd')
-		rc._entrypoint = Container._getValue(json, 'Entrypoint')
+		rc._state = json.get('State') # TODO parse value map
+
+		if not lazy:
+			for name in Container._API_DECODERS:
+				getattr(rc, name)
+
+		return rc
 
+	# Lazily decodes the fields of Container objects created by fromApiJson()
+	#
+	# As we use __slots__, __getattr__() will only be called for attributes that haven't been set yet.
+	# Once all of them have been decoded, the inspect data is dropped.
+	def __getattr__(self, name):
+		if name == '_apiConfig' or not name in Container._API_DECODERS:
+			raise AttributeError(name)
+
+		if self._apiConfig == None:
+			raise AttributeError(name)
+		config, hostConfig = self._apiConfig
+
+		rc = Container._API_DECODERS[name](self, config, hostConfig)
+		setattr(self, name, rc)
+
+		if all(self._isDecoded(n) for n in Container._API_DECODERS):
+			self._apiConfig = None
 		return rc
 
+	# Returns True if the given lazily decoded attribute has been set (without decoding it)
+	def _isDecoded(self, name):
+		try:
+			Container.__dict__[name].__get__(self, Container)
+			return True
+		except AttributeError:
+			return False
+
+	def _decodeCaps(self, config, hostConfig):
+		rc = []
+		if type(hostConfig.get('CapAdd')) == list:
+			for c in hostConfig['CapAdd']:
+				rc.append(c)
+		if type(hostConfig.get('CapDrop')) == list:
+			for c in hostConfig['CapDrop']:
+				rc.append('-{0}'.format(c))
+
+		if len(rc) == 0:
+			rc = None
+		return rc
+
+	def _decodeCmd(self, config, hostConfig):
+		return config.get('Cmd')
+
+	def _decodeDepends(self, config, hostConfig):
+		rc = set(self._links.values())
+		if self._volumesFrom != None:
+			for container in self._volumesFrom:
+				rc.add(container)
+		return rc
+
+	def _decodeEntrypoint(self, config, hostConfig):
+		return config.get('Entrypoint')
+
+	def _decodeEnv(self, config, hostConfig):
+		rc = {}
+		if type(config.get('Env')) == list:
+			# environment variables
+			for e in config['Env']:
+				var, value = e.split('=', 1)
+				rc[var] = value
+		return rc
+
+	def _decodeHosts(self, config, hostConfig):
+		rc = None
+		if type(hostConfig.get('ExtraHosts')) == list:
+			rc = {}
+			for h in hostConfig['ExtraHosts']:
+				h = h.split(':')
+				if len(h) != 2:
+					raise ValueError("ExtraHosts entry expected to have exactly one colon: {0}".format(hostConfig['ExtraHosts']))
+				rc[h[0]] = h[1]
+		return rc
+
+	def _decodeLabels(self, config, hostConfig):
+		rc = None
+		if type(config.get('Labels')) == dict:
+			rc = dict(config['Labels'])
+		return rc
+
+	# docker's format: ["/otherContainer:/thisContainer/alias", ...]
+	def _decodeLinks(self, config, hostConfig):
+		rc = {}
+		if type(hostConfig.get('Links')) == list:
+			for l in hostConfig['Links']:
+				containerName, alias = l.split(':', 1)
+				rc[alias.rsplit('/', 1)[-1]] = containerName.lstrip('/')
+		return rc
+
+	def _decodeLogging(self, config, hostConfig):
+		rc = None
+		if type(hostConfig.get('LogConfig')) == dict:
+			rc = Container.Logging.fromApiFormat(hostConfig['LogConfig'])
+		return rc
+
+	def _decodeNetMode(self, config, hostConfig):
+		return hostConfig.get('NetworkMode')
+
+	# docker's format: {"80/tcp": [{"HostIp": "", "HostPort": "8080"}], ...}
+	def _decodePorts(self, config, hostConfig):
+		rc = []
+		if type(hostConfig.get('PortBindings')) == dict:
+			for key, bindings in hostConfig['PortBindings'].items():
+				intPort, proto = key.split('/', 1)
+				for b in bindings or []:
+					if not b.get('HostPort'):
+						continue # randomly assigned host port (not supported by rocker)
+
+					extIp = b.get('HostIp')
+					if extIp == '':
+						extIp = None
+					rc.append(Container.Port({'int': int(intPort), 'ext': int(b['HostPort']), 'proto': proto, 'extIp': extIp}))
+		return rc
+
+	def _decodePrivileged(self, config, hostConfig):
+		rc = None
+		if 'Privileged' in hostConfig:
+			rc = hostConfig['Privileged'] == True
+		return rc
+
+	def _decodeRaw(self, config, hostConfig):
+		return None # there's no way to tell which values were set using 'raw'
+
+	# converts docker's RestartPolicy to the values used in .rocker files
+	def _decodeRestart(self, config, hostConfig):
+		rc = None
+		policy = hostConfig.get('RestartPolicy')
+
+		if type(policy) == dict:
+			name = policy.get('Name')
+			if name == 'always':
+				rc = True
+			elif name == 'on-failure':
+				rc = 'on-failure'
+				if policy.get('MaximumRetryCount', 0) > 0:
+					rc = policy['MaximumRetryCount']
+			elif name == 'unless-stopped':
+				rc = 'unless-stopped'
+			elif name in [None, '', 'no']:
+				rc = False
+			else:
+				raise ValueError("Unsupported restart policy: {0}".format(policy))
+		return rc
+
+	def _decodeShmSize(self, config, hostConfig):
+		return hostConfig.get('ShmSize')
+
+	def _decodeSysctls(self, config, hostConfig):
+		rc = {}
+		if type(hostConfig.get('Sysctls')) == dict:
+			rc = dict(hostConfig['Sysctls'])
+		return rc
+
+	def _decodeTmpfs(self, config, hostConfig):
+		rc = {}
+		if type(hostConfig.get('Tmpfs')) == dict:
+			rc = dict(hostConfig['Tmpfs'])
+		return rc
+
+	def _decodeUlimits(self, config, hostConfig):
+		rc = []
+		if type(hostConfig.get('Ulimits')) == list:
+			for u in hostConfig['Ulimits']:
+				rc.append(Container.Ulimit(u['Name'], {'soft': u['Soft'], 'hard': u['Hard']}))
+		return rc
+
+	# Bind mounts are stored in HostConfig.Binds (format: "/host/path:/container/path[:ro]"),
+	# internal volumes in Config.Volumes (format: {"/container/path": {}})
+	#
+	# Note that Config.Volumes also contains the volumes defined in the image's Dockerfile
+	def _decodeVolumes(self, config, hostConfig):
+		rc = []
+		bindTargets = set()
+
+		if type(hostConfig.get('Binds')) == list:
+			for b in hostConfig['Binds']:
+				parts = b.split(':')
+				if len(parts) < 2:
+					continue # named/anonymous volume, will be handled below
+
+				ro = len(parts) > 2 and 'ro' in parts[2].split(',')
+				rc.append(Container.Volume(parts[1], parts[0], ro))
+				bindTargets.add(parts[1])
+
+		if type(config.get('Volumes')) == dict:
+			for tgt in config['Volumes'].keys():
+				if not tgt in bindTargets:
+					rc.append(Container.Volume(tgt))
+
+		return rc
+
+	# docker's format: ["containerName[:ro|:rw]", ...]
+	def _decodeVolumesFrom(self, config, hostConfig):
+		rc = None
+		if type(hostConfig.get('VolumesFrom')) == list and len(hostConfig['VolumesFrom']) > 0:
+			rc = []
+			for v in hostConfig['VolumesFrom']:
+				if v.endswith(':ro') or v.endswith(':rw'):
+					v = v[:-3]
+				rc.append(v)
+		return rc
+
+	# attribute name -> decoder function (see __getattr__())
+	_API_DECODERS = {
+		'_caps': _decodeCaps,
+		'_cmd': _decodeCmd,
+		'_depends': _decodeDepends,
+		'_entrypoint': _decodeEntrypoint,
+		'_env': _decodeEnv,
+		'_hosts': _decodeHosts,
+		'_labels': _decodeLabels,
+		'_links': _decodeLinks,
+		'_logging': _decodeLogging,
+		'_netMode': _decodeNetMode,
+		'_ports': _decodePorts,
+		'_privileged': _decodePrivileged,
+		'_raw': _decodeRaw,
+		'_restart': _decodeRestart,
+		'_shmSize': _decodeShmSize,
+		'_sysctls': _decodeSysctls,
+		'_tmpfs': _decodeTmpfs,
+		'_ulimits': _decodeUlimits,
+		'_volumes': _decodeVolumes,
+		'_volumesFrom': _decodeVolumesFrom
+	}
+
 	@staticmethod
-	def fromRockerFile(name, r=rocker.Rocker()):
-		config = Container._readConfig(name, r)
-		return Container.fromRockerConfig(name, config, r)
+	def fromRockerFile(name, r=None):
+		if r == None:
+			r = rocker.getDefault()
+
+		return _loader.load(name, r)
 
 	@staticmethod
-	def fromRockerConfig(name, config, r=rocker.Rocker()):
+	def fromRockerConfig(name, config, r=None):
+		if r == None:
+			r = rocker.getDefault()
+
 		rc = Container(r)
 
 		rc._name = name
@@ -207,11 +602,16 @@ class Container:
 		rc._hosts = Container._getValue(config, 'hosts')
 		rc._labels = Container._getValue(config, 'labels', defaultValue={})
 		rc._links = rc._parseLinks(config)
+		rc._logging = Container._parseLogging(config)
 		rc._netMode = Container._getValue(config, 'netMode')
 		rc._ports = Container._parsePorts(config)
 		rc._privileged = Container._getValue(config, 'privileged', defaultValue=False)
 		rc._raw = Container._getValue(config, 'raw')
 		rc._restart = Container._getValue(config, 'restart', defaultValue=True)
+		rc._shmSize = Container._parseShmSize(config)
+		rc._sysctls = Container._parseSysctls(config)
+		rc._tmpfs = Container._parseTmpfs(config)
+		rc._ulimits = Container._parseUlimits(config)
 		rc._volumes = Container._parseVolumes(config, name)
 		rc._volumesFrom = rc._parseVolumesFrom(config)
 
@@ -224,6 +624,14 @@ class Container:
 
 		return rc
 
+	# Returns a deep copy of this Container object
+	#
+	# The copy will use the given Rocker instance (or share this one's if r is None)
+	def copy(self, r=None):
+		if r == None:
+			r = self._rocker
+		return copy.deepcopy(self, {id(self._rocker): r})
+
 	def isRunning(self):
 		rc = False
 
@@ -334,6 +742,8 @@ class Container:
 			restartPolicy["Name"] = "always"
 		elif self._restart == "on-failure":
 			restartPolicy["Name"] = "on-failure"
+		elif self._restart == "unless-stopped":
+			restartPolicy["Name"] = "unless-stopped"
 		elif type(self._restart) == int:
 			restartPolicy = {"Name": "on-failure", "MaximumRetryCount": self._restart}
 		elif self._restart == False:
@@ -347,6 +757,22 @@ class Container:
 
 		Container._putValue(hostConfig, "NetworkMode", self._netMode)
 
+		# logging
+		if self._logging != None:
+			hostConfig['LogConfig'] = self._logging.toApiFormat()
+
+		# resource tuning
+		if self._shmSize != None:
+			hostConfig['ShmSize'] = Container._parseSize(self._shmSize)
+		if self._sysctls != None and len(self._sysctls) > 0:
+			sysctls = {}
+			for key, value in self._sysctls.items():
+				sysctls[key] = str(value) # docker expects string values
+			hostConfig['Sysctls'] = sysctls
+		Container._putValue(hostConfig, "Tmpfs", self._tmpfs)
+		if self._ulimits != None and len(self._ulimits) > 0:
+			hostConfig['Ulimits'] = [u.toApiFormat() for u in self._ulimits]
+
 		rc['HostConfig'] = hostConfig
 
 		return rc
@@ -366,11 +792,16 @@ class Container:
 
 		Container._putValue(data, 'raw', self._raw)
 
+		Container._putValue(data, 'caps', self._caps)
 		Container._putValue(data, 'env', self._env)
 		Container._putValue(data, 'cmd', self._cmd)
 		Container._putValue(data, 'entrypoint', self._entrypoint)
 		Container._putValue(data, 'netMode', self._netMode)
 		Container._putValue(data, 'hosts', self._hosts)
+		if self._logging != None:
+			data['logging'] = self._logging.toRockerFormat()
+		if self._privileged == True:
+			data['privileged'] = True
 
 		if self._restart not in [True, 'always']: 
 			Container._putValue(data, 'restart', self._restart)
@@ -398,6 +829,16 @@ class Container:
 		Container._putValue(data, 'volumes', volumes)
 		Container._putValue(data, 'volumesFrom', self._volumesFrom)
 
+		# resource tuning
+		Container._putValue(data, 'shmSize', self._shmSize)
+		Container._putValue(data, 'sysctls', self._sysctls)
+		Container._putValue(data, 'tmpfs', self._tmpfs)
+
+		ulimits = {}
+		for u in self._ulimits:
+			ulimits[u.name] = u.toRockerFormat()
+		Container._putValue(data, 'ulimits', ulimits)
+
 		if outFile == None:
 			return data
 		elif type(outFile) == str:
@@ -449,6 +890,17 @@ class Container:
 
 		return rc
 
+	# Parse the log configuration of a .rocker file
+	# expected format is one of:
+	# - "driverName"
+	# - {"driver": "json-file", "maxSize": "10m", "maxFile": 3, "mode": "non-blocking", "maxBufferSize": "4m", "options": {...}}
+	@staticmethod
+	def _parseLogging(config):
+		rc = Container._getValue(config, 'logging')
+		if rc != None:
+			rc = Container.Logging(rc)
+		return rc
+
 	# Parse ports specified in a .rocker file
 	# expected format is one of:
 	# - [ 123, 456, 789, ... ]
@@ -469,6 +921,106 @@ class Container:
 
 		return rc
 
+	# Parses the 'shmSize' value of a .rocker file (size of /dev/shm)
+	#
+	# The value is kept as is (so that it can be written back to the .rocker file),
+	# but it's validated here (and converted to bytes by toApiJson())
+	@staticmethod
+	def _parseShmSize(config):
+		rc = Container._getValue(config, 'shmSize')
+		if rc != None:
+			Container._parseSize(rc)
+		return rc
+
+	# Converts size values to bytes
+	#
+	# expected format is either a number of bytes or a string with an optional
+	# unit suffix (b, k, m or g; case insensitive), e.g. "64m"
+	@staticmethod
+	def _parseSize(value):
+		units = {'b': 1, 'k': 1024, 'm': 1024**2, 'g': 1024**3}
+
+		if type(value) == int and value >= 0:
+			return value
+		elif type(value) == str:
+			v = value.strip().lower()
+			factor = 1
+			if len(v) > 0 and v[-1] in units:
+				factor = units[v[-1]]
+				v = v[:-1]
+			if v.isdigit():
+				return int(v) * factor
+
+		raise ValueError("Invalid size value: '{0}' (expected something like 1024, '512k', '64m' or '1g')".format(value))
+
+	# Parses the 'sysctls' of a .rocker file
+	# expected format: { "net.core.somaxconn": "1024", ... }
+	@staticmethod
+	def _parseSysctls(config):
+		rc = Container._getValue(config, 'sysctls', defaultValue={})
+
+		if type(rc) != dict:
+			raise ValueError("Expected 'sysctls' to be a map, got: '{0}'".format(type(rc)))
+
+		for key, value in rc.items():
+			if not '.' in key:
+				raise ValueError("Invalid sysctl name: '{0}'".format(key))
+			if type(value) not in [str, int]:
+				raise ValueError("Invalid value for sysctl '{0}': {1}".format(key, value))
+
+		return rc
+
+	# Parses tmpfs mounts in a .rocker file
+	# expected format is one of:
+	# - [ "/run", "/tmp:size=64m,mode=1777", ... ] (docker's --tmpfs format)
+	# - { "/run": "", "/tmp": "size=64m,mode=1777" } <- that's how we store them internally
+	@staticmethod
+	def _parseTmpfs(config):
+		rc = {}
+		tmpfs = Container._getValue(config, 'tmpfs')
+
+		if tmpfs == None:
+			pass # simply return an empty dict
+		elif type(tmpfs) == list:
+			for t in tmpfs:
+				if type(t) != str:
+					raise ValueError("tmpfs entries have to be strings (like '/tmp:size=64m'): {0}".format(t))
+				t = t.split(':', maxsplit=1)
+				if len(t) == 1:
+					t.append('')
+				rc[t[0]] = t[1]
+		elif type(tmpfs) == dict:
+			rc = tmpfs
+		else:
+			raise ValueError("Unsupported 'tmpfs' type: '{0}'".format(type(tmpfs)))
+
+		for tgt, options in rc.items():
+			if not tgt.startswith('/'):
+				raise ValueError("tmpfs mount point has to be an absolute path: '{0}'".format(tgt))
+			if type(options) != str:
+				raise ValueError("tmpfs options for '{0}' have to be a string: {1}".format(tgt, options))
+
+			for o in options.split(','):
+				if o.startswith('size='):
+					Container._parseSize(o[5:])
+
+		return rc
+
+	# Parses ulimits in a .rocker file
+	# expected format: { "nofile": 65536, "memlock": {"soft": -1, "hard": -1}, ... }
+	@staticmethod
+	def _parseUlimits(config):
+		rc = []
+		ulimits = Container._getValue(config, 'ulimits', defaultValue={})
+
+		if type(ulimits) != dict:
+			raise ValueError("Expected 'ulimits' to be a map, got: '{0}'".format(type(ulimits)))
+
+		for name, limit in ulimits.items():
+			rc.append(Container.Ulimit(name, limit))
+
+		return rc
+
 	# returns a list of Volume objects (with .src, .tgt and .ro properties)
 	@staticmethod
 	def _parseVolumes(config, containerName):
@@ -524,67 +1076,222 @@ class Container:
 			data[key] = value
 
 	@staticmethod
-	def _readConfig(name, r=rocker.Rocker()):
-		path = None
+	def _readConfig(name, r=None):
+		if r == None:
+			r = rocker.getDefault()
 
-		if os.path.exists("{0}.rocker".format(name)):
-			path = "{0}.rocker".format(name)
-		else:
+		path = Container._findConfig(name)
+		rc = Container._parseConfigFile(path, r)
+
+		if r.checkApiVersion(rocker.MIN_LABELS_VERSION):
+			Container._addFileHash(rc, Container._hashConfig(rc), path)
+
+		return rc
+
+	# adds the config's hash to the container's labels
+	#
+	# This label also serves as a check whether or not a container has been created by rocker
+	# (Docker supports container labels since v1.6 (API v1.17) so rocker will issue a warning if labels are used but not supported)
+	#
+	# If the path of the .rocker file is given, the project directory will be added as well (see rocker.gc)
+	@staticmethod
+	def _addFileHash(config, chksum, path=None):
+		if not 'labels' in config:
+			config['labels'] = {}
+		config['labels']['zone.coding.rocker.fileHash'] = chksum
+		if path != None:
+			config['labels'][rocker.PROJECT_LABEL] = rocker.getProjectDir(path)
+
+	# Returns the path of the given container's .rocker file (or raises a FileNotFoundError)
+	@staticmethod
+	def _findConfig(name):
+		path = "{0}.rocker".format(name)
+		if not os.path.exists(path):
 			raise FileNotFoundError("Container configuration not found: '{0}'".format(name))
+		return path
+
+	# returns the sha256 hash of a parsed .rocker file
+	#
+	# note that we're parsing+dumping the JSON file to assure getting the same hash regardless of whitespaces
+	@staticmethod
+	def _hashConfig(config):
+		return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf8')).hexdigest()
 
+	# Parses a .rocker file (and applies the project's defaults)
+	@staticmethod
+	def _parseConfigFile(path, r):
 		with open(path) as f:
 			rc = json.loads(f.read())
 
-			if r.checkApiVersion(rocker.MIN_LABELS_VERSION):
-				# add the file's sha256 hash to the container's labels
-				# note that we're parsing+dumping the JSON file to assure getting the same hash regardless of whitespaces
-				# This label also serves as a check whether or not a container has been created by rocker
-				# (Docker supports container labels since v1.6 (API v1.17) so rocker will issue a warning if labels are used but not supported)
-				chksum = hashlib.sha256(json.dumps(rc, sort_keys=True).encode('utf8')).hexdigest()
-				if not 'labels' in rc:
-					rc['labels'] = {}
-				rc['labels']['zone.coding.rocker.fileHash'] = chksum
+		# apply project-wide defaults (rocker-defaults.json next to the .rocker file)
+		defaults = Container._readProjectDefaults(os.path.dirname(path), r)
+		if 'logging' in defaults and not 'logging' in rc:
+			rc['logging'] = defaults['logging']
 
-			return rc
+		return rc
+
+	# Reads the project's rocker-defaults.json file (if it exists)
+	#
+	# It contains default values for all the project's containers.
+	# Right now only 'logging' is supported, e.g.:
+	#
+	# { "logging": {"driver": "json-file", "maxSize": "50m"} }
+	@staticmethod
+	def _readProjectDefaults(projectDir, r):
+		rc = {}
+		path = os.path.join(projectDir, 'rocker-defaults.json')
+
+		if os.path.exists(path):
+			with open(path) as f:
+				rc = json.loads(f.read())
+
+			for key in rc.keys():
+				if key not in ['logging']:
+					r.warning("unsupported rocker-defaults.json key: '{0}'".format(key))
+
+		return rc
+
+# Loads .rocker files (each one only once per process)
+#
+# Parsed files are compiled into Container templates which are cached (keyed by
+# the file's path and stat() info - so changes to the file will be picked up).
+# The templates themselves are never handed out, load() returns copies instead.
+#
+# Optionally the parsed files can also be stored in a project index file (see
+# enableIndex()) which will be used by subsequent rocker processes to skip
+# parsing and hashing unchanged .rocker files.
+class ConfigLoader:
+	INDEX_VERSION = 1
+
+	def __init__(self):
+		self._templates = {}
+		self._index = None
+		self._indexPath = None
+		self._indexDirty = False
+
+	# Enables the on-disk project index (stored at indexPath)
+	#
+	# The index will be written back when the process exits (if it has changed)
+	def enableIndex(self, indexPath):
+		self._indexPath = indexPath
+		self._index = {}
+
+		if os.path.exists(indexPath):
+			try:
+				with open(indexPath) as f:
+					data = json.loads(f.read())
+				if data.get('version') == ConfigLoader.INDEX_VERSION:
+					self._index = data['files']
+			except ValueError:
+				pass # broken index file -> start from scratch
+
+		atexit.register(self.saveIndex)
+
+	# Removes all cached templates (and the in-memory copy of the index)
+	def clear(self):
+		self._templates = {}
+		if self._index != None:
+			self._index = {}
+			self._indexDirty = True
+
+	# Returns a Container object for the given container name (based on its .rocker file)
+	def load(self, name, r=None):
+		if r == None:
+			r = rocker.getDefault()
+
+		path = Container._findConfig(name)
+		withLabels = r.checkApiVersion(rocker.MIN_LABELS_VERSION)
+		key = (os.path.abspath(path), name, withLabels)
+		fileStat = ConfigLoader._stat(path)
+
+		template = None
+		if key in self._templates:
+			cachedStat, template = self._templates[key]
+			if cachedStat != fileStat:
+				template = None # file has changed
+
+		if template == None:
+			config, chksum = self._parse(path, fileStat, r)
+			if withLabels:
+				Container._addFileHash(config, chksum, path)
+			template = Container.fromRockerConfig(name, config, r)
+			self._templates[key] = (fileStat, template)
+
+		return template.copy(r)
+
+	# Writes the project index to disk (if enabled and modified)
+	def saveIndex(self):
+		if self._indexPath == None or not self._indexDirty:
+			return
+
+		tmpPath = "{0}.tmp{1}".format(self._indexPath, os.getpid())
+		with open(tmpPath, 'w') as f:
+			json.dump({'version': ConfigLoader.INDEX_VERSION, 'files': self._index}, f)
+		os.replace(tmpPath, self._indexPath)
+		self._indexDirty = False
+
+	# Returns the parsed .rocker file and its hash (either from the index or by actually parsing it)
+	def _parse(self, path, fileStat, r):
+		indexKey = os.path.abspath(path)
+
+		if self._index != None and indexKey in self._index:
+			entry = self._index[indexKey]
+			if entry['stat'] == fileStat:
+				# the caller will modify the config (keep the index entry intact, it might be saved later on)
+				return copy.deepcopy(entry['config']), entry['hash']
+
+		config = Container._parseConfigFile(path, r)
+		chksum = Container._hashConfig(config)
+
+		if self._index != None:
+			self._index[indexKey] = {'stat': fileStat, 'config': copy.deepcopy(config), 'hash': chksum}
+			self._indexDirty = True
+
+		return config, chksum
+
+	# stat() info of a .rocker file (and the rocker-defaults.json file next to it)
+	@staticmethod
+	def _stat(path):
+		rc = []
+		for p in [path, os.path.join(os.path.dirname(path), 'rocker-defaults.json')]:
+			try:
+				st = os.stat(p)
+				rc.append([st.st_ino, st.st_size, st.st_mtime_ns])
+			except FileNotFoundError:
+				rc.append(None)
+		return rc
+
+_loader = ConfigLoader()
+
+# Enables the on-disk project index of parsed .rocker files (see ConfigLoader)
+def enableConfigIndex(indexPath='.rockerIndex'):
+	_loader.enableIndex(indexPath)
 
 # Returns detailed information about the given image (or None if not found)
-def inspect(containerName, r=rocker.Rocker()):
+@trace.traced('container.inspect')
+def inspect(containerName, r=None):
+	if r == None:
+		r = rocker.getDefault()
+
 	rc = None
 
-	with r.createRequest() as req:
-		try:
-			rc = Container.fromApiJson(req.doGet('/containers/{0}/json'.format(containerName)).send().getObject(), r=r)
-		except HttpResponseError as e:
-			if e.getCode() == 404:
-				pass # return None
-			else:
-				raise e
+	data = r.getInspectData('containers', containerName)
+	if data != None:
+		rc = Container.fromApiJson(data, r=r)
 
 	return rc
 
 # checks whether a container uses the current version of the underlying image
-def isCurrent(containerName, imageName, pullImage=True, r=rocker.Rocker()):
-	ctrInfo = inspect(containerName)
-	imgInfo = image.inspect(imageName)
-
-	if imgInfo == None and pullImage == True:
-		image.pull(imageName, r)
-		imgInfo = image.inspect(imageName)
-
-	if imgInfo == None:
-		raise Exception("Missing image: {0}".format(imageName))
+def isCurrent(containerName, imageName, pullImage=True, r=None):
+	if r == None:
+		r = rocker.getDefault()
 
-	if ctrInfo == None:
-		# container not found => we need to build it
-		return False
-	elif imgInfo == None:
-		# image not found => Error
-		raise Exception("Unknown image: {0}", imageName)
+	return _isCurrent(inspect(containerName, r), imageName, pullImage, r)
 
-	# newer versions of an image will get a new Id
-	return ctrInfo.getImage() == imgInfo.id
+def run(containerName, r=None, replace=False):
+	if r == None:
+		r = rocker.getDefault()
 
-def run(containerName, r=rocker.Rocker(), replace=False):
 	config = Container.fromRockerFile(containerName, r=r)
 	rc = False
 
@@ -603,27 +1310,69 @@ def run(containerName, r=rocker.Rocker(), replace=False):
 			rc = True
 
 	# check if the container still uses the most recent image
-	if not isCurrent(containerName, config.getImage(), pullImage=True, r=r):
+	lock = locks.Lock('container {0} {1}'.format(r.getUrl(), containerName)) # created before the check (see rocker.locks)
+	ctrInfo = inspect(containerName, r)
+	if not _isCurrent(ctrInfo, config.getImage(), pullImage=True, r=r):
 		rc = True
 
 	if rc:
-		r.info("Deploying container: {0}".format(containerName))
-		_create(containerName, config, r, replace)
-		_run(containerName, r)
+		# only one rocker process deploys the container at a time
+		try:
+			if not lock.acquire(blocking=False):
+				r.info("Waiting for another rocker process to deploy container: {0}".format(containerName))
+				lock.acquire()
+
+			if lock.hasChanged():
+				# another process might have deployed the container in the meantime => reuse it
+				r.invalidateCache()
+				newInfo = inspect(containerName, r)
+				if newInfo != None and (ctrInfo == None or newInfo.getId() != ctrInfo.getId()) and _isCurrent(newInfo, config.getImage(), False, r):
+					r.info("Container {0} was deployed by another rocker process".format(containerName))
+					_run(containerName, r)
+					return rc
+
+			r.info("Deploying container: {0}".format(containerName))
+			_create(containerName, config, r, replace)
+			_run(containerName, r)
+		finally:
+			lock.release()
 	else:
 		r.info("Skipping container {0} - nothing changed".format(containerName), duplicateId=(containerName,'create'))
 
 	return rc
 
+# isCurrent() for already inspected containers (ctrInfo might be None)
+def _isCurrent(ctrInfo, imageName, pullImage, r):
+	imgInfo = image.inspect(imageName, r)
+
+	if imgInfo == None and pullImage == True:
+		image.pull(imageName, r)
+		imgInfo = image.inspect(imageName, r)
+
+	if imgInfo == None:
+		raise Exception("Missing image: {0}".format(imageName))
+
+	if ctrInfo == None:
+		# container not found => we need to build it
+		return False
+	elif imgInfo == None:
+		# image not found => Error
+		raise Exception("Unknown image: {0}", imageName)
+
+	# newer versions of an image will get a new Id
+	return ctrInfo.getImage() == imgInfo.id
+
+@trace.traced('container.create')
 def _create(containerName, config, r, replace):
 	try:
-		with r.createRequest().doPost('/containers/create?name={0}'.format(containerName)) as req:
+		with r.phase('create', containerName), r.createRequest().doPost('/containers/create?name={0}'.format(containerName)) as req:
 			resp = req.send(config.toApiJson()).getObject()
 			if 'Warnings' in resp and resp['Warnings'] != None:
 				for w in resp['Warnings']:
-					sys.stderr.write("WARNING: {0}\n".format(w))
+					r.warning("WARNING: {0}".format(w))
 			if not 'Id' in resp:
 				raise Exception("Missing 'Id' in docker response!")
+		r.invalidateCache()
 	except HttpResponseError as e:
 		if e.getCode() == 409:
 			# Conflict -> fail
@@ -633,6 +1382,7 @@ def _create(containerName, config, r, replace):
 					# issue a delete call
 					with r.createRequest().doDelete('/containers/{0}?force=1'.format(containerName)) as req:
 						req.send()
+					r.invalidateCache()
 
 					# recursively call myself
 					_create(containerName, config, r, replace)
@@ -647,12 +1397,14 @@ If you want to replace the container, have a look at `rocker rerun`""", stream=s
 		else:
 			raise e
 
+@trace.traced('container.start')
 def _run(containerName, r):
-	info = inspect(containerName)
+	info = inspect(containerName, r)
 	if not info.isRunning():
 		r.info("Starting container: {0}".format(containerName), duplicateId=(containerName,'run'))
 
-		with r.createRequest() as req:
+		with r.phase('start', containerName), r.createRequest() as req:
 			req.doPost('/containers/{0}/start'.format(containerName)).send()
+		r.invalidateCache()
 	else:
 		r.debug(1, "Not starting {0} - already running".format(containerName), duplicateId=(containerName,'run'))
@@ -0,0 +1,197 @@
+from rocker import trace
+from rocker.rocker import getCacheDir
+
+import hashlib
+import os
+import stat
+import threading
+
+# On-disk cache of build context tarballs
+#
+# image.build() has to send the whole build context (as tar stream) even if the
+# image directory hasn't changed since the last build - e.g. when Docker lost the
+# image or when the parent image was rebuilt. Generating the tar stream means
+# walking the directory and reading every single file.
+#
+# With the cache enabled, each generated context is stored in a single file (while
+# it's being uploaded) keyed by the context's digest (see getDigest()). Subsequent
+# builds of an unchanged context send that file instead (using sendfile(), see
+# Request.writeFile()).
+#
+# The cache is disabled by default. Set ROCKER_CONTEXT_CACHE to its size budget (e.g.
+# '2g', see parseSize()) to enable it. The least recently used contexts are evicted
+# once the budget is exceeded. The files are stored in ROCKER_CONTEXT_CACHE_DIR
+# (defaults to ~/.cache/rocker/contexts).
+
+# files that don't affect the digest (image.TagFile's marker file is updated after each build)
+IGNORED_FILES = ['.rockerBuild']
+
+# Returns the ContextCache configured using ROCKER_CONTEXT_CACHE (or None if it's disabled)
+def getDefault():
+	maxSize = parseSize(os.getenv('ROCKER_CONTEXT_CACHE') or '0')
+	if maxSize == 0:
+		return None
+
+	path = os.getenv('ROCKER_CONTEXT_CACHE_DIR') or os.path.join(getCacheDir(), 'contexts')
+	return ContextCache(path, maxSize)
+
+# Returns the digest of a build context directory
+#
+# It covers each file's path, size, mode, inode and modification/change time (but not
+# the files' contents - reading them is exactly what the cache tries to avoid). Writing
+# to (or replacing) a file changes its ctime, so modified files will always be noticed.
+# IGNORED_FILES in the top level directory are skipped.
+@trace.traced('context.digest')
+def getDigest(path):
+	h = hashlib.sha256()
+	_addToDigest(h, path, '')
+	return h.hexdigest()
+
+# Converts size values to bytes (a number with an optional unit suffix: b, k, m or g)
+def parseSize(value):
+	units = {'b': 1, 'k': 1024, 'm': 1024**2, 'g': 1024**3}
+
+	v = value.strip().lower()
+	factor = 1
+	if len(v) > 0 and v[-1] in units:
+		factor = units[v[-1]]
+		v = v[:-1]
+	if not v.isdigit():
+		raise ValueError("Invalid size value: '{0}' (expected something like 1024, '512k', '64m' or '1g')".format(value))
+	return int(v) * factor
+
+class ContextCache:
+	def __init__(self, path, maxSize):
+		self._path = path
+		self._maxSize = maxSize
+
+	# Removes the least recently used contexts until the cache fits its size budget
+	def evict(self):
+		entries = []
+		for f in os.listdir(self._path):
+			if f.endswith('.tar'):
+				try:
+					st = os.stat(os.path.join(self._path, f))
+					entries.append((st.st_mtime, st.st_size, f))
+				except FileNotFoundError:
+					pass # evicted by another process
+
+		entries.sort()
+		size = sum(e[1] for e in entries)
+		for _, fileSize, f in entries:
+			if size <= self._maxSize:
+				break
+			try:
+				os.remove(os.path.join(self._path, f))
+			except FileNotFoundError:
+				pass
+			size -= fileSize
+
+	def getPath(self):
+		return self._path
+
+	# Returns the cached context with the given digest (as file opened for reading,
+	# or None if there's none)
+	#
+	# Marks the context as recently used
+	def open(self, digest):
+		path = os.path.join(self._path, digest+'.tar')
+		try:
+			rc = open(path, 'rb')
+		except FileNotFoundError:
+			return None
+
+		os.utime(rc.fileno()) # LRU order is based on mtime
+		return rc
+
+	# Returns a writer passing the data on to target (e.g. a Request) while storing
+	# it as new context with the given digest (see ContextWriter)
+	def write(self, digest, target):
+		try:
+			os.makedirs(self._path, exist_ok=True)
+		except OSError:
+			pass # ContextWriter will only pass the data on to target
+		return ContextWriter(self, digest, target)
+
+# File-like object writing a context to the cache while it's being sent (see write())
+#
+# Use it in a 'with' block: The context is only stored if commit() was called before
+# the block ends (otherwise - e.g. if the upload failed - it's discarded). If the
+# cache can't be written to (e.g. because the disk is full) the data is only passed
+# on to `target`.
+#
+# Usage:
+#
+# with cache.write(digest, req) as writer:
+#     tar = tarfile.open(mode='w', fileobj=writer)
+#     ...
+#     writer.commit()
+class ContextWriter:
+	def __init__(self, cache, digest, target):
+		self._cache = cache
+		self._digest = digest
+		self._target = target
+		self._committed = False
+
+		# each writer uses its own temporary file (concurrent builds might write the same context)
+		self._tmpPath = os.path.join(cache.getPath(), '.{0}.{1}.{2}.tmp'.format(digest, os.getpid(), threading.get_ident()))
+		try:
+			self._file = open(self._tmpPath, 'wb')
+		except OSError:
+			self._file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.close()
+
+	# Stores the context (only if it's been written successfully)
+	def close(self):
+		if self._file == None:
+			return
+
+		try:
+			self._file.close()
+			if self._committed:
+				os.replace(self._tmpPath, os.path.join(self._cache.getPath(), self._digest+'.tar'))
+				self._cache.evict()
+		except OSError:
+			pass
+		finally:
+			self._file = None
+			if os.path.exists(self._tmpPath):
+				os.remove(self._tmpPath)
+
+	# Marks the context as complete
+	def commit(self):
+		self._committed = True
+
+	def tell(self):
+		return self._target.tell()
+
+	def write(self, data):
+		self._target.write(data)
+
+		if self._file != None:
+			try:
+				self._file.write(data)
+			except OSError:
+				# don't let the cache break the build
+				self._file.close()
+				os.remove(self._tmpPath)
+				self._file = None
+				self._committed = False
+
+def _addToDigest(h, dir, prefix):
+	for f in sorted(os.listdir(dir)):
+		if prefix == '' and f in IGNORED_FILES:
+			continue
+
+		realPath = os.path.join(dir, f)
+		arcPath = os.path.join(prefix, f)
+		st = os.stat(realPath)
+		if stat.S_ISDIR(st.st_mode):
+			_addToDigest(h, realPath, arcPath)
+		else:
+			h.update("{0}\0{1}\0{2}\0{3}\0{4}\0{5}\n".format(arcPath, st.st_size, st.st_mode, st.st_ino, st.st_mtime_ns, st.st_ctime_ns).encode('utf8', 'surrogateescape'))
@@ -0,0 +1,139 @@
+from rocker.restclient import HttpResponseError, SocketError
+from rocker.rocker import getDefault, runParallel
+
+import os
+import time
+
+# Running commands against several Docker daemons at once (e.g. `rocker run --hosts=...`)
+#
+# Each host gets its own Rocker instance (see Rocker.forHost()) and output lane (so
+# each line of output is prefixed with the host's name). Up to `parallel` hosts are
+# handled concurrently, so a rollout takes about as long as the slowest host (instead
+# of the sum of all of them).
+#
+# Hosts are given as list of URLs (anything Rocker() accepts, e.g. 'unix:///var/run/docker.sock';
+# plain paths are treated as UNIX sockets). Each of them can be given a name ('name=url'),
+# otherwise the URL is used as name.
+
+DEFAULT_PARALLEL = 8
+
+# Result of a single host (see run())
+class HostResult:
+	__slots__ = ['duration', 'error', 'name', 'status', 'url']
+
+	def __init__(self, name, url):
+		self.duration = None
+		self.error = None
+		self.name = name
+		self.status = 'pending' # 'changed', 'unchanged' or 'failed' once done
+		self.url = url
+
+# Parses a comma separated list of hosts and returns a list of (name, url) tuples
+#
+# Raises a ValueError for empty or duplicate hosts
+def parseHosts(spec):
+	return _parseHostList(spec.split(','))
+
+# Reads a hosts file (one host per line, empty lines and lines starting with '#' are ignored)
+#
+# Returns a list of (name, url) tuples (see parseHosts())
+def readHostsFile(path):
+	with open(path) as f:
+		lines = [l.strip() for l in f.readlines()]
+	return _parseHostList([l for l in lines if len(l) > 0 and not l.startswith('#')])
+
+# Calls fn(r) for each of the given hosts (list of (name, url) tuples)
+#
+# fn's return value decides whether the host is reported as 'changed' (True) or
+# 'unchanged'. Exceptions (and rocker errors, i.e. SystemExit) mark the host as 'failed'.
+#
+# Prints a summary once all the hosts are done and returns the list of HostResults
+def run(hosts, fn, parallel=DEFAULT_PARALLEL, r=None):
+	if r == None:
+		r = getDefault()
+
+	results = [HostResult(name, url) for name, url in hosts]
+
+	def deploy(result):
+		with r.lane(result.name) as lr:
+			_runHost(result, fn, lr.forHost(result.url))
+
+	start = time.monotonic()
+	runParallel(results, deploy, parallel, 'host')
+
+	r.printQueuedMessages()
+	printSummary(results, time.monotonic()-start, r)
+	return results
+
+# Prints one line per host (in jsonl mode: one 'host' event per host)
+def printSummary(results, duration, r=None):
+	if r == None:
+		r = getDefault()
+
+	if r.getOutputMode() == 'jsonl':
+		for result in results:
+			r.event('host', result.name, url=result.url, status=result.status, duration=result.duration, msg=result.error)
+		return
+
+	rows = [('HOST', 'RESULT', 'TIME', '')]
+	for result in results:
+		rows.append((result.name, result.status, _formatDuration(result.duration), result.error or ''))
+
+	widths = [max(len(row[i]) for row in rows) for i in range(3)]
+	out = r.getOutputStream()
+	out.write('\n')
+	for row in rows:
+		out.write("{0}  {1}  {2}  {3}".format(row[0].ljust(widths[0]), row[1].ljust(widths[1]), row[2].rjust(widths[2]), row[3]).rstrip()+'\n')
+
+	failed = len([result for result in results if result.status == 'failed'])
+	out.write("\n{0} hosts in {1} ({2} failed)\n".format(len(results), _formatDuration(duration), failed))
+	out.flush()
+
+def _formatDuration(seconds):
+	if seconds == None:
+		return '--'
+	return "{0:.1f}s".format(seconds)
+
+def _parseHostList(entries):
+	rc = []
+	for entry in entries:
+		entry = entry.strip()
+		name, sep, url = entry.partition('=')
+		if sep == '':
+			name = url = entry
+		name = name.strip()
+		url = url.strip()
+
+		if len(name) == 0 or len(url) == 0:
+			raise ValueError("Invalid host: '{0}'".format(entry))
+		if not '://' in url:
+			url = 'unix://'+os.path.abspath(url)
+		if name in [n for n, _ in rc]:
+			raise ValueError("Duplicate host: '{0}'".format(name))
+
+		rc.append((name, url))
+	return rc
+
+# Runs fn for a single host (and records the outcome in result)
+def _runHost(result, fn, r):
+	start = time.monotonic()
+	try:
+		result.status = 'changed' if fn(r) else 'unchanged'
+	except HttpResponseError as e:
+		result.status = 'failed'
+		result.error = "Docker error (code: {0})".format(e.getCode())
+		r.error("{0}: {1}".format(result.error, str(e.getData(), 'utf8')), exitCode=None)
+	except SocketError as e:
+		result.status = 'failed'
+		result.error = e.message
+		r.error(e.message, exitCode=None)
+	except SystemExit as e:
+		# the error has already been reported (see Rocker.error())
+		result.status = 'failed'
+		result.error = "exit code {0}".format(e.code)
+	except Exception as e:
+		result.status = 'failed'
+		result.error = str(e)
+		r.error(str(e), exitCode=None)
+	finally:
+		result.duration = time.monotonic()-start
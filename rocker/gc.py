@@ -0,0 +1,229 @@
+from rocker import image
+from rocker.restclient import HttpResponseError
+from rocker.rocker import PROJECT_LABEL, formatBytes, getDefault, getErrorMessage, getProjectDir, runParallel
+
+import os
+import re
+import urllib.parse
+
+# Garbage collection (`rocker gc`)
+#
+# Rebuilding an image leaves the previous one behind (image.build() moves the image's
+# name to the new one) and `rocker rerun` leaves the replaced container's anonymous
+# volumes behind. gc looks for the objects the current project doesn't need any more:
+#
+# - stopped containers created by rocker whose .rocker file doesn't exist any more
+# - images built by rocker that don't carry one of the project's image names any more
+#   (or whose image directory is gone), unless they're still used by a container (or
+#   are the parent of an image that's kept)
+# - the anonymous volumes of the removed containers (and with includeVolumes=True all the
+#   unused anonymous volumes; docker doesn't keep track of who created them, so those
+#   can't be attributed to the project)
+#
+# Ownership is decided using the labels rocker adds to its containers and images
+# (PROJECT_LABEL contains the project directory, containers also need the fileHash label).
+# Objects created by other projects (or older rocker versions) are never touched.
+#
+# All the information (including each object's disk usage) is fetched using a single
+# GET /system/df request. The objects are then deleted concurrently: containers first,
+# then volumes and images (child images before their parents).
+
+DEFAULT_PARALLEL = 4
+FILE_HASH_LABEL = 'zone.coding.rocker.fileHash'
+MIN_API_VERSION = '1.25' # GET /system/df
+
+# container states that count as 'stopped'
+STOPPED_STATES = ['created', 'exited', 'dead']
+
+# anonymous volumes have random 64 character hex names
+_ANONYMOUS_VOLUME_RE = re.compile('[0-9a-f]{64}$')
+
+# An object gc is going to remove
+#
+# kind is one of 'container', 'image' or 'volume'. Images with a higher level have
+# to be removed after the ones with a lower level (their children).
+class Garbage:
+	__slots__ = ['id', 'kind', 'level', 'name', 'size']
+
+	def __init__(self, kind, id, name, size, level=0):
+		self.id = id
+		self.kind = kind
+		self.level = level
+		self.name = name
+		self.size = size
+
+# Returns the list of objects that can be removed (see the comment at the top)
+#
+# projectDir defaults to the current working directory (see rocker.getProjectDir())
+def find(projectDir=None, includeVolumes=False, r=None):
+	if r == None:
+		r = getDefault()
+	if projectDir == None:
+		projectDir = getProjectDir()
+	else:
+		projectDir = os.path.abspath(projectDir)
+
+	with r.createRequest() as req:
+		df = req.doGet('/system/df').send().getObject()
+
+	rc = []
+
+	# containers (and the volumes and images they use)
+	usedImages = set()
+	usedVolumes = set()
+	orphanedVolumes = set()
+	for ctr in df.get('Containers') or []:
+		name = (ctr.get('Names') or [ctr['Id']])[0].lstrip('/')
+		labels = ctr.get('Labels') or {}
+
+		if _isOwned(ctr, projectDir) and FILE_HASH_LABEL in labels and ctr.get('State') in STOPPED_STATES and not os.path.exists(os.path.join(projectDir, name+'.rocker')):
+			rc.append(Garbage('container', ctr['Id'], name, ctr.get('SizeRw') or 0))
+			volumes = orphanedVolumes
+		else:
+			usedImages.add(ctr.get('ImageID'))
+			volumes = usedVolumes
+
+		for mount in ctr.get('Mounts') or []:
+			if mount.get('Type') == 'volume':
+				volumes.add(mount.get('Name'))
+
+	# images
+	images = {}
+	children = {}
+	for img in df.get('Images') or []:
+		children.setdefault(img.get('ParentId') or '', []).append(img['Id'])
+		if _isOwned(img, projectDir) and img['Id'] not in usedImages and _isSuperseded(img, projectDir):
+			images[img['Id']] = img
+
+	# keep the parents of the images that are kept
+	changed = True
+	while changed:
+		changed = False
+		for imgId in list(images.keys()):
+			if any(c not in images for c in children.get(imgId, [])):
+				del images[imgId]
+				changed = True
+
+	levels = {}
+	for imgId, img in images.items():
+		rc.append(Garbage('image', imgId, _getImageName(img), _getImageSize(img), _getLevel(imgId, children, levels)))
+
+	# volumes
+	for vol in df.get('Volumes') or []:
+		name = vol.get('Name') or ''
+		usage = vol.get('UsageData') or {}
+		if name in usedVolumes or not _ANONYMOUS_VOLUME_RE.match(name):
+			continue
+
+		if name in orphanedVolumes or (includeVolumes and usage.get('RefCount') == 0):
+			rc.append(Garbage('volume', name, name[:12], max(usage.get('Size') or 0, 0)))
+
+	return rc
+
+# Removes the given objects (using up to `parallel` concurrent requests)
+#
+# Returns the list of objects that couldn't be removed (the errors will have been reported)
+def remove(garbage, parallel=DEFAULT_PARALLEL, r=None):
+	if r == None:
+		r = getDefault()
+
+	# containers first (they might be using the volumes), then images level by level
+	phases = [[g for g in garbage if g.kind == 'container'], [g for g in garbage if g.kind == 'volume']]
+	images = [g for g in garbage if g.kind == 'image']
+	for level in sorted(set(g.level for g in images)):
+		if level == 0:
+			phases[1] += [g for g in images if g.level == 0]
+		else:
+			phases.append([g for g in images if g.level == level])
+
+	rc = []
+	for items in phases:
+		errors = runParallel(items, lambda g: _remove(g, r), parallel, 'gc')
+
+		for g in items:
+			if g in errors:
+				r.error("Couldn't remove {0} {1}: {2}".format(g.kind, g.name, getErrorMessage(errors[g])), exitCode=None)
+				rc.append(g)
+			elif r.getOutputMode() == 'jsonl':
+				r.event('gc', g.name, kind=g.kind, id=g.id, size=g.size, removed=True)
+			else:
+				r.info("Removed {0}: {1} ({2})".format(g.kind, g.name, formatBytes(g.size)))
+
+	if r.getOutputMode() != 'jsonl':
+		r.info("Total: {0} reclaimed".format(formatBytes(sum(g.size for g in garbage if g not in rc))))
+
+	r.invalidateCache()
+	return rc
+
+# Prints the objects gc would remove (and the total size)
+def report(garbage, r=None):
+	if r == None:
+		r = getDefault()
+
+	if r.getOutputMode() == 'jsonl':
+		for g in garbage:
+			r.event('gc', g.name, kind=g.kind, id=g.id, size=g.size, removed=False)
+		return
+
+	rows = [('TYPE', 'NAME', 'SIZE')]
+	for g in garbage:
+		rows.append((g.kind, g.name, formatBytes(g.size)))
+
+	widths = [max(len(row[i]) for row in rows) for i in range(3)]
+	out = r.getOutputStream()
+	for row in rows:
+		out.write("{0}  {1}  {2}\n".format(row[0].ljust(widths[0]), row[1].ljust(widths[1]), row[2].rjust(widths[2])))
+	out.write("\nTotal: {0} would be reclaimed\n".format(formatBytes(sum(g.size for g in garbage))))
+	out.flush()
+
+# Returns an image's name (its first tag or its short ID)
+def _getImageName(img):
+	for tag in img.get('RepoTags') or []:
+		if tag != '<none>:<none>':
+			return tag
+
+	rc = img['Id']
+	if rc.startswith('sha256:'):
+		rc = rc[len('sha256:'):]
+	return rc[:12]
+
+# Returns the disk space removing the image frees up (i.e. without the layers it shares with other images)
+def _getImageSize(img):
+	return max((img.get('Size') or 0)-max(img.get('SharedSize') or 0, 0), 0)
+
+# Returns the number of generations of (removable) child images below the given image
+def _getLevel(imgId, children, levels):
+	if imgId not in levels:
+		levels[imgId] = 0
+		for child in children.get(imgId, []):
+			levels[imgId] = max(levels[imgId], _getLevel(child, children, levels)+1)
+	return levels[imgId]
+
+# Returns True if the given object (container or image) was created by rocker for the given project
+def _isOwned(obj, projectDir):
+	return (obj.get('Labels') or {}).get(PROJECT_LABEL) == projectDir
+
+# Returns True unless the image is tagged with one of the project's image names
+# (or any name rocker didn't give it)
+def _isSuperseded(img, projectDir):
+	for tag in img.get('RepoTags') or []:
+		if tag == '<none>:<none>':
+			continue
+
+		name, _, version = tag.rpartition(':')
+		if version != 'latest' or image.existsInProject(os.path.join(projectDir, name)):
+			return False
+	return True
+
+# Deletes a single object
+def _remove(garbage, r):
+	url = {'container': '/containers/{0}', 'image': '/images/{0}', 'volume': '/volumes/{0}'}[garbage.kind]
+
+	try:
+		with r.createRequest() as req:
+			resp = req.doDelete(url.format(urllib.parse.quote(garbage.id, safe=''))).send()
+			if garbage.kind == 'image':
+				resp.getObject() # list of untagged/deleted layers
+	except HttpResponseError as e:
+		if e.getCode() != 404: # 404: already gone (e.g. docker removed it along with its child image)
+			raise
@@ -1,16 +1,154 @@
 
 from io import BytesIO
-from rocker.rocker import Rocker
+from rocker import contextcache, locks, trace
 from rocker.restclient import HttpResponseError
+from rocker.rocker import MIN_BUILD_ARGS_VERSION, MIN_BUILD_CACHE_FROM_VERSION, MIN_BUILD_LABELS_VERSION, MIN_BUILD_TARGET_VERSION, PROJECT_LABEL, getDefault, getProjectDir
 
+import fcntl
 import json
 import os
-import sys
 import tarfile
+import urllib.parse
+
+# name of the (optional) build config file in an image directory (see BuildOptions)
+BUILD_CONFIG_FILE = 'rocker-build.json'
+
+# Build parameters of an image
+#
+# They're read from the rocker-build.json file in the image directory (see fromFile()),
+# e.g.:
+#
+# {
+#     "args": {"VERSION": "1.2"},
+#     "cacheFrom": ["registry:5000/acme/app:latest"],
+#     "labels": {"com.acme.team": "backend"},
+#     "noCache": false,
+#     "pull": true,
+#     "target": "production"
+# }
+#
+# and can be overridden on the command line (see merge()).
+class BuildOptions:
+	__slots__ = ['args', 'cacheFrom', 'labels', 'noCache', 'pull', 'target']
+
+	def __init__(self, args=None, cacheFrom=None, labels=None, noCache=None, pull=None, target=None):
+		self.args = args or {}
+		self.cacheFrom = cacheFrom or []
+		self.labels = labels or {}
+		self.noCache = noCache
+		self.pull = pull
+		self.target = target
+
+	# Reads the build config file of the given image directory
+	# (returns empty BuildOptions if there is none)
+	#
+	# Raises a ValueError if the file contains invalid values
+	@staticmethod
+	def fromFile(imagePath, rocker=None):
+		if rocker == None:
+			rocker = getDefault()
+
+		path = os.path.join(imagePath, BUILD_CONFIG_FILE)
+		if not os.path.exists(path):
+			return BuildOptions()
+
+		with open(path) as f:
+			data = json.loads(f.read())
+
+		for key in data.keys():
+			if key not in BuildOptions.__slots__:
+				rocker.warning("unsupported {0} key: '{1}'".format(BUILD_CONFIG_FILE, key))
+
+		try:
+			return BuildOptions(
+				args=BuildOptions._getMap(data, 'args'),
+				cacheFrom=BuildOptions._getList(data, 'cacheFrom'),
+				labels=BuildOptions._getMap(data, 'labels'),
+				noCache=BuildOptions._getBool(data, 'noCache'),
+				pull=BuildOptions._getBool(data, 'pull'),
+				target=BuildOptions._getString(data, 'target'))
+		except ValueError as e:
+			raise ValueError("{0}: {1}".format(path, e))
+
+	# Returns the /build query parameters (a list of (key, value) tuples)
+	#
+	# Calls rocker.error() if the daemon doesn't support one of the options in use
+	def getQuery(self, rocker):
+		rc = []
+
+		if len(self.args) > 0:
+			rocker.checkApiVersion(MIN_BUILD_ARGS_VERSION, failMsg="Build args require Docker API v{0}".format(MIN_BUILD_ARGS_VERSION))
+			rc.append(('buildargs', json.dumps(self.args)))
+		if len(self.cacheFrom) > 0:
+			rocker.checkApiVersion(MIN_BUILD_CACHE_FROM_VERSION, failMsg="cacheFrom requires Docker API v{0}".format(MIN_BUILD_CACHE_FROM_VERSION))
+			rc.append(('cachefrom', json.dumps(self.cacheFrom)))
+		if self.noCache:
+			rc.append(('nocache', '1'))
+		if self.pull:
+			rc.append(('pull', '1'))
+		if self.target != None:
+			rocker.checkApiVersion(MIN_BUILD_TARGET_VERSION, failMsg="Build targets require Docker API v{0}".format(MIN_BUILD_TARGET_VERSION))
+			rc.append(('target', self.target))
+
+		return rc
+
+	# Returns a copy with other's values applied on top of these ones
+	# (args and labels are merged, cacheFrom images are appended)
+	def merge(self, other):
+		if other == None:
+			return self
+
+		return BuildOptions(
+			args=dict(self.args, **other.args),
+			cacheFrom=self.cacheFrom + [i for i in other.cacheFrom if not i in self.cacheFrom],
+			labels=dict(self.labels, **other.labels),
+			noCache=other.noCache if other.noCache != None else self.noCache,
+			pull=other.pull if other.pull != None else self.pull,
+			target=other.target if other.target != None else self.target)
+
+	@staticmethod
+	def _getBool(data, key):
+		rc = data.get(key)
+		if rc != None and type(rc) != bool:
+			raise ValueError("'{0}' expects true or false".format(key))
+		return rc
+
+	@staticmethod
+	def _getList(data, key):
+		rc = data.get(key, [])
+		if type(rc) == str:
+			rc = [rc]
+		if type(rc) != type([]) or any(type(v) != str for v in rc): # (list() is shadowed in this module)
+			raise ValueError("'{0}' expects a list of image names".format(key))
+		return rc
+
+	# maps have string values (numbers and booleans are converted)
+	@staticmethod
+	def _getMap(data, key):
+		rc = data.get(key, {})
+		if type(rc) != dict or any(type(v) in [dict, type([])] or v == None for v in rc.values()):
+			raise ValueError("'{0}' expects a map of strings".format(key))
+		return dict((k, v if type(v) == str else json.dumps(v)) for k, v in rc.items())
+
+	@staticmethod
+	def _getString(data, key):
+		rc = data.get(key)
+		if rc != None and type(rc) != str:
+			raise ValueError("'{0}' expects a string".format(key))
+		return rc
 
 # Data class representing a Docker image
+#
+# Image objects only keep the fields listed below. If keepRawData is True, the
+# inspect data will be kept as well (and the fields not covered by Image's
+# attributes can be accessed using getOtherData()).
 class Image:
-	def __init__(self, json):
+	__slots__ = ['config', 'created', 'entrypoint', 'id', 'parent', 'repoTags', 'size', 'virtualSize', '_rawData']
+
+	# inspect data keys that are mapped to attributes
+	_KEYS = ['ContainerConfig', 'Created', 'Entrypoint', 'Id', 'Parent', 'ParentId', 'RepoTags', 'Size', 'VirtualSize']
+
+	def __init__(self, json, keepRawData=False):
 		self.config = Image._getValue(json, 'ContainerConfig')
 		self.created = Image._getValue(json, 'Created')
 		self.entrypoint = Image._getValue(json, 'Entrypoint')
@@ -20,7 +158,26 @@ class Image:
 		self.size = Image._getValue(json, 'Size')
 		self.virtualSize = Image._getValue(json, 'VirtualSize')
 
-		self._otherData = json
+		self._rawData = None
+		if keepRawData:
+			self._rawData = json
+
+	# Returns the inspect data not covered by Image's attributes
+	# (or None if the Image was created with keepRawData=False)
+	def getOtherData(self):
+		rc = None
+
+		if self._rawData != None:
+			rc = {}
+			for key, value in self._rawData.items():
+				if key not in Image._KEYS:
+					rc[key] = value
+
+		return rc
+
+	# Returns the unmodified inspect data (or None if keepRawData was False)
+	def getRawData(self):
+		return self._rawData
 
 	# helper function to extract a value from a map (and just return None if it
 	# wasn't there)
@@ -34,20 +191,22 @@ class Image:
 		for key in keys:
 			if key in data:
 				rc = data[key]
-				del data[key]
 				break
 
 		return rc
 
 class TagFile:
+	FILENAME = '.rockerBuild'
+
 	# This method will use _findNewestFile() to get max(mtime) of all the files
 	# in path recursively
-	def __init__(self, path):
-		self.tagPath = os.path.join(path, '.rockerBuild')
-		self.tagMtime = 0
-
-		if os.path.exists(self.tagPath):
-			self.tagMtime = os.path.getmtime(self.tagPath)
+	#
+	# The tag file keeps track of each docker daemon (identified by url) separately
+	# (it maps their URLs to the newest file's mtime at the time of their last build)
+	def __init__(self, path, url=None):
+		self.tagPath = os.path.join(path, TagFile.FILENAME)
+		self.url = url or ''
+		self.tagMtime = self._read().get(self.url, 0)
 
 		self.dataMtime = self._findNewestFile(path)
 
@@ -57,20 +216,31 @@ class TagFile:
 	def check(self):
 			return self.tagMtime >= self.dataMtime
 
-	# Updates the tagFile's mtime to the mtime of the newest data file
+	# Records the mtime of the newest data file for our daemon
 	# The tag file will be created if it doesn't exist
 	def update(self):
-		if not os.path.exists(self.tagPath):
-			with open(self.tagPath, 'w') as f:
-				pass
-		os.utime(self.tagPath, (self.dataMtime, self.dataMtime))
-
-	# returns the mtime of the newest file in path
+		fd = os.open(self.tagPath, os.O_RDWR|os.O_CREAT, 0o666)
+		try:
+			# concurrent builds for other daemons (see rocker.fleet) update the same file
+			fcntl.flock(fd, fcntl.LOCK_EX)
+			state = TagFile._parse(os.pread(fd, 1024*1024, 0))
+			state[self.url] = self.dataMtime
+
+			data = json.dumps(state, sort_keys=True).encode('utf8')
+			os.pwrite(fd, data, 0)
+			os.ftruncate(fd, len(data))
+		finally:
+			os.close(fd) # releases the lock
+		self.tagMtime = self.dataMtime
+
+	# returns the mtime of the newest file in path (ignoring the tag file itself)
 	def _findNewestFile(self, path):
 		rc = 0 # os.path.getmtime(path)
 
 		for f in os.listdir(path):
 			f = os.path.join(path, f)
+			if f == self.tagPath:
+				continue
 			mtime = os.path.getmtime(f)
 			if os.path.isdir(f):
 				mtime = max(self._findNewestFile(f), mtime)
@@ -79,28 +249,61 @@ class TagFile:
 				rc = mtime
 		return rc
 
+	# Parses the tag file's contents (empty or invalid tag files, e.g. the ones written
+	# by older rocker versions, don't contain any state)
+	@staticmethod
+	def _parse(data):
+		try:
+			rc = json.loads(data.decode('utf8'))
+		except ValueError:
+			return {}
+		return rc if type(rc) == dict else {}
+
+	def _read(self):
+		try:
+			with open(self.tagPath, 'rb') as f:
+				return TagFile._parse(f.read())
+		except FileNotFoundError:
+			return {}
+
 
 # build an image if necessary
 #
-# This function maintains an empty .rockerBuild file in the image path
-# whose mtime will be set to that of the newest file in the directory.
+# This function maintains a .rockerBuild file in the image path which records
+# the mtime of the directory's newest file at the time of the last build (for
+# each docker daemon separately, see TagFile).
 #
 # This allows us to quickly decide whether an image rebuild is necessary.
 # Returns True if the image was built, False if the build was skipped (i.e. nothing changed).
 # Will raise exceptions on error.
-def build(imagePath, rocker=Rocker()):
-	tagFile = TagFile(imagePath)
+#
+# The build parameters are read from the image's rocker-build.json file (options
+# are applied on top of them, but only for this image - not its parents). Images
+# with 'noCache' are always rebuilt.
+@trace.traced('image.build')
+def build(imagePath, rocker=None, options=None):
+	if rocker == None:
+		rocker = getDefault()
+
+	with trace.span('image.scan', name=imagePath):
+		tagFile = TagFile(imagePath, rocker.getUrl())
 	skip = True
 
+	options = BuildOptions.fromFile(imagePath, rocker).merge(options)
+	if options.noCache:
+		skip = False
+
 	dockerFile = parseDockerfile(imagePath)
 
 	if dockerFile.parent != None:
 		if existsInProject(dockerFile.parent):
-			if build(dockerFile.parent):
+			if build(dockerFile.parent, rocker):
 				# always rebuild the image if its parent was rebuilt
 				skip = False
 
-	imgInfo = inspect(imagePath)
+	# created before the checks (see rocker.locks)
+	lock = locks.Lock('image {0} {1}'.format(rocker.getUrl(), os.path.abspath(imagePath)))
+	imgInfo = inspect(imagePath, rocker)
 
 	# If docker doesn't have the image, build it even if there's a .rockerBuild file
 	if imgInfo == None:
@@ -109,18 +312,26 @@ def build(imagePath, rocker=Rocker()):
 		skip = False # .rockerBuild file is older than the dir's contents
 
 	if not skip:
-		rocker.info("Building image: {0}".format(imagePath))
-
-		# initiate build
-		with rocker.createRequest().doPost('/build?rm=1&t={0}'.format(imagePath)) as req:
-			req.enableChunkedMode()
-			tar = tarfile.open(mode='w', fileobj=req)
-			_fillTar(tar, imagePath)
-			resp = req.send()
-			rocker.printDockerOutput(resp)
-
-		# update mtime
-		tagFile.update()
+		# only one rocker process builds the image at a time
+		try:
+			if not lock.acquire(blocking=False):
+				rocker.info("Waiting for another rocker process to build image: {0}".format(imagePath))
+				lock.acquire()
+
+			if lock.hasChanged():
+				# another process might have built the image in the meantime => reuse it
+				rocker.invalidateCache()
+				if inspect(imagePath, rocker) != None and TagFile(imagePath, rocker.getUrl()).check():
+					rocker.info("Image {0} was built by another rocker process".format(imagePath))
+					return True
+
+			rocker.info("Building image: {0}".format(imagePath))
+			_build(imagePath, options, rocker)
+
+			# update mtime
+			tagFile.update()
+		finally:
+			lock.release()
 	else:
 		rocker.debug(1, "Skipping image '{0}' - nothing changed\n".format(imagePath), duplicateId=(imagePath,'build'))
 
@@ -128,33 +339,40 @@ def build(imagePath, rocker=Rocker()):
 
 
 # Returns whether or not the given image exists locally
-def exists(imageName, rocker=Rocker()):
+def exists(imageName, rocker=None):
+	if rocker == None:
+		rocker = getDefault()
+
 	return inspect(imageName, rocker) != None
 
 def existsInProject(imageName):
 	return os.path.isfile(os.path.join(imageName, 'Dockerfile'))
 
 # Returns detailed information about the given image (or None if not found)
-def inspect(imageName, rocker=Rocker()):
+#
+# Set keepRawData to True if you need access to the whole inspect data (see Image)
+@trace.traced('image.inspect')
+def inspect(imageName, rocker=None, keepRawData=False):
+	if rocker == None:
+		rocker = getDefault()
+
 	rc = None
 
-	with rocker.createRequest() as req:
-		try:
-			rc = Image(req.doGet('/images/{0}/json'.format(imageName)).send().getObject())
+	data = rocker.getInspectData('images', imageName)
+	if data != None:
+		rc = Image(data, keepRawData)
 
-		except HttpResponseError as e:
-			if e.getCode() == 404:
-				pass # return None
-			else:
-				raise e
 	return rc
 
 # Returns a list of all local docker images
-def list(rocker=Rocker()):
+def list(rocker=None, keepRawData=False):
+	if rocker == None:
+		rocker = getDefault()
+
 	rc = []
 	with rocker.createRequest() as req:
-		for data in req.doGet('/images/json').send():
-			rc.append(Image(data))
+		for data in req.doGet('/images/json').send().getObject():
+			rc.append(Image(data, keepRawData))
 	return rc
 
 # Parses (parts of) a Dockerfile and returns an Image instance
@@ -182,16 +400,97 @@ def parseDockerfile(path):
 		'Parent': parentImage
 	})
 
-def pull(name, rocker=Rocker()):
-	with rocker.createRequest() as req:
-		resp = req.doPost('/images/create?fromImage={0}%3Alatest'.format(name)).send(data=None)
-		rocker.printDockerOutput(resp)
+# Pulls the given image (using the 'latest' tag if name doesn't specify one)
+#
+# The pull progress is printed (see Rocker.printDockerOutput()) unless a renderer
+# (an object with update(msgJson) and finish() methods) is given.
+@trace.traced('image.pull')
+def pull(name, rocker=None, renderer=None):
+	if rocker == None:
+		rocker = getDefault()
+
+	repo, tag = splitTag(name)
+	with rocker.phase('pull', name), rocker.createRequest() as req:
+		resp = req.doPost('/images/create?fromImage={0}&tag={1}'.format(urllib.parse.quote(repo, safe=''), urllib.parse.quote(tag, safe=''))).send(data=None)
+		rocker.printDockerOutput(resp, 'pull', name, renderer)
+	rocker.invalidateCache()
+
+# Splits an image name into repository and tag (defaults to 'latest')
+#
+# e.g. 'registry:5000/acme/app:1.2' -> ('registry:5000/acme/app', '1.2')
+def splitTag(name):
+	repo, sep, tag = name.rpartition(':')
+	if sep == '' or '/' in tag:
+		return name, 'latest'
+	return repo, tag
+
+# Uploads the build context and prints docker's build output
+def _build(imagePath, options, rocker):
+	query = [('rm', '1'), ('t', imagePath)]
+	query += options.getQuery(rocker)
+
+	labels = dict(options.labels)
+	if len(labels) > 0:
+		rocker.checkApiVersion(MIN_BUILD_LABELS_VERSION, failMsg="Build labels require Docker API v{0}".format(MIN_BUILD_LABELS_VERSION))
+	if rocker.checkApiVersion(MIN_BUILD_LABELS_VERSION):
+		# mark the image as part of the project (allows `rocker gc` to remove it once it's been superseded)
+		labels[PROJECT_LABEL] = getProjectDir()
+		query.append(('labels', json.dumps(labels)))
+
+	# docker only uses cacheFrom images it has locally (so fresh build hosts need to pull them first)
+	_pullCacheImages(options.cacheFrom, rocker)
+
+	url = '/build?{0}'.format(urllib.parse.urlencode(query))
+	with rocker.phase('build', imagePath), rocker.createRequest().doPost(url) as req:
+		req.enableChunkedMode()
+		_sendContext(req, imagePath, contextcache.getDefault(), rocker)
+		resp = req.send()
+		rocker.printDockerOutput(resp, 'build', imagePath)
+	rocker.invalidateCache()
+
+# Pulls the given cacheFrom images (unless docker already has them)
+#
+# Images that can't be pulled (e.g. because they haven't been pushed yet) are skipped
+def _pullCacheImages(images, rocker):
+	for name in images:
+		if exists(name, rocker):
+			continue
+
+		try:
+			pull(name, rocker)
+		except HttpResponseError as e:
+			rocker.warning("Couldn't pull cache image {0} (code: {1})".format(name, e.getCode()))
+
+# Sends the build context of the given image (replays it from the context cache if possible,
+# see rocker.contextcache)
+def _sendContext(req, imagePath, cache, rocker):
+	if cache == None:
+		tar = tarfile.open(mode='w', fileobj=req)
+		_fillTar(tar, imagePath)
+		return
+
+	digest = contextcache.getDigest(imagePath)
+	f = cache.open(digest)
+	if f != None:
+		rocker.debug(1, "Using cached build context: {0}".format(imagePath))
+		with f, trace.span('context.replay', name=imagePath):
+			req.writeFile(f, os.fstat(f.fileno()).st_size)
+		return
+
+	with cache.write(digest, req) as writer:
+		tar = tarfile.open(mode='w', fileobj=writer)
+		_fillTar(tar, imagePath)
+
+		# only keep it if nothing changed while it was being sent
+		if contextcache.getDigest(imagePath) == digest:
+			writer.commit()
 
 # Adds all files in a directory to the specified tarfile object
 # 
 # This method will use tgtPath as root directory (i.e. strip away unnecessary path parts).
 # If tgtPath is a symlink to a directory containing a Dockerfile, _fillTar() will use that
 # directory instead (instead of simply adding the symlink)
+@trace.traced('image.fillTar')
 def _fillTar(tar, tgtPath):
 	if not os.path.isfile(os.path.join(tgtPath, "Dockerfile")):
 		raise Exception("No Dockerfile in target path '{0}'")
@@ -204,6 +503,9 @@ def _fillTar(tar, tgtPath):
 
 def __fillTar(tar, dir, prefix):
 	for f in os.listdir(dir):
+		if prefix == '' and f == TagFile.FILENAME:
+			continue # that's rocker's, not docker's
+
 		realPath = os.path.join(dir, f)
 		arcPath = os.path.join(prefix, f)
 		if os.path.isdir(realPath):
@@ -0,0 +1,122 @@
+from rocker import trace
+from rocker.rocker import getCacheDir
+
+import fcntl
+import hashlib
+import os
+
+# Cross-process locks (based on fcntl.flock())
+#
+# image.build() and container.run() hold a lock per image directory (and per container
+# name) while building/deploying, so concurrent rocker processes (CI jobs, watchers, ...)
+# don't build the same image twice or race each other into docker's 409 conflicts.
+#
+# The pattern is check, lock, re-check: the Lock object is created before checking
+# whether there's anything to do. Once the lock's acquired, hasChanged() tells whether
+# another process has held it in the meantime - in which case it might already have
+# done the job (and its result can be reused instead of repeating it).
+#
+# The lock files are stored in ROCKER_LOCK_DIR (defaults to ~/.cache/rocker/locks; set it
+# to a directory all the users can write to if several users deploy on the same host).
+# Each of them contains a counter that's incremented whenever the lock is released (which
+# is how hasChanged() works). They're never removed (removing them would allow two processes
+# to lock different files with the same path).
+#
+# flock() locks belong to the open file, so they also work between threads (as long
+# as each of them uses its own Lock instance).
+
+# Returns the directory lock files are stored in (and creates it if necessary)
+def getLockDir():
+	rc = os.getenv('ROCKER_LOCK_DIR') or os.path.join(getCacheDir(), 'locks')
+	if not os.path.isdir(rc):
+		os.makedirs(rc, exist_ok=True)
+	return rc
+
+# Exclusive lock identified by an arbitrary string key (e.g. 'image <dockerUrl> <path>')
+#
+# Usage:
+#
+# lock = Lock(key)
+# if somethingToDo():
+#     try:
+#         if not lock.acquire(blocking=False):
+#             print("waiting for another process")
+#             lock.acquire()
+#         if lock.hasChanged() and not somethingToDo():
+#             return # the other process has done it
+#         doIt()
+#     finally:
+#         lock.release()
+class Lock:
+	def __init__(self, key):
+		self._key = key
+		self._path = os.path.join(getLockDir(), hashlib.sha256(key.encode('utf8')).hexdigest()[:32]+'.lock')
+		self._fd = None
+		self._changed = False
+		self._counter = None
+
+		# the counter's value at the time of the check
+		try:
+			with open(self._path, 'rb') as f:
+				self._seen = Lock._parseCounter(f.read())
+		except FileNotFoundError:
+			self._seen = 0
+
+	# Acquires the lock (returns False if blocking is False and the lock is held by someone else)
+	def acquire(self, blocking=True):
+		if self._fd != None:
+			return True
+
+		fd = os.open(self._path, os.O_RDWR|os.O_CREAT, 0o666)
+		try:
+			if blocking:
+				with trace.span('lock.wait', key=self._key):
+					fcntl.flock(fd, fcntl.LOCK_EX)
+			else:
+				fcntl.flock(fd, fcntl.LOCK_EX|fcntl.LOCK_NB)
+
+			self._counter = Lock._parseCounter(os.pread(fd, 4096, 0))
+			self._changed = (self._counter == None or self._counter != self._seen)
+		except BlockingIOError:
+			os.close(fd)
+			return False
+		except BaseException:
+			os.close(fd)
+			raise
+
+		self._fd = fd
+		return True
+
+	def getPath(self):
+		return self._path
+
+	# Returns True if someone else has held the lock since this Lock was created
+	# (only valid once the lock has been acquired)
+	def hasChanged(self):
+		return self._changed
+
+	def isLocked(self):
+		return self._fd != None
+
+	# Releases the lock (does nothing if it isn't held)
+	def release(self):
+		if self._fd != None:
+			try:
+				# increment the counter (and record the last holder, which is only meant for humans)
+				data = "{0} {1} {2}\n".format((self._counter or 0)+1, os.getpid(), self._key).encode('utf8')
+				os.pwrite(self._fd, data, 0)
+				os.ftruncate(self._fd, len(data))
+			finally:
+				os.close(self._fd) # closing the file releases the lock
+				self._fd = None
+
+	# Returns the counter stored in a lock file (0 for empty files, None if it can't be parsed,
+	# e.g. because the file's being written right now)
+	@staticmethod
+	def _parseCounter(data):
+		if len(data) == 0:
+			return 0
+		try:
+			return int(data.split(b' ', 1)[0])
+		except ValueError:
+			return None
@@ -0,0 +1,180 @@
+from rocker.rocker import getDefault, getErrorMessage, runParallel
+
+import codecs
+import struct
+import sys
+
+# Container log streaming (`rocker logs`)
+#
+# Unless a container has a TTY, docker multiplexes its stdout and stderr into one
+# stream of frames, each with an 8 byte header:
+#
+#   [stream type (1 byte: 0=stdin, 1=stdout, 2=stderr, 3=system error)] [3 zero bytes] [payload size (uint32, big endian)]
+#
+# FrameDecoder reads the response directly into a reusable buffer and hands out the
+# frames' payloads as memoryview slices (so the log data is only copied when it's decoded).
+
+STDOUT = 1
+STDERR = 2
+SYSERR = 3
+
+# Decodes docker's multiplexed stream format (see above)
+#
+# Usage:
+#
+# n = resp.readInto(decoder.getWritable())
+# decoder.commit(n)
+# for streamType, payload in decoder.frames():
+#     ...
+#
+# The payload memoryviews are only valid until the next getWritable() call.
+# If multiplexed is False (i.e. the container has a TTY), all the data is
+# returned as STDOUT frames.
+class FrameDecoder:
+	HEADER = struct.Struct('>BxxxL')
+
+	def __init__(self, multiplexed=True, bufferSize=64*1024):
+		self._multiplexed = multiplexed
+		self._buffer = bytearray(bufferSize)
+		self._view = memoryview(self._buffer)
+		self._start = 0 # start of the data that hasn't been returned by frames() yet
+		self._end = 0 # end of the data read so far
+		self._needed = 0 # size of the incomplete frame (if it doesn't fit into the buffer)
+
+	# Marks `count` bytes (written to getWritable()'s buffer) as read
+	def commit(self, count):
+		self._end += count
+
+	# Returns the complete frames read so far (as (streamType, memoryview) tuples)
+	def frames(self):
+		buff = self._buffer
+		view = self._view
+		start = self._start
+		end = self._end
+
+		if not self._multiplexed:
+			if end > start:
+				yield STDOUT, view[start:end]
+			self._start = self._end = 0
+			return
+
+		while end-start >= 8:
+			streamType, size = FrameDecoder.HEADER.unpack_from(buff, start)
+			if end-start-8 < size:
+				# incomplete frame
+				self._needed = 8+size
+				break
+
+			yield streamType, view[start+8:start+8+size]
+			start += 8+size
+
+		if start == end:
+			start = end = 0 # buffer's empty => start over
+		self._start = start
+		self._end = end
+
+	# Returns a memoryview of the buffer's free space
+	#
+	# Moves an incomplete frame to the start of the buffer (or grows the buffer if the
+	# frame's larger than the buffer) if necessary.
+	def getWritable(self):
+		size = len(self._buffer)
+		pending = self._end-self._start
+
+		if self._needed > size:
+			# grow the buffer (we can't resize it in place as frames() might've handed out views of it)
+			while size < self._needed:
+				size *= 2
+			buff = bytearray(size)
+			buff[:pending] = self._view[self._start:self._end]
+			self._buffer = buff
+			self._view = memoryview(buff)
+			self._start = 0
+			self._end = pending
+		elif self._start > 0 and (self._end == size or self._needed > size-self._start):
+			# not enough space left for the incomplete frame => move it to the start of the buffer
+			self._buffer[:pending] = bytes(self._view[self._start:self._end])
+			self._start = 0
+			self._end = pending
+
+		self._needed = 0
+		return self._view[self._end:]
+
+# Writes a container's logs to out (stdout) and err (stderr)
+#
+# Blocks until docker closes the stream (which for follow=True happens when the
+# container stops). The output of each read is written in one batch.
+# Returns False if the container doesn't exist
+def streamLogs(name, out, err, follow=False, tail='all', r=None):
+	if r == None:
+		r = getDefault()
+
+	info = r.getInspectData('containers', name)
+	if info == None:
+		r.error("Container not found: {0}".format(name), exitCode=None)
+		return False
+	multiplexed = not (info.get('Config') or {}).get('Tty', False)
+
+	decoder = FrameDecoder(multiplexed)
+	textDecoders = {
+		STDOUT: codecs.getincrementaldecoder('utf8')(errors='replace'),
+		STDERR: codecs.getincrementaldecoder('utf8')(errors='replace')
+	}
+
+	with r.createRequest() as req:
+		resp = req.doGet('/containers/{0}/logs?stdout=1&stderr=1&follow={1}&tail={2}'.format(info['Id'], int(follow), tail)).send()
+
+		while True:
+			count = resp.readInto(decoder.getWritable())
+			if count == 0:
+				break
+			decoder.commit(count)
+
+			stdout = []
+			stderr = []
+			for streamType, payload in decoder.frames():
+				if streamType == STDOUT:
+					stdout.append(textDecoders[STDOUT].decode(payload))
+				elif streamType == STDERR:
+					stderr.append(textDecoders[STDERR].decode(payload))
+				elif streamType == SYSERR:
+					r.error("{0}: {1}".format(name, str(payload, 'utf8', errors='replace')), exitCode=None)
+
+			if len(stdout) > 0:
+				out.write(''.join(stdout))
+				out.flush()
+			if len(stderr) > 0:
+				err.write(''.join(stderr))
+				err.flush()
+
+	# incomplete multibyte characters at the end of the stream
+	out.write(textDecoders[STDOUT].decode(b'', final=True))
+	err.write(textDecoders[STDERR].decode(b'', final=True))
+	return True
+
+# Shows the logs of the given containers
+#
+# A single container's output is written to stdout/stderr directly, multiple
+# containers are followed concurrently (each of them in its own output lane, i.e.
+# with their names as line prefix; stdout and stderr are merged).
+#
+# Returns True if all the containers were found
+def show(names, follow=False, tail='all', r=None):
+	if r == None:
+		r = getDefault()
+
+	if len(names) == 1:
+		return streamLogs(names[0], sys.stdout, sys.stderr, follow, tail, r)
+
+	results = {}
+	def run(name):
+		with r.lane(name) as lr:
+			out = lr.getOutputStream()
+			results[name] = streamLogs(name, out, out, follow, tail, lr)
+
+	errors = runParallel(names, run, len(names), 'logs')
+
+	r.printQueuedMessages()
+	for name, e in errors.items():
+		r.error("{0}: {1}".format(name, getErrorMessage(e)), exitCode=None)
+	return all(results.get(name, False) for name in names)
@@ -0,0 +1,295 @@
+import math
+import os
+import sys
+import threading
+import time
+
+# Client side metrics for Docker API requests
+#
+# Enabled by `--stats` (prints a summary table to stderr when the command's done)
+# and/or `--stats-file=FILE` (writes the metrics in Prometheus' text format, e.g.
+# for node_exporter's textfile collector).
+#
+# Requests are grouped by HTTP method and endpoint template (e.g. 'GET /containers/{}/json',
+# see getEndpoint()). For each endpoint we keep track of:
+# - the number of requests
+# - bytes sent and received
+# - the number of send() calls and select() waits (to spot chatty call patterns)
+# - time to first byte (measured from Request.send()) and total latency (from
+#   connecting to closing the request) as histograms
+#
+# While metrics are disabled, restclient won't even allocate RequestStats objects.
+
+# top level API resources whose second path segment is an object ID or name
+_ID_RESOURCES = {'configs', 'containers', 'exec', 'images', 'networks', 'nodes', 'plugins', 'secrets', 'services', 'tasks', 'volumes'}
+
+# collection endpoints (e.g. '/containers/json' as opposed to '/containers/<name>')
+_COLLECTION_ACTIONS = {'create', 'get', 'json', 'load', 'prune', 'search'}
+
+# HDR style histogram with a relative precision of 1/SUB_BUCKETS
+#
+# Each power of two (in microseconds) is split into SUB_BUCKETS linear buckets, so
+# a value is never reported more than 12.5% higher than it actually was, regardless
+# of whether it's 200µs or 20s. Only non-empty buckets are stored.
+class Histogram:
+	__slots__ = ['_buckets', '_count', '_max', '_sum']
+
+	SUB_BUCKETS = 8
+
+	def __init__(self):
+		self._buckets = {}
+		self._count = 0
+		self._max = 0
+		self._sum = 0
+
+	# Adds a value (in seconds)
+	def add(self, value):
+		bound = Histogram._getUpperBound(value*1e6)
+		self._buckets[bound] = self._buckets.get(bound, 0) + 1
+		self._count += 1
+		self._sum += value
+		if value > self._max:
+			self._max = value
+
+	# Returns (upperBound, count) pairs (upper bounds in seconds, sorted; counts aren't cumulative)
+	def getBuckets(self):
+		rc = []
+		for bound in sorted(self._buckets.keys()):
+			rc.append((bound/1e6, self._buckets[bound]))
+		return rc
+
+	def getCount(self):
+		return self._count
+
+	def getMax(self):
+		return self._max
+
+	def getSum(self):
+		return self._sum
+
+	# Returns the upper bound of the bucket containing the given quantile (0..1)
+	# (or None if the histogram is empty)
+	def getQuantile(self, q):
+		rc = None
+
+		if self._count > 0:
+			threshold = q*self._count
+			seen = 0
+			for bound, count in self.getBuckets():
+				seen += count
+				rc = bound
+				if seen >= threshold:
+					break
+
+		return rc
+
+	# Returns the upper bound (in µs) of the bucket the given value (in µs) falls into
+	@staticmethod
+	def _getUpperBound(us):
+		if us <= 1:
+			return 1
+
+		# us = mantissa * 2**exp (with 0.5 <= mantissa < 1) => us is in [base, 2*base)
+		_, exp = math.frexp(us)
+		base = 2.0**(exp-1)
+		step = base/Histogram.SUB_BUCKETS
+		return base + step*math.ceil((us-base)/step)
+
+# Per endpoint stats (see Registry)
+class EndpointStats:
+	__slots__ = ['bytesReceived', 'bytesSent', 'count', 'latency', 'selectWaits', 'sendCalls', 'ttfb']
+
+	def __init__(self):
+		self.bytesReceived = 0
+		self.bytesSent = 0
+		self.count = 0
+		self.latency = Histogram()
+		self.selectWaits = 0
+		self.sendCalls = 0
+		self.ttfb = Histogram()
+
+# Counters for a single request (updated by restclient)
+class RequestStats:
+	__slots__ = ['bytesReceived', 'bytesSent', 'firstByte', 'selectWaits', 'sendCalls', 'sendStart', 'start']
+
+	def __init__(self):
+		self.bytesReceived = 0
+		self.bytesSent = 0
+		self.firstByte = None
+		self.selectWaits = 0
+		self.sendCalls = 0
+		self.sendStart = None
+		self.start = time.perf_counter()
+
+# Collects the stats of all the requests made while metrics are enabled
+class Registry:
+	def __init__(self):
+		self._endpoints = {}
+		self._lock = threading.Lock()
+
+		self.printTable = False
+		self.textfilePath = None
+
+	# Returns the EndpointStats objects (as a dict with (method, endpoint) keys)
+	def getEndpoints(self):
+		with self._lock:
+			return dict(self._endpoints)
+
+	# Adds a finished request's stats
+	def record(self, method, path, reqStats, end=None):
+		if end == None:
+			end = time.perf_counter()
+		key = (method, getEndpoint(path))
+
+		with self._lock:
+			stats = self._endpoints.get(key)
+			if stats == None:
+				stats = self._endpoints[key] = EndpointStats()
+
+			stats.count += 1
+			stats.bytesReceived += reqStats.bytesReceived
+			stats.bytesSent += reqStats.bytesSent
+			stats.selectWaits += reqStats.selectWaits
+			stats.sendCalls += reqStats.sendCalls
+			stats.latency.add(end-reqStats.start)
+			if reqStats.firstByte != None and reqStats.sendStart != None:
+				stats.ttfb.add(reqStats.firstByte-reqStats.sendStart)
+
+	# Prints a summary table (one line per endpoint)
+	def writeTable(self, out):
+		# imported here as rocker.rocker itself imports this module
+		from rocker.rocker import formatBytes
+
+		rows = [('METHOD', 'ENDPOINT', 'COUNT', 'SENT', 'RECEIVED', 'SENDS', 'WAITS', 'TTFB p50', 'p50', 'p99', 'MAX')]
+
+		endpoints = self.getEndpoints()
+		for key in sorted(endpoints.keys(), key=lambda k: (k[1], k[0])):
+			stats = endpoints[key]
+			rows.append((key[0], key[1], str(stats.count), formatBytes(stats.bytesSent), formatBytes(stats.bytesReceived),
+				str(stats.sendCalls), str(stats.selectWaits), _formatTime(stats.ttfb.getQuantile(.5)),
+				_formatTime(stats.latency.getQuantile(.5)), _formatTime(stats.latency.getQuantile(.99)), _formatTime(stats.latency.getMax())))
+
+		widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+		for row in rows:
+			cols = []
+			for i, col in enumerate(row):
+				if i < 2:
+					cols.append(col.ljust(widths[i])) # left align the method and endpoint
+				else:
+					cols.append(col.rjust(widths[i]))
+			out.write('  '.join(cols).rstrip()+'\n')
+
+	# Writes the metrics in Prometheus' text exposition format
+	#
+	# The file is replaced atomically (so collectors never read half written files)
+	def writeTextfile(self, path):
+		counters = [
+			('requests_total', "Number of Docker API requests", 'count'),
+			('sent_bytes_total', "Bytes sent to the Docker daemon", 'bytesSent'),
+			('received_bytes_total', "Bytes received from the Docker daemon", 'bytesReceived'),
+			('send_calls_total', "Number of send() calls", 'sendCalls'),
+			('select_waits_total', "Number of times rocker waited for the socket using select()", 'selectWaits')
+		]
+		histograms = [
+			('ttfb_seconds', "Time from sending a request to receiving the first response byte", 'ttfb'),
+			('duration_seconds', "Total request latency (from connecting to closing the connection)", 'latency')
+		]
+
+		endpoints = self.getEndpoints()
+		keys = sorted(endpoints.keys(), key=lambda k: (k[1], k[0]))
+		out = []
+
+		for name, helpText, attr in counters:
+			out.append("# HELP rocker_http_{0} {1}\n# TYPE rocker_http_{0} counter\n".format(name, helpText))
+			for key in keys:
+				out.append("rocker_http_{0}{{{1}}} {2}\n".format(name, _formatLabels(key), getattr(endpoints[key], attr)))
+
+		for name, helpText, attr in histograms:
+			out.append("# HELP rocker_http_{0} {1}\n# TYPE rocker_http_{0} histogram\n".format(name, helpText))
+			for key in keys:
+				hist = getattr(endpoints[key], attr)
+				labels = _formatLabels(key)
+				total = 0
+				for bound, count in hist.getBuckets():
+					total += count
+					out.append("rocker_http_{0}_bucket{{{1},le=\"{2:g}\"}} {3}\n".format(name, labels, bound, total))
+				out.append("rocker_http_{0}_bucket{{{1},le=\"+Inf\"}} {2}\n".format(name, labels, hist.getCount()))
+				out.append("rocker_http_{0}_sum{{{1}}} {2:g}\n".format(name, labels, hist.getSum()))
+				out.append("rocker_http_{0}_count{{{1}}} {2}\n".format(name, labels, hist.getCount()))
+
+		tmpPath = '{0}.{1}.tmp'.format(path, os.getpid())
+		with open(tmpPath, 'w') as f:
+			f.write(''.join(out))
+		os.replace(tmpPath, path)
+
+_registry = None
+
+# Starts collecting metrics
+#
+# Can be called more than once (e.g. for --stats and --stats-file), the options
+# will be merged
+def enable(printTable=False, textfilePath=None):
+	global _registry
+	if _registry == None:
+		_registry = Registry()
+
+	if printTable:
+		_registry.printTable = True
+	if textfilePath != None:
+		_registry.textfilePath = textfilePath
+	return _registry
+
+# Prints/writes the collected metrics (as requested in enable()) and stops collecting them
+def finish(out=None):
+	global _registry
+	registry = _registry
+	_registry = None
+
+	if registry != None:
+		if registry.printTable:
+			registry.writeTable(out or sys.stderr)
+		if registry.textfilePath != None:
+			registry.writeTextfile(registry.textfilePath)
+
+def getRegistry():
+	return _registry
+
+# Returns a new RequestStats object (or None if metrics are disabled)
+def newRequestStats():
+	if _registry == None:
+		return None
+	return RequestStats()
+
+# Adds a finished request's stats to the registry (if metrics are still enabled)
+def record(method, path, reqStats):
+	registry = _registry
+	if registry != None and reqStats != None:
+		registry.record(method, path, reqStats)
+
+# Returns the endpoint template for the given request path (without API version prefix)
+#
+# Object names/IDs are replaced with '{}' and the query string is dropped, e.g.:
+# - '/containers/myApp/json?size=1' -> '/containers/{}/json'
+# - '/images/library/debian/json' -> '/images/{}/json' (image names may contain slashes)
+# - '/containers/json' -> '/containers/json'
+def getEndpoint(path):
+	if path == None:
+		return None
+
+	parts = path.split('?', 1)[0].strip('/').split('/')
+
+	if parts[0] in _ID_RESOURCES:
+		if len(parts) >= 3:
+			parts = [parts[0], '{}', parts[-1]]
+		elif len(parts) == 2 and not parts[1] in _COLLECTION_ACTIONS:
+			parts[1] = '{}'
+
+	return '/'+'/'.join(parts)
+
+def _formatLabels(key):
+	return 'method="{0}",endpoint="{1}"'.format(key[0], key[1])
+
+def _formatTime(seconds):
+	if seconds == None:
+		return '-'
+	return "{0:.1f}ms".format(seconds*1000)
@@ -0,0 +1,252 @@
+from rocker import image
+from rocker.container import Container
+from rocker.rocker import formatBytes, getDefault, getErrorMessage, runParallel
+
+import os
+import threading
+import time
+
+# Pulling missing images before anything's built or deployed
+#
+# container.run() pulls missing images lazily (one at a time, whenever it reaches a
+# container whose image is missing) and `docker build` pulls missing base images
+# itself. On a fresh host, all of these pulls would happen one after the other.
+#
+# prefetch collects the images all the given containers (and their dependencies) need
+# up front - their 'image' (unless it's built by the project) and the external base
+# images (and cacheFrom images, see image.BuildOptions) of the project's Dockerfiles -
+# and pulls the missing ones concurrently (up to `parallel` at a time), printing a
+# single aggregated progress line.
+#
+# Failed pulls only produce a warning (the regular code path will try again and fail
+# with a proper error message if the image's really needed).
+
+DEFAULT_PARALLEL = 4
+
+# Aggregated progress of several concurrent pulls (in text output mode)
+#
+# On a terminal, a single status line is redrawn (at most `fps` times per second),
+# otherwise one line is printed per finished image.
+class PullProgress:
+	def __init__(self, images, stream, fps=10, clock=time.monotonic):
+		self._stream = stream
+		self._isTty = hasattr(stream, 'isatty') and stream.isatty()
+		self._interval = 1.0/fps
+		self._clock = clock
+
+		self._lock = threading.Lock()
+		self._count = len(images)
+		self._done = 0
+		self._layers = {} # (image, layerId) -> [current, total]
+		self._lastFrame = None
+
+	# Draws the final state
+	def finish(self):
+		with self._lock:
+			if self._isTty and self._lastFrame != None:
+				self._stream.write('\r\033[K{0}\n'.format(self._getStatus()))
+				self._stream.flush()
+
+	# Returns a renderer for image.pull() (see Rocker.printDockerOutput())
+	def forImage(self, name):
+		return _ImageProgress(self, name)
+
+	# Marks an image as done (called by _ImageProgress.finish())
+	def _imageDone(self, name):
+		with self._lock:
+			self._done += 1
+			if not self._isTty:
+				self._stream.write("Pulled image: {0} ({1}/{2})\n".format(name, self._done, self._count))
+				self._stream.flush()
+			else:
+				self._draw(force=True)
+
+	# Processes a progress message of one of the images
+	def _update(self, name, msgJson):
+		if not 'id' in msgJson:
+			return
+
+		detail = msgJson.get('progressDetail') or {}
+		with self._lock:
+			layer = self._layers.setdefault((name, msgJson['id']), [0, 0])
+			if 'total' in detail:
+				layer[0] = detail.get('current', 0)
+				layer[1] = max(layer[1], detail['total'])
+			elif msgJson.get('status') in ['Download complete', 'Pull complete', 'Already exists']:
+				layer[0] = layer[1]
+
+			if self._isTty:
+				self._draw()
+
+	# caller needs to hold self._lock
+	def _draw(self, force=False):
+		now = self._clock()
+		if not force and self._lastFrame != None and now - self._lastFrame < self._interval:
+			return # next frame isn't due yet
+
+		self._stream.write('\r\033[K{0}'.format(self._getStatus()))
+		self._stream.flush()
+		self._lastFrame = now
+
+	# caller needs to hold self._lock
+	def _getStatus(self):
+		current = sum(layer[0] for layer in self._layers.values())
+		total = sum(layer[1] for layer in self._layers.values())
+		return "Pulling images: {0}/{1} done, {2} of {3}".format(self._done, self._count, formatBytes(current), formatBytes(total))
+
+# Renderer passed to image.pull() (forwards the messages of one image to its PullProgress)
+class _ImageProgress:
+	__slots__ = ['_error', '_name', '_progress']
+
+	def __init__(self, progress, name):
+		self._error = None
+		self._name = name
+		self._progress = progress
+
+	def finish(self):
+		if self._error == None:
+			self._progress._imageDone(self._name)
+
+	def getError(self):
+		return self._error
+
+	def update(self, msgJson):
+		if 'error' in msgJson:
+			self._error = msgJson['error']
+		else:
+			self._progress._update(self._name, msgJson)
+
+# Returns the images needed by the given containers (and their dependencies, in
+# alphabetical order)
+#
+# Images built by the project aren't included themselves, but their external base
+# images and cacheFrom images are.
+def findImages(containerNames, r=None):
+	if r == None:
+		r = getDefault()
+
+	rc = []
+	seenContainers = set()
+	seenImages = set()
+
+	def addImage(name):
+		if name in seenImages:
+			return
+		seenImages.add(name)
+
+		if image.existsInProject(name):
+			for parent in _getBaseImages(name) + image.BuildOptions.fromFile(name, r).cacheFrom:
+				addImage(parent)
+		else:
+			rc.append(name)
+
+	def addContainer(name):
+		if name in seenContainers:
+			return
+		seenContainers.add(name)
+
+		config = Container.fromRockerFile(name, r=r)
+		addImage(config.getImage())
+		for d in sorted(config.getDependencies()):
+			addContainer(d)
+
+	for name in containerNames:
+		addContainer(name)
+	return rc
+
+# Returns the images docker doesn't have yet
+#
+# The local images are listed with a single request. Names that can't be matched
+# against the image tags (e.g. 'image@sha256:...') are inspected.
+def findMissing(images, r=None):
+	if r == None:
+		r = getDefault()
+
+	tags = set()
+	for img in image.list(r):
+		tags.update(img.repoTags or [])
+
+	rc = []
+	for name in images:
+		repo, tag = image.splitTag(name)
+		if '{0}:{1}'.format(repo, tag) in tags:
+			continue
+		if '@' in name and image.inspect(name, r) != None:
+			continue
+		rc.append(name)
+	return rc
+
+# Pulls the given images (up to `parallel` at a time)
+#
+# Returns a dict containing the error message for each image that couldn't be pulled
+def pullAll(images, parallel=DEFAULT_PARALLEL, r=None):
+	if r == None:
+		r = getDefault()
+
+	rc = {}
+	if len(images) == 0:
+		return rc
+
+	progress = None
+	if r.getOutputMode() != 'jsonl':
+		progress = PullProgress(images, r.getOutputStream())
+
+	def pull(name):
+		if progress != None:
+			renderer = progress.forImage(name)
+			image.pull(name, r, renderer)
+			if renderer.getError() != None:
+				rc[name] = renderer.getError()
+		else:
+			# jsonl mode: each pull emits its own events
+			with r.lane(name) as lr:
+				image.pull(name, lr)
+
+	for name, e in runParallel(images, pull, parallel, 'pull').items():
+		rc[name] = getErrorMessage(e)
+
+	if progress != None:
+		progress.finish()
+	return rc
+
+# Pulls the images needed by the given containers that docker doesn't have yet
+#
+# Returns the list of pulled images
+def run(containerNames, parallel=DEFAULT_PARALLEL, r=None):
+	if r == None:
+		r = getDefault()
+
+	missing = findMissing(findImages(containerNames, r), r)
+	if len(missing) == 0:
+		r.debug(1, "All the images are there, nothing to pull")
+		return []
+
+	r.info("Pulling {0} missing image{1}: {2}".format(len(missing), '' if len(missing) == 1 else 's', ', '.join(missing)))
+	errors = pullAll(missing, parallel, r)
+	for name, msg in errors.items():
+		r.warning("Couldn't pull image {0}: {1}".format(name, msg))
+
+	r.invalidateCache()
+	return [name for name in missing if name not in errors]
+
+# Returns the external base images of a project image (i.e. its FROM lines, skipping
+# 'scratch', references to earlier build stages and names containing build args)
+def _getBaseImages(imagePath):
+	rc = []
+	stages = set()
+
+	with open(os.path.join(imagePath, 'Dockerfile'), 'r') as f:
+		for line in f.readlines():
+			words = line.split()
+			if len(words) < 2 or words[0].upper() != 'FROM':
+				continue
+			words = [w for w in words[1:] if not w.startswith('--')] # e.g. --platform=...
+			if len(words) == 0:
+				continue
+
+			name = words[0]
+			if name != 'scratch' and not name in stages and not '$' in name and not name in rc:
+				rc.append(name)
+			if len(words) >= 3 and words[1].upper() == 'AS':
+				stages.add(words[2])
+	return rc
@@ -0,0 +1,137 @@
+import contextlib
+import sys
+import threading
+import time
+
+# Profiling support for rocker commands (--profile=cprofile|sample)
+#
+# - 'cprofile' runs the command using cProfile and writes a .pstats file
+#   (use `python3 -m pstats FILE` or snakeviz to analyze it).
+#   Note that cProfile only sees the thread the command is running in.
+# - 'sample' starts a background thread taking a snapshot of all the other threads'
+#   call stacks every SAMPLE_INTERVAL seconds. The result is written in the
+#   'collapsed stack' format (one line per distinct stack, e.g.
+#   'MainThread;rocker.run;rocker.container.run 12'), which can be turned into a
+#   flame graph using flamegraph.pl, speedscope or inferno.
+#
+# Profiles are scoped to the command's execution (see rocker.execute()) and are
+# written to 'rocker-<command>-<timestamp>.<ext>' unless --profile-out=FILE was given.
+MODES = {'cprofile': 'pstats', 'sample': 'folded'}
+
+SAMPLE_INTERVAL = .005
+
+# Stack sampler (see 'sample' mode above)
+class Sampler:
+	def __init__(self, interval=SAMPLE_INTERVAL):
+		self._interval = interval
+		self._stacks = {}
+		self._stop = threading.Event()
+		self._thread = None
+
+	def getSampleCount(self):
+		return sum(self._stacks.values())
+
+	# Returns the collapsed stacks (dict with 'frame;frame;frame' keys and sample counts as values)
+	def getStacks(self):
+		return dict(self._stacks)
+
+	def start(self):
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		self._thread.join()
+
+	# Writes the collapsed stacks to the given file
+	def save(self, path):
+		with open(path, 'w') as f:
+			for stack, count in sorted(self._stacks.items()):
+				f.write("{0} {1}\n".format(stack, count))
+
+	# Takes a snapshot of all threads' stacks (except the sampler's own)
+	def sample(self):
+		threadNames = {}
+		for t in threading.enumerate():
+			threadNames[t.ident] = t.name
+
+		for tid, frame in sys._current_frames().items():
+			if tid == threading.get_ident():
+				continue
+
+			stack = []
+			while frame != None:
+				stack.append(Sampler._getFrameName(frame))
+				frame = frame.f_back
+			stack.append(threadNames.get(tid, str(tid)))
+			stack.reverse()
+
+			key = ';'.join(stack)
+			self._stacks[key] = self._stacks.get(key, 0) + 1
+
+	def _run(self):
+		while not self._stop.wait(self._interval):
+			self.sample()
+
+	@staticmethod
+	def _getFrameName(frame):
+		code = frame.f_code
+		module = frame.f_globals.get('__name__', '?')
+		# ';' separates frames and ' ' the sample count => replace them
+		return "{0}.{1}".format(module, code.co_name).replace(';', ':').replace(' ', '_')
+
+_mode = None
+_outPath = None
+
+# Enables profiling for the next command (mode is one of MODES' keys)
+def enable(mode):
+	global _mode
+	if not mode in MODES:
+		raise ValueError("Unsupported profile mode: '{0}' (expected one of: {1})".format(mode, ', '.join(sorted(MODES.keys()))))
+	_mode = mode
+
+def getMode():
+	return _mode
+
+# Sets the profile's output file (defaults to rocker-<command>-<timestamp>.<ext>)
+def setOutputPath(path):
+	global _outPath
+	_outPath = path
+
+# Profiles the code inside the 'with' block (if profiling was enabled) and writes
+# the result when it's done
+#
+# Profiling will be disabled afterwards (i.e. the profile only covers one command)
+@contextlib.contextmanager
+def session(commandName):
+	global _mode, _outPath
+	mode, path = _mode, _outPath
+	_mode = _outPath = None
+
+	if mode == None:
+		yield
+		return
+
+	if path == None:
+		path = 'rocker-{0}-{1}.{2}'.format(commandName or 'none', time.strftime('%Y%m%d-%H%M%S'), MODES[mode])
+
+	if mode == 'cprofile':
+		import cProfile
+		prof = cProfile.Profile()
+		prof.enable()
+		try:
+			yield
+		finally:
+			prof.disable()
+			prof.dump_stats(path)
+			sys.stderr.write("Profile written to '{0}'\n".format(path))
+	else:
+		sampler = Sampler()
+		sampler.start()
+		try:
+			yield
+		finally:
+			sampler.stop()
+			sampler.save(path)
+			sys.stderr.write("Profile written to '{0}' ({1} samples)\n".format(path, sampler.getSampleCount()))
@@ -1,9 +1,12 @@
 
+from rocker import metrics, trace
+
 import codecs
 import json
 import select
 import socket
 import sys
+import threading
 import time
 import urllib.parse
 
@@ -35,19 +38,43 @@ class Request:
 	#
 	# Note that HTTP and HTTPS aren't implemented yet (feel free to provide a
 	# patch/merge request).
-	def __init__(self, url):
-		url = urllib.parse.urlsplit(url)
-
+	#
+	# If pathPrefix is set, it will be prepended to all request paths (e.g. '/v1.24'
+	# to use a specific Docker API version)
+	#
+	# If pool (a ConnectionPool) is set, an idle connection from the pool will be used
+	# (if there is one) and close() will return it to the pool if it can be reused
+	def __init__(self, url, pathPrefix='', pool=None):
+		self._serverUrl = url
 		self._headers = {}
 		self._headerKeys = {}
 		self._chunked = False
 		self._headersSent = False
 		self._method = None
 		self._url = None
+		self._pathPrefix = pathPrefix
 		self._reqBodyPos = 0
+		self._stats = metrics.newRequestStats() # None unless metrics are enabled (--stats)
+		self._pool = pool
+		self._response = None
+		self._closed = False
 
 		self.setHeader("User-agent", "rocker v0.1") # TODO use the real rocker version
 
+		sock = None
+		if pool != None:
+			sock = pool.get(url)
+		self._reused = sock != None
+		if sock == None:
+			sock = self._connect()
+
+		self._rawSock = sock
+		self._sock = ChunkReader(BufferedReader(sock, self._stats))
+
+	# Opens a new connection to the server (and returns the socket)
+	def _connect(self):
+		url = urllib.parse.urlsplit(self._serverUrl)
+
 		try:
 			if url.scheme == 'unix':
 				sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -65,7 +92,7 @@ class Request:
 
 #		sock.setblocking(0)
 
-		self._sock = ChunkReader(BufferedReader(sock))
+		return sock
 
 	# 'with' statement implementation
 	# simply returns self
@@ -95,25 +122,47 @@ class Request:
 		self._headersSent = True
 
 	# Closes the underlying socket
+	#
+	# If the Request uses a ConnectionPool and the whole response has been read, the
+	# connection is returned to the pool instead.
+	# If metrics are enabled, the request's stats will be recorded
 	def close(self):
-		self._sock.close()
+		if self._closed:
+			return
+		self._closed = True
+
+		if self._pool != None and self._response != None and self._response.isReusable():
+			self._pool.put(self._serverUrl, self._rawSock)
+		else:
+			self._sock.close()
+
+		if self._stats != None and self._method != None:
+			metrics.record(self._method, self._url[len(self._pathPrefix):], self._stats)
+			self._stats = None
 
 	def doDelete(self, url):
 		self._method = "DELETE"
-		self._url = url
+		self._url = self._pathPrefix + url
 		return self
 
 	# Specifies the url for this GET request
 	def doGet(self, url):
 		self._method = "GET"
-		self._url = url
+		self._url = self._pathPrefix + url
 
 		return self
 
 	# Specifies the url for this POST request
 	def doPost(self, url):
 		self._method = "POST"
-		self._url = url
+		self._url = self._pathPrefix + url
+
+		return self
+
+	# Specifies the url for this PUT request
+	def doPut(self, url):
+		self._method = "PUT"
+		self._url = self._pathPrefix + url
 
 		return self
 
@@ -147,7 +196,45 @@ class Request:
 	# This method will send the headers if that hasn't happened yet,
 	# send data if not in chunked mode and then return a Response
 	# object using the underlying socket
+	#
+	# The span recorded for --trace covers sending the request and waiting for the
+	# response headers (i.e. the time to first byte)
+	#
+	# If a pooled connection turns out to have been closed by the server in the meantime,
+	# the request is sent again using a new one (unless its body has been streamed already)
 	def send(self, data=None):
+		with trace.span('send', cat='http', method=self._method, url=self._url):
+			try:
+				self._sendRequest(data)
+				self._response = Response(self._sock)
+			except (OSError, SocketError):
+				if not self._reused or self._chunked:
+					raise
+
+				self._sock.close()
+				self._reused = False
+				self._rawSock = self._connect()
+				self._sock = ChunkReader(BufferedReader(self._rawSock, self._stats))
+				self._headersSent = False
+
+				self._sendRequest(data)
+				self._response = Response(self._sock)
+
+			return self._response
+
+	# Sends the request without waiting for the response
+	#
+	# Meant for multiplexing a lot of (streaming) requests over a single event loop
+	# (see rocker.stats): Register the Request with a selector (it provides fileno()),
+	# pass the data recvAvailable() returns to a ResponseParser and close() the Request
+	# when you're done.
+	def sendAsync(self, data=None):
+		self._sendRequest(data)
+
+	def _sendRequest(self, data):
+		if self._stats != None:
+			self._stats.sendStart = time.perf_counter()
+
 		if data != None:
 			if self._chunked:
 				raise Exception("data can't be set when in chunked mode")
@@ -157,16 +244,25 @@ class Request:
 
 			self.setHeader("Content-type", "application/json")
 			self.setHeader("Content-length", str(len(data)))
-		elif self._chunked:
-			# send final chunk
-			self._sock.send(b'0\r\n\r\n')
 
+		# the headers might not have been sent yet (if write() was never called)
 		self._sendHeaders()
 
 		if data != None:
 			self._sock.send(data)
+		elif self._chunked:
+			# send final chunk
+			self._sock.send(b'0\r\n\r\n')
 
-		return Response(self._sock)
+	def fileno(self):
+		return self._sock.fileno()
+
+	# Returns the raw response data that's available right now (at most `length` bytes,
+	# use it after sendAsync() once the socket's readable)
+	#
+	# Returns an empty result if the connection was closed
+	def recvAvailable(self, length=64*1024):
+		return self._sock.recvAvailable(length)
 
 	# Returns the number of bytes already written in the request body
 	#
@@ -181,6 +277,8 @@ class Request:
 
 		# make sure we can actually write data
 		select.select([], [self._sock], [])
+		if self._stats != None:
+			self._stats.selectWaits += 1
 
 		self._sendHeaders()
 		self._sock.send("{0:x}\r\n".format(len(data)).encode('ascii'))
@@ -188,6 +286,23 @@ class Request:
 		self._sock.send(b"\r\n")
 		self._reqBodyPos += len(data)
 
+	# Write `count` bytes of a file (starting at its current position) as request body
+	# chunk (in chunked mode)
+	#
+	# The data is copied by the kernel using sendfile() (where available), so it never
+	# passes through Python
+	def writeFile(self, f, count):
+		if not self._chunked:
+			raise Exception("Request.writeFile() only works in chunked mode!")
+		if count == 0:
+			return
+
+		self._sendHeaders()
+		self._sock.send("{0:x}\r\n".format(count).encode('ascii'))
+		self._sock.sendfile(f, f.tell(), count)
+		self._sock.send(b"\r\n")
+		self._reqBodyPos += count
+
 # Represents a HTTP response
 #
 # Response objects are created by Request.send().
@@ -207,8 +322,14 @@ class Response:
 
 		self.__parseContentType()
 
+		# body bytes readInto() hasn't returned yet (None: unknown)
+		self._remaining = None
 		if self.isChunked():
 			self._sock.enableChunkedMode()
+		elif 'Content-Length' in self:
+			self._remaining = int(self.getHeader('Content-Length'))
+		elif self._status == 204:
+			self._remaining = 0 # no content
 
 	# 'in' operator.
 	# This method will return true if a response header with the given name exists
@@ -235,7 +356,7 @@ class Response:
 		#
 		# JSON however uses a default charset of utf8
 		if 'Content-Type' not in self:
-			if self._status == 204: # no content
+			if self._status == 204 or ('Content-Length' in self and self.getHeader('Content-Length').strip() == '0'): # no content
 				self._contentType = None
 				self._charset = None
 				return
@@ -306,7 +427,7 @@ class Response:
 			data = None
 			if 'content-length' in self:
 				dataLen = int(self.getHeader('content-length'))
-				data = self._sock.recv(dataLen)
+				data = self._sock.readExactly(dataLen)
 			else:
 				data = self._headers
 
@@ -372,6 +493,7 @@ class Response:
 			raise Exception("readAll() can't be used in chunked mode!")
 		count = int(self.getHeader('Content-length'))
 		rc = self._sock.readExactly(count)
+		self._remaining = 0
 
 		return str(rc, self._charset)
 
@@ -389,16 +511,46 @@ class Response:
 
 		return rc
 
+	# Reads (binary) response body data directly into buffer (e.g. a bytearray or memoryview)
+	#
+	# Blocks until data is available. Returns the number of bytes read (0 at the end of
+	# the response body). Works in both chunked and normal mode (but don't mix it with
+	# readChunk() or readAll()).
+	def readInto(self, buffer):
+		if self._remaining != None:
+			# don't wait for more data than the server announced
+			if self._remaining == 0:
+				return 0
+			buffer = memoryview(buffer).cast('B')[:self._remaining]
+
+		rc = self._sock.readInto(buffer)
+		if self._remaining != None:
+			self._remaining -= rc
+		return rc
+
 	# Reads the next line from the underlying socket
 	def readLine(self):
 		return str(self._sock.readLine(), self._charset)
 
+	# Returns True if the connection can be used for another request (i.e. the whole
+	# response body has been read and the server didn't ask us to close the connection)
+	def isReusable(self):
+		if 'Connection' in self and self.getHeader('Connection').strip().lower() == 'close':
+			return False
+		elif self.isChunked():
+			return self._sock._eof
+		return self._remaining == 0
+
 # Wraps around the socket to provide readline() and unrecv()
 class BufferedReader:
 	# source is a file-like object
-	def __init__(self, source):
+	#
+	# If stats (a metrics.RequestStats object) is set, the bytes sent/received,
+	# send() calls and select() waits will be counted
+	def __init__(self, source, stats=None):
 		self._source = source
 		self._buffer = None
+		self._stats = stats
 
 	def close(self):
 		self._source.close()
@@ -431,9 +583,57 @@ class BufferedReader:
 		else:
 			if self.wait(2):
 				rc += self._source.recv(length)
+				if len(rc) == 0:
+					# the socket is readable, but there's no data => EOF
+					raise SocketError("Connection closed by remote host")
+
+				if self._stats != None:
+					self._stats.bytesReceived += len(rc)
+					if self._stats.firstByte == None:
+						self._stats.firstByte = time.perf_counter()
 
 		return rc
 
+	# Reads data directly into buffer (a writable bytes-like object), blocking until
+	# data is available
+	#
+	# Returns the number of bytes read (0 if the connection was closed)
+	def recvInto(self, buffer):
+		if self._buffer != None and len(self._buffer) > 0:
+			# readahead buffer first
+			rc = min(len(buffer), len(self._buffer))
+			buffer[:rc] = self._buffer[:rc]
+			self._buffer = self._buffer[rc:] if rc < len(self._buffer) else None
+			return rc
+
+		while not self.wait():
+			pass
+		rc = self._source.recv_into(buffer)
+
+		if self._stats != None:
+			self._stats.bytesReceived += rc
+			if self._stats.firstByte == None:
+				self._stats.firstByte = time.perf_counter()
+
+		return rc
+
+	# Returns the data that's available right now (readahead buffer first)
+	#
+	# Unlike recv(), this method won't wait for the socket and returns an empty
+	# result on EOF (so only call it when the socket's readable)
+	def recvAvailable(self, length):
+		if self._buffer != None and len(self._buffer) > 0:
+			rc = self._buffer[:length]
+			self._buffer = self._buffer[length:] or None
+			return rc
+
+		rc = self._source.recv(length)
+		if self._stats != None and len(rc) > 0:
+			self._stats.bytesReceived += len(rc)
+			if self._stats.firstByte == None:
+				self._stats.firstByte = time.perf_counter()
+		return rc
+
 	# Reads exactly length bytes from the socket
 	#
 	# May block indefinitely
@@ -478,6 +678,17 @@ class BufferedReader:
 	def send(self, data):
 		self._source.send(data)
 
+		if self._stats != None:
+			self._stats.sendCalls += 1
+			self._stats.bytesSent += len(data)
+
+	def sendfile(self, f, offset, count):
+		self._source.sendfile(f, offset, count)
+
+		if self._stats != None:
+			self._stats.sendCalls += 1
+			self._stats.bytesSent += count
+
 	# Push data onto the readahead buffer (which is checked by read())
 	def unrecv(self, data):
 		if self._buffer != None:
@@ -499,6 +710,8 @@ class BufferedReader:
 			return True
 
 		inputs,_,_ = select.select([self._source.fileno()], [], [], timeout)
+		if self._stats != None:
+			self._stats.selectWaits += 1
 		return len(inputs) > 0
 
 # HTTP chunked response implementation
@@ -507,8 +720,12 @@ class ChunkReader:
 		self._source = source
 		self._chunked = False
 
+		# readInto() state (it might return partial chunks)
+		self._chunkRemaining = 0
+		self._eof = False
+
 	def close(self):
-		self._source.close
+		self._source.close()
 
 	def enableChunkedMode(self):
 		self._chunked = True
@@ -544,6 +761,39 @@ class ChunkReader:
 		# We'll return None instead of an empty string
 		if rc == b'':
 			rc = None # indicates EOT
+			self._eof = True
+
+		return rc
+
+	# Reads response body data into buffer (without the chunk headers in chunked mode)
+	#
+	# Returns the number of bytes read (0 at the end of the body)
+	def readInto(self, buffer):
+		buffer = memoryview(buffer).cast('B')
+
+		if not self._chunked:
+			return self._source.recvInto(buffer)
+
+		if self._chunkRemaining == 0:
+			if self._eof:
+				return 0
+
+			length = int(self._source.readLine(), 16)
+			if length == 0:
+				self._source.readExactly(2) # final \r\n
+				self._eof = True
+				return 0
+			self._chunkRemaining = length
+
+		rc = self._source.recvInto(buffer[:self._chunkRemaining])
+		if rc == 0:
+			raise SocketError("Connection closed by remote host")
+
+		self._chunkRemaining -= rc
+		if self._chunkRemaining == 0:
+			chunkEnd = self._source.readExactly(2)
+			if chunkEnd != b'\r\n':
+				raise Exception("Got invalid chunk end mark: {0} (expected {1})".format(codecs.encode(chunkEnd, 'hex'), codecs.encode(b'\r\n', 'hex')))
 
 		return rc
 
@@ -561,12 +811,177 @@ class ChunkReader:
 		else:
 			raise IOError("readLine() not allowed in chunked mode!")
 
+	# socket style recv_into() (Response wraps the Request's ChunkReader in another BufferedReader)
+	def recv_into(self, buffer):
+		if not self._chunked:
+			return self._source.recvInto(buffer)
+		else:
+			raise IOError("recv_into() not allowed in chunked mode!")
+
+	# Returns the raw data that's available right now (see BufferedReader.recvAvailable())
+	def recvAvailable(self, length):
+		return self._source.recvAvailable(length)
+
 	def send(self, data):
 		self._source.send(data)
 
+	def sendfile(self, f, offset, count):
+		self._source.sendfile(f, offset, count)
+
 	def wait(self, timeout=2):
 		return self._source.wait(timeout)
 
+# Keeps idle (keep-alive) connections around so later Requests can reuse them
+#
+# Only used by long running processes (i.e. `rocker serve`). Connections are only
+# returned to the pool if their response has been read completely (see Request.close()),
+# so streaming requests (events, logs, stats, ...) always get their own.
+class ConnectionPool:
+	def __init__(self, maxIdle=4):
+		self._maxIdle = maxIdle # per URL
+		self._idle = {} # url -> list of sockets
+		self._lock = threading.Lock()
+
+	# Closes all idle connections
+	def close(self):
+		with self._lock:
+			for socks in self._idle.values():
+				for sock in socks:
+					sock.close()
+			self._idle = {}
+
+	# Returns an idle connection to the given URL (or None if there is none)
+	def get(self, url):
+		with self._lock:
+			socks = self._idle.get(url) or []
+			while len(socks) > 0:
+				sock = socks.pop()
+
+				# idle connections shouldn't be readable (if they are, the server has closed them)
+				readable,_,_ = select.select([sock], [], [], 0)
+				if len(readable) == 0:
+					return sock
+				sock.close()
+
+		return None
+
+	# Returns a connection to the pool (or closes it if there are enough idle ones)
+	def put(self, url, sock):
+		with self._lock:
+			socks = self._idle.setdefault(url, [])
+			if len(socks) < self._maxIdle:
+				socks.append(sock)
+				return
+
+		sock.close()
+
+# Incremental HTTP response parser (for responses read using Request.recvAvailable())
+#
+# feed() accepts the raw response data in pieces of any size and returns the
+# (dechunked) body data parsed so far. Headers are available as soon as they've
+# been parsed (check getStatus() != None).
+#
+# Unlike Response, ResponseParser doesn't raise HttpResponseError (check getStatus()).
+class ResponseParser:
+	def __init__(self):
+		self._buffer = bytearray()
+		self._headers = None
+		self._headerKeys = {}
+		self._status = None
+		self._chunked = False
+		self._remaining = None # bytes left in the current chunk (or body), None: until EOF
+		self._state = 'headers' # headers -> (size -> data -> dataEnd)* -> size -> end -> done (or headers -> data -> done)
+		self._eof = False
+
+	# Parses the given response data and returns a list of body data pieces
+	#
+	# Pass an empty result (i.e. EOF) to tell the parser the connection was closed.
+	def feed(self, data):
+		rc = []
+		if len(data) == 0:
+			self._eof = True
+			if self._state == 'data' and self._remaining == None:
+				self._state = 'done'
+			return rc
+
+		buff = self._buffer
+		buff += data
+
+		while len(buff) > 0 and self._state != 'done':
+			if self._state == 'headers':
+				pos = buff.find(b'\r\n\r\n')
+				if pos < 0:
+					break
+				self._parseHeaders(bytes(buff[:pos]))
+				del buff[:pos+4]
+			elif self._state == 'size':
+				pos = buff.find(b'\r\n')
+				if pos < 0:
+					break
+				self._remaining = int(buff[:pos].split(b';', 1)[0], 16)
+				del buff[:pos+2]
+				self._state = 'data' if self._remaining > 0 else 'end'
+			elif self._state == 'data':
+				count = len(buff) if self._remaining == None else min(self._remaining, len(buff))
+				rc.append(bytes(buff[:count]))
+				del buff[:count]
+				if self._remaining != None:
+					self._remaining -= count
+					if self._remaining == 0:
+						self._state = 'dataEnd' if self._chunked else 'done'
+			elif self._state in ['dataEnd', 'end']:
+				if len(buff) < 2:
+					break
+				if buff[:2] != b'\r\n':
+					raise Exception("Got invalid chunk end mark: {0} (expected {1})".format(codecs.encode(bytes(buff[:2]), 'hex'), codecs.encode(b'\r\n', 'hex')))
+				del buff[:2]
+				self._state = 'done' if self._state == 'end' else 'size'
+
+		return rc
+
+	# Get a response header (key is case insensitive, returns None if there's no such header)
+	def getHeader(self, key):
+		key = key.lower()
+		if key not in self._headerKeys:
+			return None
+		return self._headers[self._headerKeys[key]]
+
+	# Returns the response status (or None if the headers haven't been parsed yet)
+	def getStatus(self):
+		return self._status
+
+	# Returns True once the whole response has been parsed (or the connection was closed)
+	def isDone(self):
+		return self._state == 'done' or self._eof
+
+	def _parseHeaders(self, data):
+		lines = data.split(b'\r\n')
+
+		status = lines[0].split(b' ', 2)
+		if len(status) < 2:
+			raise Exception("Malformed response status: {0}".format(lines[0]))
+		self._status = int(status[1])
+
+		self._headers = {}
+		for line in lines[1:]:
+			colonPos = line.find(b':')
+			if colonPos < 0:
+				raise Exception("Malformed response header line: {0}".format(line))
+			key = str(line[:colonPos].strip(), 'ascii')
+			self._headers[key] = str(line[colonPos+1:].strip(), 'utf-8')
+			self._headerKeys[key.lower()] = key
+
+		if (self.getHeader('Transfer-Encoding') or '').lower() == 'chunked':
+			self._chunked = True
+			self._state = 'size'
+		elif self.getHeader('Content-Length') != None:
+			self._remaining = int(self.getHeader('Content-Length'))
+			self._state = 'data' if self._remaining > 0 else 'done'
+		elif self._status in [204, 304]:
+			self._state = 'done'
+		else:
+			self._state = 'data' # read until EOF
+
 # Will be raised if the REST server responds with a code other than 200 (Ok)
 class HttpResponseError(Exception):
 	def __init__(self, message, code, data):
@@ -1,13 +1,36 @@
-from distutils.version import StrictVersion
-from rocker.restclient import Request, SocketError
+from rocker import metrics, profiler, trace
+from rocker.restclient import HttpResponseError, Request, SocketError
 
+import contextlib
+import copy
 import getopt
 import json
 import os
-import pkg_resources
+import queue
+import shutil
 import sys
+import threading
+import time
 
 MIN_LABELS_VERSION = "1.17"
+MIN_BUILD_ARGS_VERSION = "1.21"
+MIN_BUILD_LABELS_VERSION = "1.23"
+MIN_BUILD_CACHE_FROM_VERSION = "1.25"
+MIN_BUILD_TARGET_VERSION = "1.29"
+
+# label rocker adds to its containers and images (contains the project directory, see rocker.gc)
+PROJECT_LABEL = 'zone.coding.rocker.project'
+
+# newest Docker API version rocker has been tested with
+# (requests will use the daemon's version, but never a newer one than this)
+MAX_API_VERSION = "1.41"
+
+# supported values for the --output option
+OUTPUT_MODES = ['text', 'jsonl']
+
+# rocker's global command line options (see Rocker.getopt())
+GLOBAL_SHORT_OPTS = 'v'
+GLOBAL_LONG_OPTS = ['output=', 'profile=', 'profile-out=', 'stats', 'stats-file=', 'trace=']
 
 # Source: https://svn.blender.org/svnroot/bf-blender/trunk/blender/build_files/scons/tools/bcolors.py
 # TODO Maybe use a library for coloring
@@ -22,6 +45,364 @@ class Col:
 	UNDERLINE = '\033[4m'
 
 
+# Renders docker's build/pull message streams
+#
+# Progress messages (the ones with an 'id' - usually image layers) are kept in a
+# dict (one line per ID) and the whole block is redrawn at most `fps` times per
+# second (using one write() call per frame).
+#
+# If the output stream isn't a TTY, progress updates will be dropped entirely
+# (only status changes - like 'Pull complete' - will be printed).
+#
+# Call finish() once the stream has ended (to draw the final state).
+class ProgressRenderer:
+	def __init__(self, stream=sys.stdout, fps=10, clock=time.monotonic):
+		self._stream = stream
+		self._isTty = hasattr(stream, 'isatty') and stream.isatty()
+		self._interval = 1.0/fps
+		self._clock = clock
+
+		self._layers = {} # id -> formatted line (in order of appearance)
+		self._lastStatus = {} # id -> last status (in non-TTY mode)
+		self._drawnLines = 0 # number of layer lines drawn in the last frame
+		self._dirty = False
+		self._lastFrame = None
+		self._pending = [] # output waiting for the next write()
+
+	# Draws the current state (and writes everything that's pending)
+	def finish(self):
+		self.flush(force=True)
+
+	# writes pending output (if it's time for a new frame or force is True)
+	def flush(self, force=False):
+		now = self._clock()
+		if not force and self._lastFrame != None and now - self._lastFrame < self._interval:
+			return # next frame isn't due yet
+
+		if self._dirty:
+			self._renderLayers()
+
+		if len(self._pending) > 0:
+			self._stream.write(''.join(self._pending))
+			self._stream.flush()
+			self._pending = []
+			self._lastFrame = now
+
+	# Processes a docker message
+	def update(self, msgJson):
+		if 'id' in msgJson and not 'error' in msgJson:
+			layerId = msgJson['id']
+			status = msgJson.get('status', '')
+
+			if self._isTty:
+				if 'progress' in msgJson and len(msgJson['progress']) > 0:
+					status = "{0} {1}".format(status, msgJson['progress'])
+				self._layers[layerId] = status
+				self._dirty = True
+				self.flush()
+			elif not 'progress' in msgJson and self._lastStatus.get(layerId) != status:
+				# non-TTY mode: only print status changes
+				self._lastStatus[layerId] = status
+				self._pending.append("{0}: {1}{2}{3}\n".format(layerId, Col.OKBLUE, status, Col.ENDC))
+				self.flush()
+		else:
+			# regular message -> draw the final layer state, print the message and start a new layer block
+			if self._dirty:
+				self._renderLayers()
+			self._layers = {}
+			self._drawnLines = 0
+
+			msg, newline = Rocker.formatDockerMessage(msgJson)
+			self._pending.append(msg + newline)
+			self.flush(force=True) # don't delay regular messages
+
+	# adds the layer lines to the pending output (overwriting the ones drawn in the last frame)
+	def _renderLayers(self):
+		width = shutil.get_terminal_size().columns - 1
+
+		if self._drawnLines > 0:
+			# go back to the first layer line
+			self._pending.append('\033[{0}A'.format(self._drawnLines))
+
+		for layerId, status in self._layers.items():
+			line = "{0}: {1}".format(layerId, status)
+			if len(line) > width:
+				line = line[:width] # wrapped lines would break the cursor movement
+			self._pending.append("\033[K{0}{1}{2}\n".format(Col.OKBLUE, line, Col.ENDC))
+
+		self._drawnLines = len(self._layers)
+		self._dirty = False
+
+
+# Aggregates docker's build/pull message streams for the JSON lines output mode (--output=jsonl)
+#
+# Instead of echoing each progress message, JsonProgressAggregator only
+# counts the layers (and their size) and emits one summary event in finish().
+# Build output ('stream' messages) will be emitted line by line.
+class JsonProgressAggregator:
+	def __init__(self, rocker, phase, name):
+		self._rocker = rocker
+		self._phase = phase
+		self._name = name
+
+		self._layers = {} # id -> size in bytes (if known)
+		self._buff = '' # incomplete build output line
+
+	def finish(self):
+		self._flushStream(True)
+
+		if len(self._layers) > 0:
+			self._rocker.event(self._phase, self._name, event='progress', layers=len(self._layers), bytes=sum(self._layers.values()))
+
+	def update(self, msgJson):
+		if 'error' in msgJson:
+			self._flushStream(True)
+			self._rocker.event(self._phase, self._name, level='error', daemon=msgJson['error'])
+		elif 'id' in msgJson:
+			detail = msgJson.get('progressDetail') or {}
+			size = self._layers.get(msgJson['id'], 0)
+			if 'total' in detail and detail['total'] > size:
+				size = detail['total']
+			self._layers[msgJson['id']] = size
+		elif 'stream' in msgJson:
+			self._buff += msgJson['stream']
+			self._flushStream()
+		elif 'status' in msgJson:
+			self._rocker.event(self._phase, self._name, daemon=msgJson['status'])
+		elif 'aux' in msgJson:
+			self._rocker.event(self._phase, self._name, aux=msgJson['aux'])
+
+	# emits complete build output lines (or everything if force is True)
+	def _flushStream(self, force=False):
+		lines = self._buff.split('\n')
+		self._buff = lines.pop()
+		if force:
+			lines.append(self._buff)
+			self._buff = ''
+
+		for line in lines:
+			line = line.rstrip()
+			if len(line) > 0:
+				self._rocker.event(self._phase, self._name, daemon=line)
+
+
+# Thread-safe output multiplexer
+#
+# Concurrent operations write to their own OutputLane (see lane()), which
+# prefixes each line with the lane's name. Only complete lines are passed on to
+# the mux (so lines of different lanes never get mixed up).
+#
+# The mux collects them in a shared buffer and writes them to the underlying
+# stream in batches: at most `fps` times per second (a background thread takes
+# care of that while there are open lanes) or as soon as the buffer exceeds
+# `maxBuffer` bytes.
+class OutputMux:
+	def __init__(self, stream=sys.stdout, fps=10, maxBuffer=64*1024):
+		self._stream = stream
+		self._interval = 1.0/fps
+		self._maxBuffer = maxBuffer
+
+		self._lock = threading.Lock()
+		self._pending = []
+		self._pendingSize = 0
+		self._openLanes = 0
+		self._flusher = None
+
+	# writes all pending output to the underlying stream
+	def flush(self):
+		with self._lock:
+			self._flush()
+
+	# Returns a new OutputLane with the given name (which will be used as line prefix)
+	def lane(self, name):
+		with self._lock:
+			self._openLanes += 1
+			if self._flusher == None:
+				self._flusher = threading.Thread(target=self._flushLoop, name='OutputMux', daemon=True)
+				self._flusher.start()
+
+		return OutputLane(self, "[{0}] ".format(name))
+
+	# Adds complete lines to the output buffer (and writes it if it's grown too large)
+	#
+	# Without open lanes (e.g. events emitted after the last lane was closed), the
+	# data is written right away (as the background thread isn't running anymore)
+	def write(self, data):
+		with self._lock:
+			self._pending.append(data)
+			self._pendingSize += len(data)
+			if self._pendingSize >= self._maxBuffer or self._openLanes == 0:
+				self._flush()
+
+	def _closeLane(self):
+		with self._lock:
+			self._openLanes -= 1
+			self._flush()
+
+	# caller needs to hold self._lock
+	def _flush(self):
+		if len(self._pending) > 0:
+			self._stream.write(''.join(self._pending))
+			self._stream.flush()
+			self._pending = []
+			self._pendingSize = 0
+
+	# background thread (flushes the buffer `fps` times per second while there are open lanes)
+	def _flushLoop(self):
+		while True:
+			time.sleep(self._interval)
+			with self._lock:
+				self._flush()
+				if self._openLanes == 0:
+					self._flusher = None
+					break
+
+# file-like object representing one of OutputMux's lanes
+#
+# OutputLane objects aren't thread-safe themselves (each concurrent operation
+# should use its own lane)
+class OutputLane:
+	__slots__ = ['_mux', '_prefix', '_partial', '_closed']
+
+	def __init__(self, mux, prefix):
+		self._mux = mux
+		self._prefix = prefix
+		self._partial = '' # incomplete line
+		self._closed = False
+
+	# Writes the last (incomplete) line and closes the lane
+	def close(self):
+		if self._closed:
+			return
+		if len(self._partial) > 0:
+			self.write('\n')
+		self._closed = True
+		self._mux._closeLane()
+
+	# no-op (the mux takes care of flushing)
+	def flush(self):
+		pass
+
+	# lanes can't use cursor movement (as other lanes might've written in the meantime)
+	def isatty(self):
+		return False
+
+	def write(self, data):
+		lines = (self._partial + data).split('\n')
+		self._partial = lines.pop()
+
+		if len(lines) > 0:
+			prefix = self._prefix
+			self._mux.write(''.join([prefix+line+'\n' for line in lines]))
+
+
+_default = None
+
+# Formats byte counts (e.g. '1000B', '2.9KiB' or '1.0GiB'; None is shown as '--')
+def formatBytes(size):
+	if size == None:
+		return '--'
+
+	for unit in ['B', 'KiB', 'MiB', 'GiB']:
+		if size < 1024 or unit == 'GiB':
+			break
+		size /= 1024.0
+
+	if unit == 'B':
+		return "{0}B".format(int(size))
+	return "{0:.1f}{1}".format(size, unit)
+
+# Returns rocker's cache directory (and creates it if necessary)
+#
+# Uses $XDG_CACHE_HOME/rocker (defaults to ~/.cache/rocker)
+def getCacheDir():
+	rc = os.getenv('XDG_CACHE_HOME')
+	if not rc:
+		rc = os.path.join(os.path.expanduser('~'), '.cache')
+	rc = os.path.join(rc, 'rocker')
+
+	if not os.path.isdir(rc):
+		os.makedirs(rc)
+	return rc
+
+# Returns the default Rocker instance (used by functions that weren't given one explicitly)
+#
+# It will be created on first use (instead of at import time)
+def getDefault():
+	global _default
+	if _default == None:
+		_default = Rocker()
+	return _default
+
+# Returns the error message of a failed Docker API request (docker's own message
+# for error responses, str(e) for any other exception)
+def getErrorMessage(e):
+	if isinstance(e, HttpResponseError):
+		try:
+			return json.loads(e.getData())['message']
+		except (ValueError, KeyError, TypeError):
+			return "Docker error (code: {0})".format(e.getCode())
+	return str(e)
+
+# Returns the project directory stored in PROJECT_LABEL (see rocker.gc)
+#
+# That's the absolute path of the directory containing the given .rocker file - or the
+# current working directory (which image paths are relative to) if rockerFile is None
+def getProjectDir(rockerFile=None):
+	if rockerFile == None:
+		return os.path.abspath(os.curdir)
+	return os.path.abspath(os.path.dirname(rockerFile))
+
+# Returns rocker's own version (or 'unknown' if it isn't installed properly)
+def getVersion():
+	# imported here as importlib.metadata isn't needed on rocker's hot paths
+	from importlib import metadata
+
+	try:
+		return metadata.version('rocker')
+	except metadata.PackageNotFoundError:
+		return 'unknown'
+
+# Parses version strings like '1.17' into tuples (which can be compared easily)
+def parseVersion(version):
+	return tuple([int(v) for v in version.split('.')])
+
+# Calls fn(item) for each of the items (up to `parallel` of them concurrently, each
+# worker thread is called '<name>-<n>') and waits for all of them to finish
+#
+# Returns the exceptions raised (as dict: item -> exception)
+def runParallel(items, fn, parallel, name='worker'):
+	rc = {}
+	pending = queue.Queue()
+	for item in items:
+		pending.put(item)
+
+	def worker():
+		while True:
+			try:
+				item = pending.get_nowait()
+			except queue.Empty:
+				return
+
+			try:
+				fn(item)
+			except Exception as e:
+				rc[item] = e
+
+	threads = []
+	for i in range(min(max(parallel, 1), len(items))):
+		thread = threading.Thread(target=worker, name='{0}-{1}'.format(name, i), daemon=True)
+		thread.start()
+		threads.append(thread)
+
+	for thread in threads:
+		# join() with timeout (so Ctrl+C works)
+		while thread.is_alive():
+			thread.join(.5)
+
+	return rc
+
+
 # rocker boilerplate class
 class Rocker:
 	# Rocker constructor
@@ -50,20 +431,52 @@ class Rocker:
 		self._lastMsgId = None
 		self._duplicateIDs = set()
 		self._msgQueue = []
+		self._outputMode = 'text'
 		self._verbosity = 0
 
+		# cache for inspect data (only used by `rocker serve`, see getInspectCache())
+		self._inspectCache = None
+
+		# reusable docker connections (restclient.ConnectionPool, only used by `rocker serve`)
+		self._connectionPool = None
+
+		# concurrency support (see lane())
+		self._lock = threading.RLock()
+		self._mux = None
+		self._errMux = None
+		self._lane = None
+		self._errLane = None
+		self._laneName = None
+
 		self._cachedDockerVersion = None
 
 	def checkApiVersion(self, minVersion, failMsg=False):
-		rc = StrictVersion(self.getDockerVersion()['ApiVersion']) >= StrictVersion(minVersion)
+		rc = parseVersion(self.getDockerVersion()['ApiVersion']) >= parseVersion(minVersion)
 		if failMsg and not rc:
 			self.error(failMsg)
 		return rc
 
 	# Returns a new RestClient instance pointing to the URL given in the constructor
+	#
+	# All request paths will be prefixed with the negotiated API version (e.g. '/v1.24')
 	def createRequest(self):
+		return self._createRequest(self.getApiPrefix())
+
+	# Returns the API version rocker uses to talk to the daemon
+	# (the daemon's version, but never a newer one than MAX_API_VERSION)
+	def getApiVersion(self):
+		rc = self.getDockerVersion()['ApiVersion']
+		if parseVersion(rc) > parseVersion(MAX_API_VERSION):
+			rc = MAX_API_VERSION
+		return rc
+
+	# Returns the path prefix for versioned API requests (e.g. '/v1.24')
+	def getApiPrefix(self):
+		return "/v{0}".format(self.getApiVersion())
+
+	def _createRequest(self, prefix=''):
 		try:
-			return Request(self._url)
+			return Request(self._url, prefix, self._connectionPool)
 		except SocketError as e:
 			# craft some docker-specific messages
 			if isinstance(e.cause, FileNotFoundError):
@@ -73,50 +486,289 @@ class Rocker:
 			else:
 				raise e
 
+	# Returns the daemon's /version info
+	#
+	# The info is cached on disk (see _readVersionCache()), so in most cases this
+	# won't need a round trip to the daemon
 	def getDockerVersion(self):
 		if self._cachedDockerVersion == None:
-			self._cachedDockerVersion = self.createRequest().doGet("/version").send().getObject()
+			cacheKey = self._getVersionCacheKey()
+			rc = self._readVersionCache(cacheKey)
+
+			if rc == None:
+				with self._createRequest() as req:
+					rc = req.doGet("/version").send().getObject()
+				self._writeVersionCache(cacheKey, rc)
+
+			self._cachedDockerVersion = rc
 		return self._cachedDockerVersion
 
+	# Emits an event in the JSON lines output mode (--output=jsonl)
+	#
+	# Each event is written as one compact JSON object containing a timestamp ('ts'),
+	# the log level, the phase and object name (if given) and all the other keyword
+	# args (e.g. 'msg', 'duration' or 'daemon' messages).
+	#
+	# In text mode, only events with a duration will be printed (at verbosity level 2).
+	def event(self, phase=None, name=None, level='info', **fields):
+		if self._outputMode == 'jsonl':
+			data = {'ts': round(time.time(), 3), 'level': level}
+			if phase != None:
+				data['phase'] = phase
+			if name != None:
+				data['name'] = name
+			if self._laneName != None:
+				data['lane'] = self._laneName
+			data.update(fields)
+
+			line = json.dumps(data, separators=(',', ':')) + '\n'
+			if self._mux != None:
+				self._mux.write(line) # keep concurrent events from interleaving
+			else:
+				sys.stdout.write(line)
+				sys.stdout.flush()
+		elif 'duration' in fields:
+			self.debug(2, "{0} {1}: {2} ({3:.3f}s)".format(phase, name, fields.get('event'), fields['duration']))
+
+	# Returns a Rocker instance for concurrent operations (to be used in a 'with' block)
+	#
+	# Its output will be written to its own lane of a shared OutputMux (i.e. each line
+	# will be prefixed with `name`, see OutputMux). Errors and warnings go to a lane
+	# of a second mux writing to stderr. Everything else (output mode, verbosity,
+	# duplicate message IDs, ...) is shared with this instance.
+	#
+	# The lanes will be closed at the end of the 'with' block.
+	@contextlib.contextmanager
+	def lane(self, name):
+		with self._lock:
+			if self._mux == None:
+				self._mux = OutputMux(sys.stdout)
+				self._errMux = OutputMux(sys.stderr)
+
+		rc = copy.copy(self)
+		rc._lastMsgId = None
+		rc._laneName = name
+		rc._lane = self._mux.lane(name)
+		rc._errLane = self._errMux.lane(name)
+
+		try:
+			yield rc
+		finally:
+			rc._lane.close()
+			rc._errLane.close()
+
+	# Returns a copy of this instance that talks to another Docker daemon (see rocker.fleet)
+	#
+	# The copy shares the output settings (and lane) with this instance, but has its own
+	# Docker version info and duplicate message IDs (and no inspect cache).
+	def forHost(self, url):
+		rc = copy.copy(self)
+		rc._url = url
+		rc._cachedDockerVersion = None
+		rc._duplicateIDs = set()
+		rc._inspectCache = None
+		return rc
+
+	# Returns the decoded response of `GET /{kind}/{name}/json` (i.e. the inspect data of
+	# a container or image - kind is either 'containers' or 'images') or None if docker
+	# responds with 404 (Not found).
+	#
+	# Uses the inspect cache (if there is one)
+	def getInspectData(self, kind, name):
+		cache = self._inspectCache
+		if cache != None and (kind, name) in cache:
+			return cache[(kind, name)]
+
+		rc = None
+		with self.createRequest() as req:
+			try:
+				rc = req.doGet('/{0}/{1}/json'.format(kind, name)).send().getObject()
+			except HttpResponseError as e:
+				if e.getCode() != 404:
+					raise e
+
+		if cache != None:
+			cache[(kind, name)] = rc
+		return rc
+
+	# Returns the cache for container/image inspect data (or None if there is none)
+	#
+	# The cache is only used by long running rocker processes (i.e. `rocker serve`, which
+	# invalidates its entries using docker's /events API). It's a dict with keys like
+	# ('containers', name) and the inspect data (or None for 404s) as values.
+	def getInspectCache(self):
+		return self._inspectCache
+
+	# Removes all entries from the inspect cache
+	#
+	# Has to be called after modifying containers/images (as the /events message
+	# might arrive too late)
+	def invalidateCache(self):
+		if self._inspectCache != None:
+			self._inspectCache.clear()
+
+	def getOutputMode(self):
+		return self._outputMode
+
+	# Returns the stream regular output should be written to (the current output lane
+	# (see lane()) or stdout)
+	def getOutputStream(self):
+		return self._lane or sys.stdout
+
+	# Returns the URL of the Docker daemon this instance talks to
+	def getUrl(self):
+		return self._url
+
 	def getVerbosity(self):
 		return self._verbosity
 
-	def getopt(self):
+	# Parses rocker's command line options (argv defaults to sys.argv[1:])
+	# and returns the remaining arguments
+	#
+	# Global options can be placed anywhere on the command line. All the other
+	# arguments (including options rocker doesn't know, e.g. `rocker logs -f`) are
+	# left to the command.
+	def getopt(self, argv=None):
+		if argv == None:
+			argv = sys.argv[1:]
+
 		try:
-			opts, args = getopt.gnu_getopt(sys.argv[1:], 'v')
+			globalArgs, args = Rocker._splitArgs(argv)
+			opts, _ = getopt.gnu_getopt(globalArgs, GLOBAL_SHORT_OPTS, GLOBAL_LONG_OPTS)
 
-			for opt,_ in opts:
+			for opt, value in opts:
 				if opt == '-v':
 					self._verbosity += 1
+				elif opt == '--output':
+					self.setOutputMode(value)
+				elif opt == '--trace':
+					trace.enable(value)
+				elif opt == '--profile':
+					if not value in profiler.MODES:
+						self.error("Unsupported profile mode: '{0}' (expected one of: {1})".format(value, ', '.join(sorted(profiler.MODES.keys()))), exitCode=1)
+					profiler.enable(value)
+				elif opt == '--profile-out':
+					profiler.setOutputPath(value)
+				elif opt == '--stats':
+					metrics.enable(printTable=True)
+				elif opt == '--stats-file':
+					metrics.enable(textfilePath=value)
 
 			return args
 		except getopt.GetoptError as e:
 			self.error(e, exitCode=1)
 
-	def printDockerOutput(self, httpResponse):
-		while True:
-			chunk = httpResponse.readChunk()
-			if chunk == None:
+	# Separates the global options (see GLOBAL_SHORT_OPTS and GLOBAL_LONG_OPTS) from the
+	# command's arguments and returns both lists
+	@staticmethod
+	def _splitArgs(argv):
+		longOpts = {}
+		for opt in GLOBAL_LONG_OPTS:
+			longOpts[opt.rstrip('=')] = opt.endswith('=')
+
+		globalArgs = []
+		args = []
+		i = 0
+		while i < len(argv):
+			arg = argv[i]
+			if arg == '--':
+				# everything after '--' is a command argument
+				args.extend(argv[i+1:])
 				break
-			chunk = json.loads(chunk)
-			self.printDockerMessage(chunk)
+			elif arg.startswith('--') and arg[2:].split('=', 1)[0] in longOpts:
+				globalArgs.append(arg)
+				if longOpts[arg[2:].split('=', 1)[0]] and not '=' in arg and i+1 < len(argv):
+					# option value given as separate argument (e.g. '--output jsonl')
+					i += 1
+					globalArgs.append(argv[i])
+			elif len(arg) > 1 and arg[0] == '-' and arg[1] != '-' and all(c in GLOBAL_SHORT_OPTS for c in arg[1:]):
+				globalArgs.append(arg)
+			else:
+				args.append(arg)
+			i += 1
+
+		return globalArgs, args
+
+	# Runs the code inside the 'with' block as the given phase (e.g. 'build') of the
+	# object `name` (e.g. the image path) and emits 'start' and 'end' events (the latter
+	# containing the phase's duration in seconds)
+	@contextlib.contextmanager
+	def phase(self, phase, name):
+		start = time.monotonic()
+		self.event(phase, name, event='start')
+
+		try:
+			yield
+		except BaseException as e:
+			self.event(phase, name, level='error', event='end', duration=round(time.monotonic()-start, 3), msg=str(e))
+			raise
+
+		self.event(phase, name, event='end', duration=round(time.monotonic()-start, 3))
+
+	# Prints the JSON message stream of a docker build/pull request
+	#
+	# In text mode the messages are rendered using ProgressRenderer, in jsonl mode
+	# they're aggregated by JsonProgressAggregator (phase and name will be added to
+	# each of the events). Callers can provide their own renderer instead.
+	def printDockerOutput(self, httpResponse, phase=None, name=None, renderer=None):
+		if renderer == None:
+			if self._outputMode == 'jsonl':
+				renderer = JsonProgressAggregator(self, phase, name)
+			else:
+				renderer = ProgressRenderer(self.getOutputStream())
+		buff = ''
+
+		# time spent waiting for the daemon (e.g. the actual build)
+		with trace.span('daemon', phase=phase, name=name):
+			while True:
+				chunk = httpResponse.readChunk()
+				if chunk == None:
+					break
+
+				# chunks usually contain exactly one message, but that's not guaranteed
+				lines = (buff+chunk).split('\n')
+				buff = lines.pop()
+				for line in lines:
+					if len(line.strip()) > 0:
+						renderer.update(json.loads(line))
+
+		if len(buff.strip()) > 0:
+			renderer.update(json.loads(buff))
+		renderer.finish()
 
 	# Print Docker status messages (with color coding)
 	#
 	# This method will print subsequent messages for the same image/container ID in the same line (i.e. overwrite the last message)
 	def printDockerMessage(self, msgJson):
-		col = None
-		msg = None
-		newline = '\n'
+		out = []
 
 		if 'id' in msgJson:
 			# overwrite lines with the same ID (instead of printing a new one)
 			if self._lastMsgId == msgJson['id']:
 				# go back one line (and clear it)
-				sys.stdout.write('\033[1A\033[K')
+				out.append('\033[1A\033[K')
 
 			# prepend ID
-			sys.stdout.write("{0}: ".format(msgJson['id']))
+			out.append("{0}: ".format(msgJson['id']))
+
+		msg, newline = Rocker.formatDockerMessage(msgJson)
+		out.append("{0}{1}".format(msg, newline))
+		self.getOutputStream().write(''.join(out))
+
+		# update _lastMsgId
+		if 'id' in msgJson:
+			self._lastMsgId = msgJson['id']
+		else:
+			self._lastMsgId = None
+
+	# Formats a Docker status message (with color coding)
+	#
+	# Returns the formatted message and the line ending to use
+	@staticmethod
+	def formatDockerMessage(msgJson):
+		col = None
+		msg = None
+		newline = '\n'
 
 		# color message depending on type
 		if 'error' in msgJson:
@@ -139,22 +791,20 @@ class Rocker:
 		if col != None:
 			msg = "{0}{1}{2}".format(col, msg, Col.ENDC)
 
-		sys.stdout.write("{0}{1}".format(msg, newline))
-
-		# update _lastMsgId
-		if 'id' in msgJson:
-			self._lastMsgId = msgJson['id']
-		else:
-			self._lastMsgId = None
+		return msg, newline
 
 	def printQueuedMessages(self):
+		self._flushLanes()
+
 		for msg, stream in self._msgQueue:
-			self._msg(msg, None, None, stream)
+			if self._outputMode == 'jsonl':
+				self.event(level=stream, msg=msg) # we've stored the level instead of the stream
+			else:
+				self._msg(msg, None, None, stream)
 
 	def printVersion(self):
 		# print our own version first (in case we can't connect to docker)
-		rockerInfo = pkg_resources.require("rocker")[0]
-		print("Rocker version: {v}".format(v=rockerInfo.version))
+		print("Rocker version: {v}".format(v=getVersion()))
 
 		dockerInfo = self.getDockerVersion()
 
@@ -164,39 +814,114 @@ class Rocker:
 		self.debug(2, "Docker GIT revision: {GitCommit}".format(**dockerInfo))
 		self.debug(2, "Docker GO version {GoVersion}".format(**dockerInfo))
 
-	def _msg(self, msg, col, duplicateId, stream, delayed=False):
+	# Returns the path of the version cache file and the data identifying the daemon instance
+	# (or None, None if the version info can't be cached)
+	#
+	# For UNIX sockets, that's the socket's path, inode and mtime (the socket will
+	# be recreated when the daemon restarts, so an upgraded daemon will be detected)
+	def _getVersionCacheKey(self):
+		if not self._url.startswith('unix://'):
+			return None, None
+
+		path = self._url[len('unix://'):]
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None, None # let the request fail (with a proper error message)
+
+		cacheFile = 'version{0}.json'.format(os.path.abspath(path).replace(os.sep, '_'))
+		return cacheFile, {'socket': path, 'ino': st.st_ino, 'mtime': st.st_mtime_ns}
+
+	def _readVersionCache(self, cacheKey):
+		cacheFile, daemonId = cacheKey
+		if cacheFile == None:
+			return None
+
+		try:
+			with open(os.path.join(getCacheDir(), cacheFile)) as f:
+				data = json.loads(f.read())
+			if data['daemon'] == daemonId:
+				return data['version']
+		except (OSError, ValueError, KeyError):
+			pass # no (valid) cache file
+
+		return None
+
+	def _writeVersionCache(self, cacheKey, version):
+		cacheFile, daemonId = cacheKey
+		if cacheFile == None:
+			return
+
+		try:
+			path = os.path.join(getCacheDir(), cacheFile)
+			tmpPath = "{0}.tmp{1}".format(path, os.getpid())
+			with open(tmpPath, 'w') as f:
+				json.dump({'daemon': daemonId, 'version': version}, f)
+			os.replace(tmpPath, path)
+		except OSError as e:
+			self.debug(1, "Couldn't write version cache: {0}".format(e), duplicateId='versionCache')
+
+	# writes the pending output of all the lanes (see lane())
+	def _flushLanes(self):
+		if self._mux != None:
+			self._mux.flush()
+			self._errMux.flush()
+
+	def setOutputMode(self, mode):
+		if not mode in OUTPUT_MODES:
+			self.error("Unsupported output mode: '{0}' (expected one of: {1})".format(mode, ', '.join(OUTPUT_MODES)), exitCode=1)
+		self._outputMode = mode
+
+	def _msg(self, msg, col, duplicateId, stream, delayed=False, level='info'):
 		if duplicateId != None:
 			# don't print duplicate messages
-			if duplicateId in self._duplicateIDs:
-				return
+			with self._lock:
+				if duplicateId in self._duplicateIDs:
+					return
+				else:
+					self._duplicateIDs.add(duplicateId)
+
+		if self._outputMode == 'jsonl':
+			if delayed:
+				with self._lock:
+					self._msgQueue.append((msg, level))
 			else:
-				self._duplicateIDs.add(duplicateId)
+				self.event(level=level, msg=msg)
+			return
 
 		if col != None:
 			msg="{0}{1}{2}".format(col, msg, Col.ENDC)
 
 		if delayed:
-			self._msgQueue.append((msg, stream))
+			with self._lock:
+				self._msgQueue.append((msg, stream))
+		elif self._lane != None:
+			if stream == sys.stderr:
+				self._errLane.write("{0}\n".format(msg))
+			else:
+				self._lane.write("{0}\n".format(msg))
 		else:
 			stream.write("{0}\n".format(msg))
 
 
 	def error(self, msg: str, exitCode=1):
-		self._msg("ERROR: {0}".format(msg), Col.FAIL, None, sys.stderr)
+		self._msg("ERROR: {0}".format(msg), Col.FAIL, None, sys.stderr, level='error')
 		if exitCode != None:
 			sys.exit(exitCode)
 
-	def info(self, msg: str, duplicateId=None, stream=sys.stdout, delayed=False):
+	def info(self, msg: str, duplicateId=None, stream=None, delayed=False):
+		if stream == None:
+			stream = sys.stdout
 		self._msg(msg, None, duplicateId, stream, delayed)
 
 	def warning(self, msg: str, duplicateId=None):
-		self._msg(msg, Col.WARNING, duplicateId, sys.stderr)
+		self._msg(msg, Col.WARNING, duplicateId, sys.stderr, level='warning')
 
 	def debug(self, level, msg, duplicateId=None):
 		if self._verbosity < level:
 			return # too verbose
 
-		self._msg(msg, None, duplicateId, sys.stdout)
+		self._msg(msg, None, duplicateId, sys.stdout, level='debug')
 
 	def choice(self, msg, options=['y', 'n'], default='y'):
 		rc = None
@@ -212,12 +937,18 @@ class Rocker:
 			choices.append(o)
 		choices = "({0})".format('/'.join(choices))
 
-		while rc == None:
-			choice = input('{0} {1}: '.format(msg, choices)).lower()
+		# only ask one question at a time (and make sure all output has been written first)
+		with self._lock:
+			self._flushLanes()
+			if self._laneName != None:
+				msg = "[{0}] {1}".format(self._laneName, msg)
+
+			while rc == None:
+				choice = input('{0} {1}: '.format(msg, choices)).lower()
 
-			if choice == '': #default
-				rc = default
-			elif choice in options:
-				rc = choice
+				if choice == '': #default
+					rc = default
+				elif choice in options:
+					rc = choice
 
 		return rc
\ No newline at end of file
@@ -0,0 +1,266 @@
+from rocker import restclient
+from rocker.rocker import Rocker
+
+import json
+import os
+import shutil
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+# `rocker serve` implementation
+#
+# The server listens on a UNIX socket and runs the commands forwarded by rocker's
+# CLI (see forward()) one at a time. It keeps everything that's expensive to set
+# up between commands:
+#
+# - the parsed .rocker files (and therefore the project's dependency graph, see container.ConfigLoader)
+# - the daemon's version info
+# - a cache for container/image inspect data (see Rocker.getInspectCache()) which
+#   is kept up to date by listening to docker's /events stream
+# - idle connections to the docker daemon (see restclient.ConnectionPool)
+#
+# Commands streaming output until they're interrupted (`logs -f`, `stats`) aren't
+# forwarded (see commands.isStreaming()), they'd block all other clients.
+#
+# Protocol: The client sends one JSON object (terminated by a newline) with the
+# command line arguments ('argv'), its working directory ('cwd'), whether its
+# stdout is a terminal ('tty' and 'columns') and its values of the ENV_VARS below
+# ('env'). Commands are only run by the server if those match the server's own
+# environment (otherwise they might use another docker daemon, config index, lock
+# or cache directory than the client expects).
+#
+# The server then responds with a JSON object per line:
+# - {"out": "..."} or {"err": "..."}: output to be written to stdout/stderr
+# - {"prompt": true}: the command waits for user input, the client responds with {"answer": "..."}
+# - {"exit": 0}: the command has finished (with the given exit code)
+# - {"reject": "reason"}: the server can't run the command (the client should run it itself)
+
+# environment variables affecting the commands' behaviour
+ENV_VARS = ['DOCKER_HOST', 'ROCKER_CONTEXT_CACHE', 'ROCKER_CONTEXT_CACHE_DIR', 'ROCKER_INDEX', 'ROCKER_LOCK_DIR', 'XDG_CACHE_HOME']
+
+class Server:
+	def __init__(self, socketPath, r, watchEvents=True):
+		self._socketPath = socketPath
+		self._rocker = r
+		self._watchEvents = watchEvents
+
+		self._cache = {}
+		self._pool = restclient.ConnectionPool()
+		self._lock = threading.Lock() # commands are run one at a time
+		self._server = None
+		self._stopped = threading.Event()
+
+	# Listens for requests (blocks until shutdown() is called)
+	def serve(self):
+		if os.path.exists(self._socketPath):
+			# make sure there's no other server running
+			try:
+				sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				sock.connect(self._socketPath)
+				sock.close()
+				raise Exception("There's already a rocker server listening at '{0}'".format(self._socketPath))
+			except ConnectionRefusedError:
+				os.unlink(self._socketPath) # stale socket file
+
+		self._server = socketserver.UnixStreamServer(self._socketPath, _RequestHandler)
+		self._server.rockerServer = self
+
+		if self._watchEvents:
+			threading.Thread(target=self._eventLoop, name='events', daemon=True).start()
+
+		try:
+			self._server.serve_forever()
+		finally:
+			self._server.server_close()
+			self._pool.close()
+			if os.path.exists(self._socketPath):
+				os.unlink(self._socketPath)
+
+	def shutdown(self):
+		self._stopped.set()
+		if self._server != None:
+			self._server.shutdown()
+
+	# Runs a command (requested by a client)
+	def execute(self, req, rfile, wfile):
+		import rocker
+
+		clientEnv = req.get('env') or {}
+		for key in ENV_VARS:
+			if clientEnv.get(key) != os.getenv(key):
+				_send(wfile, {'reject': "The server uses {0}={1}".format(key, os.getenv(key))})
+				return
+
+		out = _ClientStream(wfile, 'out', req.get('tty', False))
+		err = _ClientStream(wfile, 'err', False)
+		origCwd = os.getcwd()
+		origStreams = sys.stdout, sys.stderr, sys.stdin
+		origColumns = os.getenv('COLUMNS')
+		rc = 0
+
+		with self._lock:
+			try:
+				os.chdir(req['cwd'])
+				sys.stdout, sys.stderr, sys.stdin = out, err, _ClientInput(rfile, wfile)
+				if 'columns' in req:
+					os.environ['COLUMNS'] = str(req['columns'])
+
+				r = Rocker()
+				r._inspectCache = self._cache
+				r._connectionPool = self._pool
+				r._cachedDockerVersion = self._rocker._cachedDockerVersion
+				args = r.getopt(req['argv'])
+
+				rc = rocker.execute(args, r)
+				self._rocker._cachedDockerVersion = r._cachedDockerVersion
+			except SystemExit as e:
+				rc = e.code
+			except BaseException as e:
+				traceback.print_exc(file=err)
+				rc = 1
+			finally:
+				sys.stdout, sys.stderr, sys.stdin = origStreams
+				os.chdir(origCwd)
+				if origColumns == None:
+					os.environ.pop('COLUMNS', None)
+				else:
+					os.environ['COLUMNS'] = origColumns
+
+		if rc == None:
+			rc = 0
+		elif type(rc) != int:
+			err.write("{0}\n".format(rc)) # sys.exit("message")
+			rc = 1
+
+		_send(wfile, {'exit': rc})
+
+	# Listens to docker's /events stream and removes stale inspect cache entries
+	# (reconnects if the connection gets lost)
+	def _eventLoop(self):
+		while not self._stopped.is_set():
+			try:
+				with self._rocker.createRequest() as req:
+					resp = req.doGet('/events').send()
+					self._cache.clear() # we might've missed events while (re)connecting
+					buff = ''
+
+					while True:
+						chunk = resp.readChunk()
+						if chunk == None:
+							break
+
+						# events might span more than one chunk
+						lines = (buff+chunk).split('\n')
+						buff = lines.pop()
+						for line in lines:
+							if len(line.strip()) > 0:
+								self._processEvent(json.loads(line))
+			except (restclient.SocketError, OSError, ValueError) as e:
+				self._rocker.debug(1, "Lost connection to docker's event stream: {0}".format(e))
+
+			self._cache.clear()
+			self._stopped.wait(1)
+
+	def _processEvent(self, event):
+		evType = event.get('Type')
+		actor = event.get('Actor') or {}
+
+		if evType == 'container':
+			# remove both the container's ID and name
+			keys = [actor.get('ID'), (actor.get('Attributes') or {}).get('name')]
+			for key in keys:
+				self._cache.pop(('containers', key), None)
+		elif evType == 'image':
+			# image events might affect any of its names/tags (and its parents) => remove all images
+			for key in list(self._cache.keys()):
+				if key[0] == 'images':
+					self._cache.pop(key, None)
+		elif evType == None:
+			# old docker versions (API < 1.22) don't tell us what kind of object the event is about
+			self._cache.clear()
+
+# socketserver handler (passes each request on to Server.execute())
+class _RequestHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		line = self.rfile.readline()
+		if len(line) == 0:
+			return
+		self.server.rockerServer.execute(json.loads(line.decode('utf8')), self.rfile, self.wfile)
+
+# file-like object sending output to the client
+class _ClientStream:
+	def __init__(self, wfile, key, tty):
+		self._wfile = wfile
+		self._key = key
+		self._tty = tty
+
+	def flush(self):
+		pass # write() doesn't buffer
+
+	def isatty(self):
+		return self._tty
+
+	def write(self, data):
+		if len(data) > 0:
+			_send(self._wfile, {self._key: data})
+		return len(data)
+
+# file-like object asking the client for user input
+class _ClientInput:
+	def __init__(self, rfile, wfile):
+		self._rfile = rfile
+		self._wfile = wfile
+
+	def readline(self):
+		_send(self._wfile, {'prompt': True})
+		line = self._rfile.readline()
+		if len(line) == 0:
+			raise EOFError("Client disconnected")
+		return json.loads(line.decode('utf8'))['answer'] + '\n'
+
+def _send(wfile, msg):
+	wfile.write(json.dumps(msg).encode('utf8') + b'\n')
+	wfile.flush()
+
+# Forwards a command to a running `rocker serve` instance
+#
+# Returns the command's exit code or None if the command couldn't be forwarded
+# (in which case the caller should run it itself)
+def forward(argv, socketPath):
+	try:
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.connect(socketPath)
+	except OSError:
+		return None # no server running
+
+	with sock, sock.makefile('rwb') as f:
+		_send(f, {
+			'argv': argv,
+			'cwd': os.getcwd(),
+			'env': {key: os.getenv(key) for key in ENV_VARS},
+			'tty': sys.stdout.isatty(),
+			'columns': shutil.get_terminal_size().columns
+		})
+
+		for line in f:
+			msg = json.loads(line.decode('utf8'))
+
+			if 'out' in msg:
+				sys.stdout.write(msg['out'])
+				sys.stdout.flush()
+			elif 'err' in msg:
+				sys.stderr.write(msg['err'])
+				sys.stderr.flush()
+			elif 'prompt' in msg:
+				answer = sys.stdin.readline()
+				_send(f, {'answer': answer.rstrip('\n')})
+			elif 'exit' in msg:
+				return msg['exit']
+			elif 'reject' in msg:
+				return None
+
+	sys.stderr.write("ERROR: Lost connection to the rocker server\n")
+	return 1
@@ -0,0 +1,342 @@
+from rocker.restclient import HttpResponseError, ResponseParser
+from rocker.rocker import formatBytes, getDefault, getErrorMessage
+
+import calendar
+import json
+import re
+import selectors
+import time
+import urllib.parse
+
+# Container resource usage (`rocker stats`)
+#
+# StatsCollector opens docker's streaming /containers/{name}/stats endpoint for all
+# the given containers at once and reads them using a single selector based event loop
+# (one socket per container, no threads).
+#
+# docker sends one sample per container per second. Each of them is a JSON object
+# of a few KB, but as all the values we're interested in are cumulative counters
+# (or current values), only the latest sample of each container has to be decoded
+# when it's time to render (the others are skipped without being parsed).
+#
+# Rates (CPU %, network bytes per second) are calculated incrementally from the
+# previously decoded sample.
+
+# docker's (UTC) timestamps, e.g. '2015-01-08T22:57:31.547920715Z'
+_TIMESTAMP_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(\.\d+)?Z$')
+
+# Resource usage of a single container (see StatsCollector)
+#
+# All the values are None until they're known (e.g. cpuPercent and the network
+# rates need two samples)
+class ContainerStats:
+	__slots__ = ['cpuPercent', 'error', 'memLimit', 'memUsage', 'name', 'netRx', 'netTx', 'pids',
+		'_cpuTotal', '_readTime', '_rxBytes', '_systemTotal', '_txBytes']
+
+	def __init__(self, name):
+		self.name = name
+		self.cpuPercent = None
+		self.error = None
+		self.memLimit = None
+		self.memUsage = None
+		self.netRx = None # received bytes per second
+		self.netTx = None # sent bytes per second
+		self.pids = None
+
+		# previous sample's counters
+		self._cpuTotal = None
+		self._systemTotal = None
+		self._readTime = None
+		self._rxBytes = None
+		self._txBytes = None
+
+	def getMemPercent(self):
+		if self.memUsage == None or not self.memLimit:
+			return None
+		return self.memUsage*100.0/self.memLimit
+
+	# Updates the values using a (decoded) stats sample
+	def update(self, sample):
+		# CPU (same formula as `docker stats`)
+		cpu = sample.get('cpu_stats') or {}
+		cpuUsage = cpu.get('cpu_usage') or {}
+		total = cpuUsage.get('total_usage')
+		system = cpu.get('system_cpu_usage')
+		cpus = cpu.get('online_cpus') or len(cpuUsage.get('percpu_usage') or []) or 1
+
+		prevTotal, prevSystem = self._cpuTotal, self._systemTotal
+		if prevTotal == None:
+			# first sample => use the previous values docker sends along
+			precpu = sample.get('precpu_stats') or {}
+			prevTotal = (precpu.get('cpu_usage') or {}).get('total_usage')
+			prevSystem = precpu.get('system_cpu_usage')
+
+		if not None in (total, system, prevTotal, prevSystem) and system > prevSystem:
+			self.cpuPercent = (total-prevTotal)*100.0*cpus/(system-prevSystem)
+		self._cpuTotal, self._systemTotal = total, system
+
+		# memory (without the page cache, like `docker stats`)
+		mem = sample.get('memory_stats') or {}
+		if mem.get('usage') != None:
+			memStats = mem.get('stats') or {}
+			cache = memStats.get('inactive_file', memStats.get('total_inactive_file', 0))
+			self.memUsage = mem['usage']-cache if cache < mem['usage'] else mem['usage']
+			self.memLimit = mem.get('limit')
+
+		# network (rates calculated using the samples' timestamps)
+		rx = tx = None
+		networks = sample.get('networks')
+		if networks != None:
+			rx = sum(n.get('rx_bytes', 0) for n in networks.values())
+			tx = sum(n.get('tx_bytes', 0) for n in networks.values())
+
+		readTime = _parseTimestamp(sample.get('read'))
+		if readTime == None:
+			readTime = time.time()
+
+		if rx != None and self._rxBytes != None and readTime > self._readTime and rx >= self._rxBytes and tx >= self._txBytes:
+			elapsed = readTime-self._readTime
+			self.netRx = (rx-self._rxBytes)/elapsed
+			self.netTx = (tx-self._txBytes)/elapsed
+		self._rxBytes, self._txBytes, self._readTime = rx, tx, readTime
+
+		self.pids = (sample.get('pids_stats') or {}).get('current')
+
+# Reads the stats streams of several containers concurrently (see the comment at the top)
+#
+# Usage:
+#
+# collector = StatsCollector(['web', 'db'], r)
+# collector.run(render) # render(containerStatsList) will be called every `interval` seconds
+class StatsCollector:
+	# If stream is False, docker will only send one sample per container (and
+	# run() returns as soon as all of them have been received)
+	def __init__(self, names, r=None, stream=True):
+		if r == None:
+			r = getDefault()
+
+		self._r = r
+		self._stream = stream
+		self._containers = [ContainerStats(name) for name in names]
+		self._selector = None
+
+	def getContainers(self):
+		return self._containers
+
+	# Sends the stats requests (without waiting for the responses)
+	def start(self):
+		self._selector = selectors.DefaultSelector()
+
+		for ctr in self._containers:
+			req = self._r.createRequest()
+			req.doGet('/containers/{0}/stats?stream={1}'.format(urllib.parse.quote(ctr.name, safe=''), int(self._stream))).sendAsync()
+			self._selector.register(req, selectors.EVENT_READ, StatsCollector._Stream(ctr, req))
+
+	# Closes all the remaining connections
+	def close(self):
+		if self._selector == None:
+			return
+
+		for key in list(self._selector.get_map().values()):
+			self._selector.unregister(key.fileobj)
+			key.fileobj.close()
+		self._selector.close()
+		self._selector = None
+
+	# Returns the number of streams that are still open
+	def getOpenStreams(self):
+		if self._selector == None:
+			return 0
+		return len(self._selector.get_map())
+
+	# Waits (at most `timeout` seconds) for stats data and processes it (without decoding the samples)
+	#
+	# A connection error only ends the affected container's stream (see _Stream.abort())
+	def poll(self, timeout=None):
+		for key, _ in self._selector.select(timeout):
+			stream = key.data
+			try:
+				ended = not stream.read()
+			except OSError as e:
+				self._selector.unregister(key.fileobj)
+				stream.abort(e)
+				continue
+
+			if ended:
+				self._selector.unregister(key.fileobj)
+				stream.close()
+
+	# Runs the event loop, calling render(containers) every `interval` seconds
+	#
+	# Returns once all the streams have ended (e.g. because the containers were
+	# stopped) or after `iterations` calls to render()
+	def run(self, render, interval=1, iterations=None):
+		if self._selector == None:
+			self.start()
+
+		try:
+			count = 0
+			nextRender = time.monotonic()+interval
+			while self.getOpenStreams() > 0:
+				self.poll(max(nextRender-time.monotonic(), 0) if self._stream else None)
+
+				if self._stream and time.monotonic() >= nextRender:
+					self.update()
+					render(self._containers)
+					count += 1
+					if iterations != None and count >= iterations:
+						return
+					nextRender = max(nextRender+interval, time.monotonic())
+
+			# final state
+			self.update()
+			render(self._containers)
+		finally:
+			self.close()
+
+	# Decodes the latest sample of each container (if there's a new one)
+	def update(self):
+		if self._selector != None:
+			for key in self._selector.get_map().values():
+				key.data.decode()
+
+	# Stats response of a single container
+	class _Stream:
+		def __init__(self, ctr, req):
+			self._ctr = ctr
+			self._req = req
+			self._parser = ResponseParser()
+			self._buffer = bytearray() # incomplete line
+			self._latest = None # latest complete (but not yet decoded) sample
+			self._errorBody = []
+
+		def close(self):
+			if len(self._buffer) > 0:
+				# the last sample might not end with a newline
+				self._latest = bytes(self._buffer)
+				self._buffer.clear()
+
+			self.decode()
+			self._req.close()
+
+			status = self._parser.getStatus()
+			if status == None:
+				self._ctr.error = "Connection closed by the Docker daemon"
+			elif status != 200:
+				self._ctr.error = getErrorMessage(HttpResponseError("HTTP {0}".format(status), status, b''.join(self._errorBody)))
+
+		# Closes the stream after a connection error (which will be shown instead of the container's stats)
+		def abort(self, e):
+			self._req.close()
+			self._latest = None
+			self._ctr.error = "Lost connection to the Docker daemon: {0}".format(getErrorMessage(e))
+
+		# Decodes the latest sample (if there's one that hasn't been decoded yet)
+		def decode(self):
+			if self._latest != None:
+				self._ctr.update(json.loads(self._latest))
+				self._latest = None
+
+		# Reads the available data; returns False once the response is complete
+		def read(self):
+			parser = self._parser
+			for data in parser.feed(self._req.recvAvailable()):
+				if parser.getStatus() != 200:
+					self._errorBody.append(data)
+					continue
+
+				buff = self._buffer
+				buff += data
+				end = buff.rfind(b'\n')
+				if end >= 0:
+					# only keep the last complete line (the others are outdated)
+					start = buff.rfind(b'\n', 0, end)+1
+					if end > start:
+						self._latest = bytes(buff[start:end])
+					del buff[:end+1]
+
+			return not parser.isDone()
+
+# Returns the stats table (one line per container) as string
+def formatTable(containers):
+	rows = [('NAME', 'CPU %', 'MEM USAGE / LIMIT', 'MEM %', 'NET RX/s', 'NET TX/s', 'PIDS')]
+
+	for ctr in containers:
+		if ctr.error != None:
+			rows.append((ctr.name, '--', ctr.error, '', '', '', ''))
+			continue
+
+		mem = '--'
+		if ctr.memUsage != None:
+			mem = "{0} / {1}".format(formatBytes(ctr.memUsage), formatBytes(ctr.memLimit))
+		rows.append((ctr.name, _formatPercent(ctr.cpuPercent), mem, _formatPercent(ctr.getMemPercent()),
+			formatBytes(ctr.netRx), formatBytes(ctr.netTx), '--' if ctr.pids == None else str(ctr.pids)))
+
+	widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+	rc = []
+	for row in rows:
+		cols = [row[0].ljust(widths[0])]
+		for i in range(1, len(row)):
+			cols.append(row[i].rjust(widths[i]) if i != 2 else row[i].ljust(widths[i]))
+		rc.append('  '.join(cols).rstrip()+'\n')
+	return ''.join(rc)
+
+# Shows the resource usage of the given containers
+#
+# In text mode, the table is redrawn every `interval` seconds (if stdout is a
+# terminal, otherwise it's printed repeatedly). With --output=jsonl, one 'stats'
+# event per container is emitted instead.
+#
+# If stream is False, only one sample will be shown.
+# Returns True if the stats of all the containers could be read
+def show(names, stream=True, interval=1, r=None):
+	if r == None:
+		r = getDefault()
+
+	out = r.getOutputStream()
+	isTty = stream and hasattr(out, 'isatty') and out.isatty()
+
+	def render(containers):
+		if r.getOutputMode() == 'jsonl':
+			for ctr in containers:
+				if ctr.error == None:
+					r.event('stats', ctr.name, cpu=_round(ctr.cpuPercent), mem=ctr.memUsage, memLimit=ctr.memLimit,
+						netRx=_round(ctr.netRx), netTx=_round(ctr.netTx), pids=ctr.pids)
+		elif isTty:
+			out.write('\033[H\033[J'+formatTable(containers)) # clear the screen and redraw
+			out.flush()
+		else:
+			out.write(formatTable(containers)+('\n' if stream else ''))
+			out.flush()
+
+	collector = StatsCollector(names, r, stream)
+	collector.run(render, interval)
+
+	rc = True
+	for ctr in collector.getContainers():
+		if ctr.error != None:
+			r.error("{0}: {1}".format(ctr.name, ctr.error), exitCode=None)
+			rc = False
+	return rc
+
+def _formatPercent(value):
+	if value == None:
+		return '--'
+	return "{0:.1f}%".format(value)
+
+# Parses docker's RFC 3339 timestamps (e.g. '2015-01-08T22:57:31.547920715Z') as UNIX timestamp
+# (returns None if ts isn't a valid UTC timestamp)
+def _parseTimestamp(ts):
+	match = _TIMESTAMP_RE.match(ts or '')
+	if match == None:
+		return None
+
+	rc = calendar.timegm(tuple(int(v) for v in match.groups()[:6]))
+	if match.group(7) != None:
+		rc += float(match.group(7))
+	return rc
+
+def _round(value):
+	if value == None:
+		return None
+	return round(value, 2)
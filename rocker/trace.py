@@ -0,0 +1,112 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+
+# Records nested timing spans and writes them as Chrome trace events
+#
+# Enable it using `--trace=FILE` (or trace.enable()); the resulting file can be
+# opened in chrome://tracing or https://ui.perfetto.dev
+#
+# Each span is recorded as a 'complete' event (ph='X') on the thread it ran on,
+# so nested spans (e.g. build > _fillTar > send) show up as a flame graph.
+#
+# When tracing is disabled, span() returns a shared no-op context manager
+# (so instrumented code paths stay cheap).
+class Tracer:
+	def __init__(self, path, clock=time.perf_counter):
+		self._path = path
+		self._clock = clock
+		self._start = clock()
+		self._pid = os.getpid()
+		self._events = []
+		self._threads = {}
+
+	# Returns the recorded trace events (in the order the spans ended)
+	def getEvents(self):
+		rc = []
+		for tid, name in self._threads.items():
+			rc.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}})
+		rc.extend(self._events)
+		return rc
+
+	def getPath(self):
+		return self._path
+
+	# Writes the recorded events to the trace file
+	def save(self):
+		import json
+		with open(self._path, 'w') as f:
+			json.dump({'traceEvents': self.getEvents(), 'displayTimeUnit': 'ms'}, f)
+
+	@contextlib.contextmanager
+	def span(self, name, cat, args):
+		thread = threading.current_thread()
+		start = self._clock()
+		try:
+			yield
+		finally:
+			end = self._clock()
+
+			# list.append() and dict assignments are atomic => no need to lock
+			self._threads[thread.ident] = thread.name
+			self._events.append({
+				'name': name,
+				'cat': cat,
+				'ph': 'X',
+				'ts': round((start-self._start)*1e6, 1),
+				'dur': round((end-start)*1e6, 1),
+				'pid': self._pid,
+				'tid': thread.ident,
+				'args': args
+			})
+
+_tracer = None
+_NOOP = contextlib.nullcontext()
+
+# Starts recording spans (they'll be written to path when finish() is called)
+def enable(path):
+	global _tracer
+	_tracer = Tracer(path)
+	return _tracer
+
+# Writes the trace file (if tracing is enabled) and stops recording
+def finish():
+	global _tracer
+	tracer = _tracer
+	_tracer = None
+
+	if tracer != None:
+		tracer.save()
+
+def getTracer():
+	return _tracer
+
+# Returns a context manager recording the code inside its 'with' block as a span
+#
+# The keyword arguments will be stored as the span's args (and are shown by the
+# trace viewer)
+def span(spanName, cat='rocker', **args):
+	if _tracer == None:
+		return _NOOP
+	return _tracer.span(spanName, cat, args)
+
+# Function decorator recording each call as a span
+#
+# The first positional argument (usually the image or container name) will be
+# recorded as 'name'
+def traced(name, cat='rocker'):
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			if _tracer == None:
+				return fn(*args, **kwargs)
+
+			spanArgs = {}
+			if len(args) > 0 and isinstance(args[0], str):
+				spanArgs['name'] = args[0]
+			with _tracer.span(name, cat, spanArgs):
+				return fn(*args, **kwargs)
+		return wrapper
+	return decorator
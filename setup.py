@@ -58,17 +58,22 @@ setup(
 #        'Programming Language :: Python :: 2.6',
 #        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 
+    # importlib.metadata (see rocker.getVersion()) was added in Python 3.8
+    python_requires='>=3.8',
+
     # What does your project relate to?
     keywords='development docker',
 
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
-    packages=find_packages(exclude=['examples', 'docs', 'tests*']),
+    packages=find_packages(exclude=['examples', 'docs', 'tests*', 'benchmarks*']),
 
     # List run-time dependencies here.  These will be installed by pip when
     # your project is installed. For an analysis of "install_requires" vs pip's
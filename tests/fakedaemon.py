@@ -0,0 +1,862 @@
+from http.server import BaseHTTPRequestHandler
+from io import BytesIO
+
+import json
+import os
+import queue
+import re
+import shutil
+import socketserver
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Fake Docker daemon (implementing a small subset of the Engine API) listening on a UNIX socket
+#
+# It allows running rocker's client code paths (restclient, image.build, image.pull,
+# container.run, ...) in tests and benchmarks without a real docker daemon.
+#
+# Implemented endpoints (with or without an API version prefix like '/v1.41'):
+# - GET /version
+# - GET /events (streams events until the client disconnects or the daemon is stopped)
+# - GET /images/json, GET /images/<name>/json, DELETE /images/<name> (409 if the image is
+#   used by a container or has child images)
+# - POST /images/create?fromImage=<name>[&tag=<tag>] (streams pull progress messages, 404 for the names
+#   in unknownImages; maxConcurrentPulls records the highest number of simultaneous pulls)
+# - POST /build?t=<name>&labels=<json> (consumes the (chunked) tar upload, streams build messages)
+# - GET /containers/json, GET /containers/<name>/json, DELETE /containers/<name>[?v=1]
+# - POST /containers/create?name=<name> (creates anonymous volumes for Config.Volumes and named
+#   ones for 'name:/path' binds), POST /containers/<name>/start|stop
+# - DELETE /volumes/<name>, GET /system/df (volume sizes are the sizes of the files added below
+#   their mount points using addFile())
+# - GET /containers/<name>/logs (see addLogs(); follow=1 streams until the container stops)
+# - GET /containers/<name>/stats (streams a sample every statsInterval seconds until the container
+#   stops; stream=0 returns a single sample). Samples are deterministic: each one adds 1s to the
+#   'read' timestamp, .25 CPU seconds (i.e. 25%), 1000 received and 500 sent bytes.
+# - GET /containers/<name>/archive?path=<path>, PUT /containers/<name>/archive?path=<dir> (tar
+#   downloads/uploads of the container's files, see addFile())
+#
+# Knobs to simulate different daemons/network conditions:
+# - latency: seconds to wait before sending each response
+# - chunkSize: maximum number of bytes per socket write (and per HTTP chunk for
+#   streamed responses; streamed messages may straddle chunk boundaries)
+# - chunkDelay: seconds to wait between two writes
+# - payloadSize: number of padding bytes added to each inspect/list object (in the 'FakePadding' field)
+# - progressSteps: number of progress messages per pulled layer/build step
+# - statsInterval: seconds between two stats samples
+# - keepAlive: keep connections open after a response (instead of closing them),
+#   don't use it with endpoints streaming raw (unchunked) data. `connections` counts
+#   the connections the daemon has accepted
+#
+# Usage:
+#
+# with FakeDaemon() as daemon:
+#     r = Rocker(daemon.getUrl())
+#     daemon.addImage('debian:latest')
+#     ...
+class FakeDaemon:
+	def __init__(self, apiVersion='1.41', latency=0, chunkSize=None, chunkDelay=0, payloadSize=0, progressSteps=3, statsInterval=.05, keepAlive=False):
+		self.apiVersion = apiVersion
+		self.latency = latency
+		self.chunkSize = chunkSize
+		self.chunkDelay = chunkDelay
+		self.payloadSize = payloadSize
+		self.progressSteps = progressSteps
+		self.statsInterval = statsInterval
+		self.keepAlive = keepAlive
+		self.connections = 0
+
+		# list of (method, path) tuples (paths include the API version prefix and query string)
+		self.requests = []
+
+		self.unknownImages = set() # images that can't be pulled
+		self.maxConcurrentPulls = 0
+		self._activePulls = 0
+
+		self._containers = {} # name -> inspect data
+		self._images = {} # id -> inspect data
+		self._volumes = {} # name -> volume data
+		self._lock = threading.RLock()
+		self._changed = threading.Condition(self._lock) # notified when logs are added or containers stop
+		self._subscribers = []
+		self._server = None
+		self._stopped = threading.Event()
+		self._tmpDir = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.stop()
+
+	# Adds an image (and returns its inspect data)
+	def addImage(self, name, parent=None, size=1024, labels=None):
+		name = FakeDaemon._normalizeImageName(name)
+		now = time.time()
+
+		with self._lock:
+			parentId = ''
+			if parent != None:
+				parentImg = self.getImage(parent)
+				if parentImg != None:
+					parentId = parentImg['Id']
+
+			# the new image takes over the name
+			old = self.getImage(name)
+			if old != None:
+				old['RepoTags'].remove(name)
+
+			rc = {
+				'Id': FakeDaemon._newId('sha256:'),
+				'RepoTags': [name],
+				'Parent': parentId,
+				'Created': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))+'.000000000Z',
+				'ContainerConfig': {},
+				'Config': {'Labels': labels} if labels != None else {},
+				'Size': size,
+				'VirtualSize': size,
+				'_created': int(now)
+			}
+			self._images[rc['Id']] = rc
+
+		self._emit('image', 'tag', rc['Id'], {'name': name})
+		return rc
+
+	# Adds output to a container's logs (stream: 1 = stdout, 2 = stderr)
+	def addLogs(self, name, data, stream=1):
+		if type(data) == str:
+			data = data.encode('utf8')
+
+		with self._lock:
+			self.getContainer(name)['_logs'].append((stream, data))
+			self._changed.notify_all()
+
+	# Adds a file to a container's filesystem (served by the archive endpoints)
+	def addFile(self, name, path, data):
+		if type(data) == str:
+			data = data.encode('utf8')
+
+		with self._lock:
+			ctr = self.getContainer(name)
+			if path in ctr['_files']:
+				self._resizeVolume(ctr, path, -len(ctr['_files'][path]))
+			ctr['_files'][path] = data
+			self._resizeVolume(ctr, path, len(data))
+
+	# Adds a volume (anonymous if name is None) and returns its name
+	def addVolume(self, name=None, size=0):
+		with self._lock:
+			if name == None:
+				name = FakeDaemon._newId()
+			if name not in self._volumes:
+				self._volumes[name] = {
+					'Name': name,
+					'Driver': 'local',
+					'Mountpoint': '/var/lib/docker/volumes/{0}/_data'.format(name),
+					'Labels': None,
+					'Scope': 'local',
+					'_size': size
+				}
+		return name
+
+	# Returns the inspect data of the given container (or None)
+	def getContainer(self, name):
+		with self._lock:
+			if name in self._containers:
+				return self._containers[name]
+			for data in self._containers.values():
+				if data['Id'].startswith(name):
+					return data
+		return None
+
+	# Returns a container's files (as dict with absolute paths as keys)
+	def getFiles(self, name):
+		with self._lock:
+			return dict(self.getContainer(name)['_files'])
+
+	# Returns the names of all the volumes
+	def getVolumes(self):
+		with self._lock:
+			return sorted(self._volumes.keys())
+
+	# Returns the inspect data of the given image (by name or ID; or None)
+	def getImage(self, name):
+		with self._lock:
+			if name in self._images:
+				return self._images[name]
+
+			normalized = FakeDaemon._normalizeImageName(name)
+			for data in self._images.values():
+				if normalized in data['RepoTags'] or data['Id'][len('sha256:'):].startswith(name):
+					return data
+		return None
+
+	def getUrl(self):
+		return 'unix://'+self.getSocketPath()
+
+	def getSocketPath(self):
+		return os.path.join(self._tmpDir, 'docker.sock')
+
+	def start(self):
+		self._tmpDir = tempfile.mkdtemp(prefix='fakedaemon')
+		self._stopped.clear()
+
+		self._server = _Server(self.getSocketPath(), _RequestHandler)
+		self._server.daemon = self
+		threading.Thread(target=self._server.serve_forever, args=(.01,), name='fakedaemon', daemon=True).start()
+
+	# Stops the daemon (can be called more than once)
+	def stop(self):
+		if self._server == None:
+			return
+
+		self._stopped.set()
+		with self._lock:
+			for q in self._subscribers:
+				q.put(None)
+			self._changed.notify_all()
+
+		self._server.shutdown()
+		self._server.server_close()
+		self._server = None
+		shutil.rmtree(self._tmpDir, ignore_errors=True)
+
+	# Sends an event to all /events subscribers
+	def _emit(self, evType, action, objId, attributes):
+		now = time.time()
+		event = {
+			'Type': evType,
+			'Action': action,
+			'Actor': {'ID': objId, 'Attributes': attributes},
+			'status': action,
+			'id': objId,
+			'time': int(now),
+			'timeNano': int(now*1e9)
+		}
+
+		with self._lock:
+			for q in self._subscribers:
+				q.put(event)
+
+	# Returns the volume the given file of a container is stored in (or None)
+	def _getVolume(self, ctr, path):
+		for mount in ctr['Mounts']:
+			if mount['Type'] == 'volume' and path.startswith(mount['Destination'].rstrip('/')+'/'):
+				return self._volumes.get(mount['Name'])
+		return None
+
+	# Adds delta to the size of the volume the given file is stored in (if any)
+	def _resizeVolume(self, ctr, path, delta):
+		vol = self._getVolume(ctr, path)
+		if vol != None:
+			vol['_size'] += delta
+
+	# adds padding to objects returned to clients (see payloadSize)
+	def _pad(self, data):
+		rc = dict((k, v) for k, v in data.items() if not k.startswith('_'))
+		if self.payloadSize > 0:
+			rc['FakePadding'] = 'x'*self.payloadSize
+		return rc
+
+	@staticmethod
+	def _newId(prefix=''):
+		return prefix+uuid.uuid4().hex+uuid.uuid4().hex
+
+	@staticmethod
+	def _normalizeImageName(name):
+		if not ':' in name.rsplit('/', 1)[-1]:
+			name += ':latest'
+		return name
+
+# HostConfig keys the fake daemon knows about
+_HOST_CONFIG_KEYS = ['Binds', 'CapAdd', 'CapDrop', 'ExtraHosts', 'Links', 'LogConfig', 'NetworkMode', 'PortBindings',
+	'Privileged', 'RestartPolicy', 'ShmSize', 'Sysctls', 'Tmpfs', 'Ulimits', 'VolumesFrom']
+
+# Docker (or rather Go's JSON decoder) matches keys case insensitively => do the same
+def _canonicalizeKeys(data, keys):
+	lookup = dict((k.lower(), k) for k in keys)
+	return dict((lookup.get(k.lower(), k), v) for k, v in data.items())
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+# Handles a connection (there's one request per connection unless keepAlive is set)
+class _RequestHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	_VERSION_PREFIX = re.compile(r'^/v[0-9]+\.[0-9]+(/.*)$')
+
+	def setup(self):
+		super().setup()
+		with self.server.daemon._lock:
+			self.server.daemon.connections += 1
+
+	def do_DELETE(self):
+		self._handle('DELETE')
+
+	def do_GET(self):
+		self._handle('GET')
+
+	def do_POST(self):
+		self._handle('POST')
+
+	def do_PUT(self):
+		self._handle('PUT')
+
+	def log_message(self, format, *args):
+		pass # keep test output clean
+
+	def _handle(self, method):
+		daemon = self.server.daemon
+		self.close_connection = not daemon.keepAlive
+
+		with daemon._lock:
+			daemon.requests.append((method, self.path))
+
+		url = urllib.parse.urlsplit(self.path)
+		path = url.path
+		match = _RequestHandler._VERSION_PREFIX.match(path)
+		if match != None:
+			path = match.group(1)
+		query = dict(urllib.parse.parse_qsl(url.query))
+		parts = [urllib.parse.unquote(p) for p in path.strip('/').split('/')]
+		body = self._readBody()
+
+		if daemon.latency > 0:
+			time.sleep(daemon.latency)
+
+		if method == 'GET' and path == '/version':
+			self._sendJson(200, {
+				'ApiVersion': daemon.apiVersion,
+				'Arch': 'amd64',
+				'GitCommit': 'fakedaemon',
+				'GoVersion': 'go1.16',
+				'KernelVersion': '5.10.0',
+				'MinAPIVersion': '1.12',
+				'Os': 'linux',
+				'Version': '20.10.0'
+			})
+		elif method == 'GET' and path == '/events':
+			self._streamEvents()
+		elif method == 'POST' and path == '/build':
+			self._build(query, body)
+		elif method == 'GET' and path == '/system/df':
+			self._diskUsage()
+		elif parts[0] == 'images':
+			self._handleImages(method, parts, query)
+		elif parts[0] == 'containers':
+			self._handleContainers(method, parts, query, body)
+		elif method == 'DELETE' and len(parts) == 2 and parts[0] == 'volumes':
+			self._deleteVolume(parts[1])
+		else:
+			self._sendError(404, "page not found")
+
+	def _handleImages(self, method, parts, query):
+		daemon = self.server.daemon
+
+		if method == 'GET' and parts == ['images', 'json']:
+			rc = []
+			with daemon._lock:
+				for img in daemon._images.values():
+					rc.append(daemon._pad({
+						'Id': img['Id'],
+						'ParentId': img['Parent'],
+						'RepoTags': img['RepoTags'],
+						'Created': img['_created'],
+						'Size': img['Size'],
+						'VirtualSize': img['VirtualSize']
+					}))
+			self._sendJson(200, rc)
+		elif method == 'POST' and parts == ['images', 'create']:
+			self._pull(query)
+		elif len(parts) >= 2:
+			# image names may contain slashes
+			if method == 'GET' and parts[-1] == 'json':
+				name = '/'.join(parts[1:-1])
+			else:
+				name = '/'.join(parts[1:])
+
+			img = daemon.getImage(name)
+			if img == None:
+				self._sendError(404, "No such image: {0}".format(name))
+			elif method == 'GET':
+				self._sendJson(200, daemon._pad(img))
+			elif method == 'DELETE':
+				shortId = img['Id'][len('sha256:'):len('sha256:')+12]
+				with daemon._lock:
+					users = [c['Id'] for c in daemon._containers.values() if c['Image'] == img['Id']]
+					children = [i for i in daemon._images.values() if i['Parent'] == img['Id']]
+					if len(users) == 0 and len(children) == 0:
+						del daemon._images[img['Id']]
+
+				if len(users) > 0:
+					self._sendError(409, "conflict: unable to delete {0} (must be forced) - image is being used by stopped container {1}".format(shortId, users[0][:12]))
+				elif len(children) > 0:
+					self._sendError(409, "conflict: unable to delete {0} (cannot be forced) - image has dependent child images".format(shortId))
+				else:
+					daemon._emit('image', 'delete', img['Id'], {'name': name})
+					self._sendJson(200, [{'Untagged': t} for t in img['RepoTags']]+[{'Deleted': img['Id']}])
+			else:
+				self._sendError(404, "page not found")
+		else:
+			self._sendError(404, "page not found")
+
+	def _handleContainers(self, method, parts, query, body):
+		daemon = self.server.daemon
+
+		if method == 'GET' and parts == ['containers', 'json']:
+			rc = []
+			with daemon._lock:
+				for ctr in daemon._containers.values():
+					if ctr['State']['Running'] or query.get('all') in ('1', 'true'):
+						rc.append(daemon._pad({
+							'Id': ctr['Id'],
+							'Names': [ctr['Name']],
+							'Image': ctr['Config'].get('Image'),
+							'ImageID': ctr['Image'],
+							'Created': ctr['_created'],
+							'State': ctr['State']['Status']
+						}))
+			self._sendJson(200, rc)
+		elif method == 'POST' and parts == ['containers', 'create']:
+			self._createContainer(query, body)
+		elif len(parts) in [2, 3]:
+			ctr = daemon.getContainer(parts[1])
+			action = parts[2] if len(parts) == 3 else None
+
+			if ctr == None:
+				self._sendError(404, "No such container: {0}".format(parts[1]))
+			elif method == 'GET' and action == 'json':
+				self._sendJson(200, daemon._pad(ctr))
+			elif method == 'GET' and action == 'logs':
+				self._streamLogs(ctr, query)
+			elif method == 'GET' and action == 'stats':
+				self._streamStats(ctr, query)
+			elif method == 'GET' and action == 'archive':
+				self._getArchive(ctr, query)
+			elif method == 'PUT' and action == 'archive':
+				self._putArchive(ctr, query, body)
+			elif method == 'POST' and action in ['start', 'stop']:
+				running = (action == 'start')
+				if ctr['State']['Running'] == running:
+					self._sendEmpty(304)
+				else:
+					with daemon._lock:
+						ctr['State']['Running'] = running
+						ctr['State']['Status'] = 'running' if running else 'exited'
+						daemon._changed.notify_all()
+					daemon._emit('container', action, ctr['Id'], {'name': ctr['Name'][1:], 'image': ctr['Config'].get('Image')})
+					self._sendEmpty(204)
+			elif method == 'DELETE' and action == None:
+				if ctr['State']['Running'] and query.get('force') not in ('1', 'true'):
+					self._sendError(409, "You cannot remove a running container {0}. Stop the container before attempting removal or force remove".format(ctr['Id']))
+				else:
+					with daemon._lock:
+						del daemon._containers[ctr['Name'][1:]]
+						if query.get('v') in ('1', 'true'):
+							for mount in ctr['Mounts']:
+								if mount['Type'] == 'volume' and mount.get('_anonymous'):
+									daemon._volumes.pop(mount['Name'], None)
+						daemon._changed.notify_all()
+					daemon._emit('container', 'destroy', ctr['Id'], {'name': ctr['Name'][1:], 'image': ctr['Config'].get('Image')})
+					self._sendEmpty(204)
+			else:
+				self._sendError(404, "page not found")
+		else:
+			self._sendError(404, "page not found")
+
+	def _build(self, query, body):
+		daemon = self.server.daemon
+		name = query.get('t')
+
+		with tarfile.open(fileobj=BytesIO(body)) as tar:
+			try:
+				dockerfile = tar.extractfile('Dockerfile').read().decode('utf8')
+			except KeyError:
+				self._sendError(500, "Cannot locate specified Dockerfile: Dockerfile")
+				return
+
+		steps = [l.strip() for l in dockerfile.splitlines() if len(l.strip()) > 0 and not l.strip().startswith('#')]
+		parent = None
+		messages = []
+		for i, step in enumerate(steps):
+			messages.append({'stream': "Step {0}/{1} : {2}\n".format(i+1, len(steps), step)})
+			if step.split()[0].upper() == 'FROM':
+				parent = step.split()[1]
+			for j in range(daemon.progressSteps):
+				messages.append({'stream': " ---> step {0} progress {1}/{2}\n".format(i+1, j+1, daemon.progressSteps)})
+
+		labels = json.loads(query['labels']) if 'labels' in query else None
+		img = daemon.addImage(name or FakeDaemon._newId(), parent=parent, size=len(body), labels=labels)
+		messages.append({'stream': "Successfully built {0}\n".format(img['Id'][len('sha256:'):len('sha256:')+12])})
+		if name != None:
+			messages.append({'stream': "Successfully tagged {0}\n".format(img['RepoTags'][0])})
+
+		self._sendStream(messages)
+
+	def _createContainer(self, query, body):
+		daemon = self.server.daemon
+		name = query.get('name') or FakeDaemon._newId()[:16]
+		config = json.loads(body.decode('utf8')) if len(body) > 0 else {}
+
+		img = daemon.getImage(config.get('Image') or '')
+		if img == None:
+			self._sendError(404, "No such image: {0}".format(config.get('Image')))
+			return
+
+		now = time.time()
+		with daemon._lock:
+			if name in daemon._containers:
+				self._sendError(409, 'Conflict. The container name "/{0}" is already in use by container "{1}". You have to remove (or rename) that container to be able to reuse that name.'.format(name, daemon._containers[name]['Id']))
+				return
+
+			hostConfig = _canonicalizeKeys(config.pop('HostConfig', None) or {}, _HOST_CONFIG_KEYS)
+			if 'Links' in hostConfig:
+				# docker reports links as '/<container>:/<name>/<alias>'
+				hostConfig['Links'] = ['/{0}:/{1}/{2}'.format(l.split(':')[0], name, l.split(':')[-1]) for l in hostConfig['Links']]
+			mounts = []
+			for path in config.get('Volumes') or {}:
+				mounts.append({'Type': 'volume', 'Name': daemon.addVolume(), 'Destination': path, '_anonymous': True})
+			for bind in hostConfig.get('Binds') or []:
+				source, dest = bind.split(':')[:2]
+				if source.startswith('/'):
+					mounts.append({'Type': 'bind', 'Source': source, 'Destination': dest})
+				else:
+					mounts.append({'Type': 'volume', 'Name': daemon.addVolume(source), 'Destination': dest})
+
+			ctr = {
+				'Id': FakeDaemon._newId(),
+				'Name': '/'+name,
+				'Image': img['Id'],
+				'Created': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))+'.000000000Z',
+				'Config': config,
+				'HostConfig': hostConfig,
+				'Mounts': mounts,
+				'State': {'Status': 'created', 'Running': False},
+				'_files': {},
+				'_logs': [],
+				'_statsSamples': 0,
+				'_created': int(now)
+			}
+			daemon._containers[name] = ctr
+
+		daemon._emit('container', 'create', ctr['Id'], {'name': name, 'image': config.get('Image')})
+		self._sendJson(201, {'Id': ctr['Id'], 'Warnings': None})
+
+	def _deleteVolume(self, name):
+		daemon = self.server.daemon
+
+		with daemon._lock:
+			users = [c['Id'] for c in daemon._containers.values() if any(m.get('Name') == name for m in c['Mounts'])]
+			found = name in daemon._volumes
+			if found and len(users) == 0:
+				del daemon._volumes[name]
+
+		if not found:
+			self._sendError(404, "get {0}: no such volume".format(name))
+		elif len(users) > 0:
+			self._sendError(409, "remove {0}: volume is in use - [{1}]".format(name, ', '.join(users)))
+		else:
+			self._sendEmpty(204)
+
+	# Sends the GET /system/df response (image sizes don't account for shared layers, i.e. SharedSize is always 0)
+	def _diskUsage(self):
+		daemon = self.server.daemon
+
+		with daemon._lock:
+			containers = list(daemon._containers.values())
+			images = []
+			for img in daemon._images.values():
+				images.append({
+					'Id': img['Id'],
+					'ParentId': img['Parent'],
+					'RepoTags': img['RepoTags'] or ['<none>:<none>'],
+					'Created': img['_created'],
+					'Size': img['Size'],
+					'SharedSize': 0,
+					'VirtualSize': img['VirtualSize'],
+					'Labels': img['Config'].get('Labels'),
+					'Containers': len([c for c in containers if c['Image'] == img['Id']])
+				})
+
+			volumes = []
+			for vol in daemon._volumes.values():
+				refCount = len([c for c in containers if any(m.get('Name') == vol['Name'] for m in c['Mounts'])])
+				volumes.append(dict(daemon._pad(vol), UsageData={'Size': vol['_size'], 'RefCount': refCount}))
+
+			rc = {
+				'LayersSize': sum(img['Size'] for img in daemon._images.values()),
+				'Images': images,
+				'Containers': [{
+					'Id': c['Id'],
+					'Names': [c['Name']],
+					'Image': c['Config'].get('Image'),
+					'ImageID': c['Image'],
+					'Labels': c['Config'].get('Labels'),
+					'State': c['State']['Status'],
+					'SizeRw': sum(len(data) for path, data in c['_files'].items() if daemon._getVolume(c, path) == None),
+					'Mounts': [daemon._pad(m) for m in c['Mounts']]
+				} for c in containers],
+				'Volumes': volumes
+			}
+
+		self._sendJson(200, rc)
+
+	# Sends the files below query['path'] as tar stream (like docker, the tar's entries
+	# start with the path's basename)
+	def _getArchive(self, ctr, query):
+		daemon = self.server.daemon
+		path = query.get('path', '').rstrip('/')
+		prefix = os.path.basename(path)
+
+		with daemon._lock:
+			files = [(p, data) for p, data in sorted(ctr['_files'].items()) if p.startswith(path+'/')]
+		if len(files) == 0:
+			self._sendError(404, "Could not find the file {0} in container {1}".format(path, ctr['Name'][1:]))
+			return
+
+		buff = BytesIO()
+		with tarfile.open(fileobj=buff, mode='w') as tar:
+			info = tarfile.TarInfo(prefix)
+			info.type = tarfile.DIRTYPE
+			info.mode = 0o755
+			tar.addfile(info)
+			for p, data in files:
+				info = tarfile.TarInfo(prefix+p[len(path):])
+				info.size = len(data)
+				tar.addfile(info, BytesIO(data))
+
+		self._startChunked('application/x-tar')
+		self._writeChunk(buff.getvalue())
+		self._writeChunk(b'')
+
+	# Extracts the uploaded tar into query['path']
+	def _putArchive(self, ctr, query, body):
+		daemon = self.server.daemon
+		path = query.get('path', '').rstrip('/')
+
+		with tarfile.open(fileobj=BytesIO(body)) as tar, daemon._lock:
+			for member in tar.getmembers():
+				if member.isfile():
+					ctr['_files'][path+'/'+member.name] = tar.extractfile(member).read()
+
+		# like docker: no Content-Type for the empty response
+		self.send_response(200)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def _pull(self, query):
+		daemon = self.server.daemon
+		name = query.get('fromImage', '')
+		if 'tag' in query:
+			name = "{0}:{1}".format(name, query['tag'])
+		name = FakeDaemon._normalizeImageName(name)
+		if name in [FakeDaemon._normalizeImageName(n) for n in daemon.unknownImages]:
+			self._sendError(404, "pull access denied for {0}, repository does not exist".format(name.rsplit(':', 1)[0]))
+			return
+
+		with daemon._lock:
+			daemon._activePulls += 1
+			daemon.maxConcurrentPulls = max(daemon.maxConcurrentPulls, daemon._activePulls)
+
+		messages = [{'status': "Pulling from {0}".format(name.rsplit(':', 1)[0]), 'id': name.rsplit(':', 1)[1]}]
+		for layer in ['a1b2c3d4e5f6', 'b2c3d4e5f6a1']:
+			messages.append({'status': 'Pulling fs layer', 'id': layer})
+			for i in range(daemon.progressSteps):
+				total = 1000*daemon.progressSteps
+				messages.append({'status': 'Downloading', 'id': layer, 'progressDetail': {'current': 1000*(i+1), 'total': total}, 'progress': "[{0}>] {1}kB/{2}kB".format('='*(i+1), i+1, daemon.progressSteps)})
+			messages.append({'status': 'Pull complete', 'id': layer, 'progressDetail': {}})
+
+		img = daemon.addImage(name)
+		daemon._emit('image', 'pull', img['Id'], {'name': name})
+		messages.append({'status': "Digest: {0}".format(img['Id'])})
+		messages.append({'status': "Status: Downloaded newer image for {0}".format(name)})
+
+		try:
+			self._sendStream(messages)
+		finally:
+			with daemon._lock:
+				daemon._activePulls -= 1
+
+	# Reads the request body (both Content-Length and chunked transfer encoding are supported)
+	def _readBody(self):
+		if (self.headers.get('Transfer-Encoding') or '').lower() == 'chunked':
+			rc = []
+			while True:
+				length = int(self.rfile.readline().strip(), 16)
+				rc.append(self.rfile.read(length))
+				self.rfile.readline() # CRLF after the chunk's data
+				if length == 0:
+					break
+			return b''.join(rc)
+		elif 'Content-Length' in self.headers:
+			return self.rfile.read(int(self.headers['Content-Length']))
+		return b''
+
+	def _sendEmpty(self, status):
+		self.send_response(status)
+		if status != 204:
+			self.send_header('Content-Type', 'text/plain; charset=utf-8')
+			self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def _sendError(self, status, message):
+		self._sendJson(status, {'message': message})
+
+	def _sendJson(self, status, data):
+		body = json.dumps(data).encode('utf8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.flush()
+		self._write(body)
+
+	# Sends the given JSON messages as chunked response
+	def _sendStream(self, messages):
+		self._startChunked()
+		data = b''.join(json.dumps(m).encode('utf8')+b'\r\n' for m in messages)
+		self._writeChunk(data)
+		self._writeChunk(b'')
+
+	def _startChunked(self, contentType='application/json'):
+		self.send_response(200)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Transfer-Encoding', 'chunked')
+		self.end_headers()
+		self.wfile.flush()
+
+	def _streamEvents(self):
+		daemon = self.server.daemon
+		q = queue.Queue()
+		with daemon._lock:
+			daemon._subscribers.append(q)
+
+		try:
+			self._startChunked()
+			while not daemon._stopped.is_set():
+				event = q.get()
+				if event == None:
+					break
+				self._writeChunk(json.dumps(event).encode('utf8')+b'\n')
+			self._writeChunk(b'')
+		except OSError:
+			pass # client disconnected
+		finally:
+			with daemon._lock:
+				daemon._subscribers.remove(q)
+
+	# Sends a container's logs (multiplexed unless the container has a TTY)
+	def _streamLogs(self, ctr, query):
+		daemon = self.server.daemon
+		tty = ctr['Config'].get('Tty', False)
+		follow = query.get('follow') in ('1', 'true')
+		tail = query.get('tail', 'all')
+
+		def encode(entries):
+			rc = []
+			for stream, data in entries:
+				if not tty:
+					rc.append(struct.pack('>BxxxL', stream, len(data)))
+				rc.append(data)
+			return b''.join(rc)
+
+		with daemon._lock:
+			entries = list(ctr['_logs'])
+			pos = len(entries)
+		if tail != 'all':
+			entries = entries[len(entries)-int(tail):] if int(tail) > 0 else []
+
+		self._startChunked('application/vnd.docker.raw-stream' if tty else 'application/vnd.docker.multiplexed-stream')
+		if len(entries) > 0:
+			self._writeChunk(encode(entries))
+
+		while follow:
+			with daemon._lock:
+				while len(ctr['_logs']) == pos and ctr['State']['Running'] and not daemon._stopped.is_set():
+					daemon._changed.wait(.1)
+				entries = ctr['_logs'][pos:]
+				pos = len(ctr['_logs'])
+				done = not ctr['State']['Running'] or daemon._stopped.is_set()
+
+			if len(entries) > 0:
+				self._writeChunk(encode(entries))
+			if done:
+				break
+
+		self._writeChunk(b'')
+
+	# Sends stats samples (see the class comment)
+	def _streamStats(self, ctr, query):
+		daemon = self.server.daemon
+
+		def nextSample(withPrecpu):
+			with daemon._lock:
+				ctr['_statsSamples'] += 1
+				n = ctr['_statsSamples']
+
+			def cpuStats(n):
+				return {'cpu_usage': {'total_usage': n*250000000}, 'system_cpu_usage': n*2000000000, 'online_cpus': 2}
+
+			return {
+				'id': ctr['Id'],
+				'name': ctr['Name'],
+				'read': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(1000000000+n))+'.000000000Z',
+				'pids_stats': {'current': 3},
+				'cpu_stats': cpuStats(n),
+				'precpu_stats': cpuStats(n-1) if withPrecpu else {'cpu_usage': {'total_usage': 0}},
+				'memory_stats': {'usage': 100*1024*1024, 'limit': 1024*1024*1024, 'stats': {'inactive_file': 10*1024*1024}},
+				'networks': {'eth0': {'rx_bytes': n*1000, 'tx_bytes': n*500}}
+			}
+
+		if query.get('stream') in ('0', 'false'):
+			self._sendJson(200, nextSample(True))
+			return
+
+		try:
+			self._startChunked()
+			first = True
+			while True:
+				self._writeChunk(json.dumps(nextSample(not first)).encode('utf8')+b'\n')
+				first = False
+
+				with daemon._lock:
+					daemon._changed.wait(daemon.statsInterval)
+					if not ctr['State']['Running'] or daemon._stopped.is_set():
+						break
+			self._writeChunk(b'')
+		except OSError:
+			pass # client disconnected
+
+	# Writes data, split into pieces of at most chunkSize bytes
+	def _write(self, data):
+		daemon = self.server.daemon
+		size = daemon.chunkSize or max(len(data), 1)
+
+		for pos in range(0, len(data), size):
+			if pos > 0 and daemon.chunkDelay > 0:
+				time.sleep(daemon.chunkDelay)
+			self.wfile.write(data[pos:pos+size])
+			self.wfile.flush()
+
+	# Writes data as HTTP chunk(s) (each of them at most chunkSize bytes long)
+	def _writeChunk(self, data):
+		daemon = self.server.daemon
+		size = daemon.chunkSize or max(len(data), 1)
+
+		if len(data) == 0:
+			self.wfile.write(b'0\r\n\r\n')
+			self.wfile.flush()
+			return
+
+		for pos in range(0, len(data), size):
+			if pos > 0 and daemon.chunkDelay > 0:
+				time.sleep(daemon.chunkDelay)
+			piece = data[pos:pos+size]
+			self.wfile.write("{0:x}\r\n".format(len(piece)).encode('ascii')+piece+b'\r\n')
+			self.wfile.flush()
@@ -0,0 +1,35 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import os
+import tempfile
+
+# Base class for tests working on a rocker project directory
+#
+# Each test runs in its own temporary directory (which also is $XDG_CACHE_HOME, to
+# keep the docker version cache out of ~/.cache). Subclasses can set additional
+# environment variables by overriding getEnv().
+class ProjectTestCase(TestCase):
+	def setUp(self):
+		self.origCwd = os.getcwd()
+		self.tmpDir = tempfile.TemporaryDirectory()
+		os.chdir(self.tmpDir.name)
+
+		self.env = patch.dict('os.environ', self.getEnv())
+		self.env.start()
+
+	def tearDown(self):
+		self.env.stop()
+		os.chdir(self.origCwd)
+		self.tmpDir.cleanup()
+
+	# Returns the environment variables to set while the test is running
+	def getEnv(self):
+		return {'XDG_CACHE_HOME': self.tmpDir.name}
+
+	# Writes a file (relative to the project directory, creating its parent directories if necessary)
+	def writeFile(self, path, data):
+		if os.path.dirname(path) != '':
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'w') as f:
+			f.write(data)
@@ -0,0 +1,131 @@
+from rocker import backup
+from rocker.backup import Compressor, Decompressor
+from rocker.restclient import Request
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import gzip
+import json
+import os
+import random
+import tarfile
+import tempfile
+
+class CompressorTest(TestCase):
+	def testRoundTrip(self):
+		data = random.Random(1).randbytes(5000) + b'compressible '*10000
+
+		with tempfile.TemporaryDirectory() as tmpDir:
+			path = os.path.join(tmpDir, 'data.gz')
+
+			# tiny buffers (i.e. lots of buffer recycling)
+			c = Compressor(path, bufferSize=100, bufferCount=2)
+			try:
+				for pos in range(0, len(data), 100):
+					buff = c.getBuffer()
+					piece = data[pos:pos+100]
+					buff[:len(piece)] = piece
+					c.write(buff, len(piece))
+			finally:
+				c.close()
+			self.assertEqual(c.getSize(), len(data))
+
+			with gzip.open(path) as f:
+				self.assertEqual(f.read(), data)
+
+			d = Decompressor(path, bufferSize=1000, queueSize=2)
+			try:
+				pieces = list(d)
+			finally:
+				d.close()
+			self.assertEqual(b''.join(pieces), data)
+			self.assertLessEqual(max(len(p) for p in pieces), 1000)
+
+	def testAbort(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			path = os.path.join(tmpDir, 'data.gz')
+			with gzip.open(path, 'wb') as f:
+				f.write(b'x'*100000)
+
+			# stop reading early (the decompressor thread mustn't block forever)
+			d = Decompressor(path, bufferSize=10, queueSize=1)
+			next(iter(d))
+			d.close()
+
+			# truncated files
+			with open(path, 'rb') as f:
+				data = f.read()
+			with open(path, 'wb') as f:
+				f.write(data[:len(data)//2])
+
+			d = Decompressor(path)
+			with self.assertRaises(Exception):
+				list(d)
+			d.close()
+
+class BackupTest(ProjectTestCase):
+	def _createContainer(self, daemon, name, volumes):
+		with open('{0}.rocker'.format(name), 'w') as f:
+			json.dump({'image': 'debian', 'volumes': volumes}, f)
+
+		with Request(daemon.getUrl()) as req:
+			req.doPost('/containers/create?name={0}'.format(name)).send({'Image': 'debian'}).getObject()
+
+	def testBackupRestore(self):
+		data = random.Random(2).randbytes(300000)
+
+		with FakeDaemon(chunkSize=4096) as daemon, patch('sys.stdout', new=StringIO()):
+			daemon.addImage('debian')
+			self._createContainer(daemon, 'db', ['/var/lib/mysql', '/etc/mysql/'])
+			daemon.addFile('db', '/var/lib/mysql/ibdata1', data)
+			daemon.addFile('db', '/var/lib/mysql/db/table.frm', "table")
+			daemon.addFile('db', '/etc/mysql/my.cnf', "[mysqld]\n")
+			files = daemon.getFiles('db')
+
+			r = Rocker(daemon.getUrl())
+			path = backup.backupContainer('db', r=r)
+			self.assertEqual(os.path.dirname(path), os.path.join('backups', 'db'))
+			self.assertEqual(backup.findLatest('db'), path)
+
+			with open(os.path.join(path, 'manifest.json')) as f:
+				manifest = json.load(f)
+			self.assertEqual([(v['path'], v['file']) for v in manifest['volumes']], [('/var/lib/mysql', 'var_lib_mysql.tar.gz'), ('/etc/mysql/', 'etc_mysql.tar.gz')])
+
+			# the backup files are regular .tar.gz files
+			with tarfile.open(os.path.join(path, 'var_lib_mysql.tar.gz')) as tar:
+				self.assertEqual(tar.extractfile('mysql/ibdata1').read(), data)
+
+			# restore into a new container
+			with Request(daemon.getUrl()) as req:
+				req.doDelete('/containers/db').send()
+			self._createContainer(daemon, 'db', ['/var/lib/mysql', '/etc/mysql/'])
+			self.assertEqual(daemon.getFiles('db'), {})
+
+			self.assertTrue(backup.restoreContainer('db', r=r))
+			self.assertEqual(daemon.getFiles('db'), files)
+
+	def testParallel(self):
+		with FakeDaemon() as daemon, patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()):
+			daemon.addImage('debian')
+			for name in ['web', 'db', 'cache']:
+				self._createContainer(daemon, name, ['/data'])
+				daemon.addFile(name, '/data/{0}.txt'.format(name), name)
+			self._createContainer(daemon, 'proxy', []) # no volumes => skipped
+			self._createContainer(daemon, 'broken', ['/nonexistent'])
+
+			r = Rocker(daemon.getUrl())
+			self.assertFalse(backup.backup(['web', 'db', 'cache', 'proxy', 'broken'], parallel=3, r=r))
+			self.assertTrue(backup.backup(['web', 'db', 'cache', 'proxy'], parallel=3, r=r))
+
+			for name in ['web', 'db', 'cache']:
+				self.assertNotEqual(backup.findLatest(name), None)
+			self.assertEqual(backup.findLatest('proxy'), None)
+			self.assertEqual(os.listdir(os.path.join('backups', 'broken')), []) # incomplete backups are removed
+
+			self.assertIn("[web] Backup written to", out.getvalue())
+			self.assertFalse(backup.restore(['web', 'proxy'], parallel=2, r=r)) # there's no backup of 'proxy'
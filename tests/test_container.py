@@ -1,6 +1,20 @@
-from rocker.container import Container
+from rocker import container
+from rocker.container import Container, ConfigLoader
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
 
+from io import StringIO
 from unittest import TestCase
+from unittest.mock import patch
+
+import json
+import os
+import tempfile
+
+# Rocker instance that doesn't need a docker daemon
+class OfflineRocker(Rocker):
+	def checkApiVersion(self, minVersion, failMsg=False):
+		return True
 
 class ContainerTest(TestCase):
 	# Check that all getters return the value we expect
@@ -13,6 +27,9 @@ class ContainerTest(TestCase):
 			'getEnvironment': {},
 			'getLinks': {},
 			'getPorts': [],
+			'getSysctls': {},
+			'getTmpfs': {},
+			'getUlimits': [],
 			'getVolumes': []
 		})
 
@@ -46,7 +63,15 @@ class ContainerTest(TestCase):
 			"cmd": ["hello", "world"],
 			"entrypoint": ["/bin/echo"],
 			"restart": False,
-			"raw": {"Foo": 1234}
+			"raw": {"Foo": 1234},
+			"logging": {"driver": "json-file", "maxSize": "50m", "maxFile": 5, "options": {"compress": "true"}},
+			"shmSize": "256m",
+			"sysctls": {"net.core.somaxconn": "1024"},
+			"tmpfs": {"/run": "", "/scratch": "size=1g,mode=1777"},
+			"ulimits": {
+				"nofile": 65536,
+				"memlock": {"soft": 1024, "hard": -1}
+			}
 		}
 
 		try:
@@ -64,6 +89,232 @@ class ContainerTest(TestCase):
 		finally:
 			Container._mkdirs = originalMkdirs
 
+	def testResourceTuning(self):
+		cfg = {
+			"image": "fooImg",
+			"shmSize": "64m",
+			"sysctls": {"net.core.somaxconn": 1024},
+			"tmpfs": ["/run", "/scratch:size=512k"],
+			"ulimits": {"nofile": {"soft": 1024, "hard": 4096}}
+		}
+
+		hostConfig = Container.fromRockerConfig("foo", dict(cfg)).toApiJson()['HostConfig']
+		self.assertEqual(hostConfig['ShmSize'], 64*1024*1024)
+		self.assertEqual(hostConfig['Sysctls'], {"net.core.somaxconn": "1024"})
+		self.assertEqual(hostConfig['Tmpfs'], {"/run": "", "/scratch": "size=512k"})
+		self.assertEqual(hostConfig['Ulimits'], [{"Name": "nofile", "Soft": 1024, "Hard": 4096}])
+
+		# ... and back
+		c = Container.fromApiJson({"Id": "123", "Image": "fooImg", "Created": None, "HostConfig": hostConfig})
+		self.assertEqual(c.getShmSize(), 64*1024*1024)
+		self.assertEqual(c.getTmpfs(), {"/run": "", "/scratch": "size=512k"})
+		self.assertEqual(c.toRockerFile()['ulimits'], {"nofile": {"soft": 1024, "hard": 4096}})
+
+	def testLogging(self):
+		# unset options will be filled with defaults
+		c = Container.fromRockerConfig("foo", {"image": "fooImg", "logging": {"maxSize": "50m"}})
+		self.assertEqual(c.toApiJson()['HostConfig']['LogConfig'], {
+			"Type": "json-file",
+			"Config": {"max-size": "50m", "max-file": "3", "mode": "non-blocking", "max-buffer-size": "4m"}
+		})
+
+		c = Container.fromRockerConfig("foo", {"image": "fooImg", "logging": {"driver": "syslog", "mode": "blocking", "options": {"tag": "foo"}}})
+		self.assertEqual(c.toApiJson()['HostConfig']['LogConfig'], {"Type": "syslog", "Config": {"mode": "blocking", "tag": "foo"}})
+
+		c = Container.fromRockerConfig("foo", {"image": "fooImg", "logging": "none"})
+		self.assertEqual(c.toApiJson()['HostConfig']['LogConfig'], {"Type": "none", "Config": {}})
+
+		# no logging config -> use the daemon's defaults
+		c = Container.fromRockerConfig("foo", {"image": "fooImg"})
+		self.assertFalse('LogConfig' in c.toApiJson()['HostConfig'])
+
+		# parse docker's format
+		c = Container.fromApiJson({"Id": "123", "Image": "fooImg", "Created": None, "HostConfig": {
+			"LogConfig": {"Type": "json-file", "Config": {"max-size": "10m", "max-file": "3", "compress": "true"}}
+		}})
+		self.assertEqual(c.toRockerFile()['logging'], {"driver": "json-file", "maxSize": "10m", "maxFile": 3, "options": {"compress": "true"}})
+
+		for invalid in [{"driver": "syslog", "maxSize": "10m"}, {"maxFile": 0}, {"mode": "async"}, {"mode": "blocking", "maxBufferSize": "1m"}, {"foo": "bar"}, 123]:
+			with self.assertRaises(ValueError, msg=str(invalid)):
+				Container.fromRockerConfig("foo", {"image": "fooImg", "logging": invalid})
+
+	# project-wide defaults (unsupported keys are reported using the Rocker instance)
+	def testProjectDefaults(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			name = os.path.join(tmpDir, 'foo')
+			with open(name+'.rocker', 'w') as f:
+				json.dump({"image": "fooImg"}, f)
+			with open(os.path.join(tmpDir, 'rocker-defaults.json'), 'w') as f:
+				json.dump({"logging": {"driver": "syslog"}, "restart": False}, f)
+
+			r = OfflineRocker()
+			r.setOutputMode('jsonl')
+			with patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()) as err:
+				c = ConfigLoader().load(name, r)
+
+			self.assertEqual(c.toApiJson()['HostConfig']['LogConfig']['Type'], "syslog")
+			events = [json.loads(l) for l in out.getvalue().splitlines()]
+			self.assertEqual([e['level'] for e in events], ['warning'])
+			self.assertIn("unsupported rocker-defaults.json key: 'restart'", events[0]['msg'])
+			self.assertEqual(err.getvalue(), '')
+
+	def testFromApiJson(self):
+		data = {
+			"Id": "123",
+			"Name": "/abc",
+			"Image": "sha256:456",
+			"Created": "2016-01-01T12:00:00.000000000Z",
+			"State": {"Running": True},
+			"Config": {
+				"Env": ["VAR1=value1", "VAR2=a=b"],
+				"Cmd": ["hello", "world"],
+				"Entrypoint": ["/bin/echo"],
+				"Volumes": {"/home": {}, "/bar/": {}}
+			},
+			"HostConfig": {
+				"Binds": ["/foo:/bar/", "/etc/apt:apt/:ro"],
+				"Links": ["/mysql:/abc/db", "/container2:/abc/container2"],
+				"PortBindings": {
+					"80/tcp": [{"HostIp": "", "HostPort": "80"}],
+					"1234/tcp": [{"HostIp": "", "HostPort": "2345"}],
+					"53/udp": [{"HostIp": "127.0.0.1", "HostPort": "53"}]
+				},
+				"RestartPolicy": {"Name": "on-failure", "MaximumRetryCount": 5},
+				"VolumesFrom": ["other1", "other2:ro"]
+			}
+		}
+
+		c = Container.fromApiJson(data)
+
+		# the hot path doesn't decode anything else
+		self.assertTrue(c.isRunning())
+		self.assertEqual(c.getImage(), "sha256:456")
+		self.assertEqual(c.getId(), "123")
+		with self.assertRaises(AttributeError):
+			Container._env.__get__(c)
+
+		self.assertEqual(c.getDependencies(), {"mysql", "container2", "other1", "other2"})
+
+		cfg = c.toRockerFile()
+		cfg['links'].sort()
+		self.assertEqual(cfg, {
+			"image": "sha256:456",
+			"env": {"VAR1": "value1", "VAR2": "a=b"},
+			"cmd": ["hello", "world"],
+			"entrypoint": ["/bin/echo"],
+			"links": ["container2", "mysql:db"],
+			"ports": [80, {"int": 1234, "ext": 2345}, {"int": 53, "ext": 53, "proto": "udp", "extIp": "127.0.0.1"}],
+			"restart": 5,
+			"volumes": [{"src": "/foo", "tgt": "/bar/"}, {"src": "/etc/apt", "tgt": "apt/", "ro": True}, {"tgt": "/home"}],
+			"volumesFrom": ["other1", "other2"]
+		})
+
+		# the inspect data is only kept until all the fields have been decoded
+		self.assertEqual(c._apiConfig, (data['Config'], data['HostConfig']))
+		for attr in Container._API_DECODERS:
+			getattr(c, attr)
+		self.assertEqual(c._apiConfig, None)
+		self.assertEqual(c.getVolumesFrom(), ["other1", "other2"])
+
+		c = Container.fromApiJson(data, lazy=False)
+		self.assertEqual(c._apiConfig, None)
+		self.assertEqual(c.getEnvironment(), {"VAR1": "value1", "VAR2": "a=b"})
+
+		# the inspect data must not be modified
+		self.assertEqual(data['Name'], "/abc")
+		self.assertEqual(data['State'], {"Running": True})
+
+	def testResourceTuningValidation(self):
+		invalid = [
+			{"shmSize": "64x"},
+			{"shmSize": -1},
+			{"sysctls": ["net.core.somaxconn=1024"]},
+			{"tmpfs": {"relative/path": ""}},
+			{"tmpfs": {"/tmp": "size=lots"}},
+			{"tmpfs": ["/run", {"/tmp": "size=64m"}]},
+			{"ulimits": {"nofiles": 1024}},
+			{"ulimits": {"nofile": {"soft": 4096, "hard": 1024}}},
+			{"ulimits": {"nofile": {"soft": 1024}}}
+		]
+
+		for cfg in invalid:
+			cfg['image'] = 'fooImg'
+			with self.assertRaises(ValueError, msg=str(cfg)):
+				Container.fromRockerConfig("foo", cfg)
+
+	def testConfigLoader(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			name = os.path.join(tmpDir, 'foo')
+			with open(name+'.rocker', 'w') as f:
+				json.dump({"image": "fooImg", "env": {"A": "1"}, "raw": {"Foo": 1}}, f)
+
+			r = OfflineRocker()
+			loader = ConfigLoader()
+			c1 = loader.load(name, r)
+			self.assertEqual(c1.getEnvironment(), {"A": "1"})
+			self.assertTrue('zone.coding.rocker.fileHash' in c1.getLabels())
+
+			# we get copies of the cached template
+			c1.getEnvironment()['B'] = '2'
+			c1.toApiJson()['Bar'] = 1 # toApiJson() modifies the 'raw' data
+			c2 = loader.load(name, r)
+			self.assertIsNot(c1, c2)
+			self.assertEqual(c2.getEnvironment(), {"A": "1"})
+			self.assertEqual(c2.getRawData(), {"Foo": 1})
+			self.assertIs(c2._rocker, r)
+
+			# changes to the file will be picked up
+			with open(name+'.rocker', 'w') as f:
+				json.dump({"image": "fooImg", "env": {"A": "changed"}}, f)
+			os.utime(name+'.rocker', ns=(0, 0)) # make sure the mtime changes
+			self.assertEqual(loader.load(name, r).getEnvironment(), {"A": "changed"})
+
+	def testConfigIndex(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			name = os.path.join(tmpDir, 'foo')
+			indexPath = os.path.join(tmpDir, '.rockerIndex')
+			with open(name+'.rocker', 'w') as f:
+				json.dump({"image": "fooImg"}, f)
+
+			r = OfflineRocker()
+			loader = ConfigLoader()
+			loader.enableIndex(indexPath)
+			chksum = loader.load(name, r).getLabels()['zone.coding.rocker.fileHash']
+			loader.saveIndex()
+			self.assertTrue(os.path.exists(indexPath))
+
+			# a fresh loader will use the index (and won't parse the file again)
+			originalParse = Container._parseConfigFile
+			try:
+				Container._parseConfigFile = None
+				loader = ConfigLoader()
+				loader.enableIndex(indexPath)
+				c = loader.load(name, r)
+				self.assertEqual(c.getImage(), "fooImg")
+				self.assertEqual(c.getLabels()['zone.coding.rocker.fileHash'], chksum)
+			finally:
+				Container._parseConfigFile = originalParse
+
+	# Index entries used by one loader have to stay intact when another file makes the index dirty
+	def testConfigIndexReuse(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			indexPath = os.path.join(tmpDir, '.rockerIndex')
+			for name in ['a', 'b']:
+				with open(os.path.join(tmpDir, name+'.rocker'), 'w') as f:
+					json.dump({"image": name+"Img"}, f)
+
+			r = OfflineRocker()
+			for names in [['a'], ['a', 'b'], ['a']]:
+				loader = ConfigLoader()
+				loader.enableIndex(indexPath)
+				for name in names:
+					self.assertEqual(loader.load(os.path.join(tmpDir, name), r).getImage(), name+"Img")
+				loader.saveIndex()
+
+			with open(indexPath) as f:
+				files = json.load(f)['files']
+			self.assertEqual(files[os.path.join(tmpDir, 'a.rocker')]['config'], {"image": "aImg"})
+
 	# Calls all getters and compares their values with those in `expectedValues` (or None if not defined)
 	def _checkGetters(self, c: Container, expectedValues: dict):
 		for m in dir(c):
@@ -75,3 +326,36 @@ class ContainerTest(TestCase):
 					expected = expectedValues[m]
 
 				self.assertEqual(v, expected, "{0} was expected to return {1}, not {2}".format(m, expected, v))
+
+# container.run() against a fake docker daemon
+class RunTest(TestCase):
+	def testRun(self):
+		with tempfile.TemporaryDirectory() as tmpDir, patch.dict('os.environ', {'XDG_CACHE_HOME': tmpDir}), \
+				FakeDaemon(chunkSize=64) as daemon, patch('sys.stdout', new=StringIO()):
+			origCwd = os.getcwd()
+			os.chdir(tmpDir)
+			try:
+				os.makedirs('app')
+				with open('app/Dockerfile', 'w') as f:
+					f.write("FROM debian\n")
+				with open('web.rocker', 'w') as f:
+					json.dump({"image": "app", "links": ["db"], "env": {"DB_HOST": "db"}}, f)
+				with open('db.rocker', 'w') as f:
+					json.dump({"image": "mysql"}, f)
+
+				r = Rocker(daemon.getUrl())
+				self.assertTrue(container.run('web', r=r))
+
+				# the dependency's image was pulled, 'app' was built and both containers are running
+				self.assertNotEqual(daemon.getImage('mysql'), None)
+				web = container.inspect('web', r)
+				self.assertTrue(web.isRunning())
+				self.assertEqual(web.getImage(), daemon.getImage('app')['Id'])
+				self.assertEqual(web.getEnvironment(), {"DB_HOST": "db"})
+				self.assertEqual(web.getLinks(), {"db": "db"})
+				self.assertTrue(container.inspect('db', r).isRunning())
+
+				# nothing changed => nothing to do
+				self.assertFalse(container.run('web', r=r))
+			finally:
+				os.chdir(origCwd)
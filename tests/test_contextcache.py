@@ -0,0 +1,74 @@
+from rocker import contextcache, image
+from rocker.contextcache import ContextCache
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+import os
+
+class ContextCacheTest(ProjectTestCase):
+	def setUp(self):
+		super().setUp()
+		self.cacheDir = os.environ['ROCKER_CONTEXT_CACHE_DIR']
+
+	def getEnv(self):
+		return dict(super().getEnv(), ROCKER_CONTEXT_CACHE='1m', ROCKER_CONTEXT_CACHE_DIR=os.path.join(self.tmpDir.name, 'contexts'))
+
+	def testBuild(self):
+		self.writeFile('app/Dockerfile', "FROM debian\nADD src /src\n")
+		self.writeFile('app/src/main.py', "print('hello')\n")
+
+		with FakeDaemon(chunkSize=1000) as daemon, patch('sys.stdout', new=StringIO()):
+			daemon.addImage('debian')
+			r = Rocker(daemon.getUrl())
+
+			self.assertTrue(image.build('app', r))
+			size = daemon.getImage('app')['Size']
+			self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+
+			# docker lost the image, but the context hasn't changed => it's replayed from the cache
+			with r.createRequest() as req:
+				req.doDelete('/images/app').send().getObject()
+			r.invalidateCache()
+			with patch('rocker.image._fillTar', side_effect=AssertionError("context was regenerated")):
+				self.assertTrue(image.build('app', r))
+			self.assertEqual(daemon.getImage('app')['Size'], size)
+
+			# changed contexts get a new digest
+			digest = contextcache.getDigest('app')
+			self.writeFile('app/src/main.py', "print('hello world')\n")
+			self.assertNotEqual(contextcache.getDigest('app'), digest)
+			self.assertTrue(image.build('app', r))
+			self.assertEqual(len(os.listdir(self.cacheDir)), 2)
+
+	def testEviction(self):
+		cache = ContextCache(self.cacheDir, 2500)
+		for i, digest in enumerate(['a', 'b', 'c']):
+			target = BytesIO()
+			with cache.write(digest, target) as writer:
+				writer.write(b'x'*1000)
+				writer.commit()
+			self.assertEqual(target.getvalue(), b'x'*1000)
+			os.utime(os.path.join(self.cacheDir, digest+'.tar'), (i, i))
+
+		# uncommitted contexts are discarded
+		with cache.write('d', BytesIO()) as writer:
+			writer.write(b'y'*1000)
+
+		# 'a' is the least recently used one
+		self.assertEqual(sorted(os.listdir(self.cacheDir)), ['b.tar', 'c.tar'])
+
+		with cache.open('b') as f:
+			self.assertEqual(f.read(), b'x'*1000)
+		with cache.write('e', BytesIO()) as writer:
+			writer.write(b'z'*1000)
+			writer.commit()
+		self.assertEqual(sorted(os.listdir(self.cacheDir)), ['b.tar', 'e.tar'])
+		self.assertEqual(cache.open('c'), None)
+
+		self.assertEqual(contextcache.parseSize('64m'), 64*1024**2)
+		with self.assertRaises(ValueError):
+			contextcache.parseSize('lots')
@@ -0,0 +1,85 @@
+from rocker import container, fleet, image
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest.mock import patch
+
+import json
+import os
+import time
+
+class FleetTest(ProjectTestCase):
+	def testParseHosts(self):
+		self.assertEqual(fleet.parseHosts('unix:///run/a.sock, b=unix:///run/b.sock'), [('unix:///run/a.sock', 'unix:///run/a.sock'), ('b', 'unix:///run/b.sock')])
+		self.assertEqual(fleet.parseHosts('c=sockets/c.sock'), [('c', 'unix://'+os.path.abspath('sockets/c.sock'))])
+
+		with open('hosts', 'w') as f:
+			f.write("# staging\na=unix:///run/a.sock\n\n  b=unix:///run/b.sock  \n")
+		self.assertEqual(fleet.readHostsFile('hosts'), [('a', 'unix:///run/a.sock'), ('b', 'unix:///run/b.sock')])
+
+		for spec in ['a,,b', 'a=', 'x=unix:///a,x=unix:///b']:
+			with self.assertRaises(ValueError):
+				fleet.parseHosts(spec)
+
+	def testRun(self):
+		with open('web.rocker', 'w') as f:
+			json.dump({"image": "nginx", "links": ["db"]}, f)
+		with open('db.rocker', 'w') as f:
+			json.dump({"image": "mysql"}, f)
+
+		with FakeDaemon(latency=.01) as d1, FakeDaemon(latency=.01) as d2, FakeDaemon() as d3, \
+				patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()):
+			# d3 already is up to date
+			r = Rocker(d3.getUrl())
+			r.getDockerVersion()
+			container.run('web', r=r)
+			out.truncate(0)
+
+			hosts = [('n1', d1.getUrl()), ('n2', d2.getUrl()), ('n3', d3.getUrl()), ('down', 'unix://'+os.path.abspath('missing.sock'))]
+			results = fleet.run(hosts, lambda hr: container.run('web', r=hr), parallel=3, r=Rocker(d1.getUrl()))
+
+			self.assertEqual([(res.name, res.status) for res in results], [('n1', 'changed'), ('n2', 'changed'), ('n3', 'unchanged'), ('down', 'failed')])
+			self.assertIn("Couldn't find Docker socket", results[3].error)
+			for daemon in [d1, d2]:
+				self.assertTrue(daemon.getContainer('web')['State']['Running'])
+				self.assertTrue(daemon.getContainer('db')['State']['Running'])
+
+			# each host's output goes to its own lane (and is followed by the summary)
+			lines = out.getvalue().splitlines()
+			self.assertIn("[n1] Deploying container: web", lines)
+			self.assertIn("[n2] Deploying container: web", lines)
+			self.assertIn("[n3] Skipping container web - nothing changed", lines)
+			self.assertEqual([l.split()[:2] for l in lines if l.startswith(('n1 ', 'n3 ', 'down '))], [['n1', 'changed'], ['n3', 'unchanged'], ['down', 'failed']])
+			self.assertIn("4 hosts in ", lines[-1])
+			self.assertIn("(1 failed)", lines[-1])
+
+	# each daemon has its own build state (a rebuild for one of them doesn't make the others up to date)
+	def testRebuild(self):
+		os.makedirs('app')
+		with open('app/Dockerfile', 'w') as f:
+			f.write("FROM debian\n")
+
+		with FakeDaemon() as d1, FakeDaemon() as d2, patch('sys.stdout', new=StringIO()), patch('sys.stderr', new=StringIO()):
+			daemons = [d1, d2]
+			hosts = [('n1', d1.getUrl()), ('n2', d2.getUrl())]
+			for daemon in daemons:
+				daemon.addImage('debian')
+
+			results = fleet.run(hosts, lambda hr: image.build('app', hr), parallel=1, r=Rocker(d1.getUrl()))
+			self.assertEqual([res.status for res in results], ['changed', 'changed'])
+			oldImages = [daemon.getImage('app')['Id'] for daemon in daemons]
+
+			with open('app/Dockerfile', 'w') as f:
+				f.write("FROM debian\nRUN true\n")
+			os.utime('app/Dockerfile', (time.time()+10, time.time()+10)) # make sure the mtime changes
+
+			results = fleet.run(hosts, lambda hr: image.build('app', hr), parallel=1, r=Rocker(d1.getUrl()))
+			self.assertEqual([res.status for res in results], ['changed', 'changed'])
+			for daemon, oldImage in zip(daemons, oldImages):
+				self.assertNotEqual(daemon.getImage('app')['Id'], oldImage)
+
+			# nothing changed since
+			results = fleet.run(hosts, lambda hr: image.build('app', hr), parallel=1, r=Rocker(d1.getUrl()))
+			self.assertEqual([res.status for res in results], ['unchanged', 'unchanged'])
@@ -0,0 +1,121 @@
+from rocker import container, gc, image
+from rocker.restclient import Request
+from rocker.rocker import PROJECT_LABEL, Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest.mock import patch
+
+import json
+import os
+import time
+
+class GcTest(ProjectTestCase):
+	# (re)writes a Dockerfile (making sure image.build() notices the change)
+	def _writeDockerfile(self, name, data):
+		os.makedirs(name, exist_ok=True)
+		path = os.path.join(name, 'Dockerfile')
+		with open(path, 'w') as f:
+			f.write(data)
+		mtime = time.time()+10*len(os.listdir('.'))
+		os.utime(path, (mtime, mtime))
+
+	def _writeRockerFile(self, name, config):
+		with open('{0}.rocker'.format(name), 'w') as f:
+			json.dump(config, f)
+
+	def _request(self, daemon, method, url, data=None):
+		with Request(daemon.getUrl()) as req:
+			if method == 'POST':
+				req.doPost(url)
+			else:
+				req.doDelete(url)
+			resp = req.send(data)
+			if data != None:
+				resp.getObject()
+
+	def testGc(self):
+		self._writeDockerfile('app', "FROM debian\n")
+		self._writeRockerFile('web', {'image': 'app', 'volumes': [{'tgt': '/data'}]})
+		self._writeRockerFile('old', {'image': 'app', 'volumes': [{'tgt': '/cache'}]})
+
+		with FakeDaemon() as daemon, patch('sys.stdout', new=StringIO()) as out:
+			daemon.addImage('debian')
+			r = Rocker(daemon.getUrl())
+			self.assertTrue(container.run('web', r=r))
+			self.assertTrue(container.run('old', r=r))
+			oldImage = daemon.getImage('app')['Id']
+			self.assertEqual(daemon.getContainer('web')['Config']['Labels'][PROJECT_LABEL], os.getcwd())
+			self.assertEqual(daemon.getImage('app')['Config']['Labels'][PROJECT_LABEL], os.getcwd())
+
+			# 'old' was removed from the project
+			daemon.addFile('old', '/cache/data', 'x'*3000)
+			oldVolume = daemon.getContainer('old')['Mounts'][0]['Name']
+			self._request(daemon, 'POST', '/containers/old/stop')
+			os.remove('old.rocker')
+
+			# rebuild 'app' and replace 'web' (the way `rocker rerun` does, which orphans its volume)
+			webVolume = daemon.getContainer('web')['Mounts'][0]['Name']
+			self._writeDockerfile('app', "FROM debian\nRUN true\n")
+			self._request(daemon, 'DELETE', '/containers/web?force=1')
+			self.assertTrue(container.run('web', r=r))
+
+			# objects rocker doesn't own
+			daemon.addImage('other', labels={PROJECT_LABEL: '/some/other/project'})
+			daemon.addImage('mine:v1', labels={PROJECT_LABEL: os.getcwd()}) # tagged by someone else
+			self._request(daemon, 'POST', '/containers/create?name=foreign', {'Image': 'other', 'Labels': {'zone.coding.rocker.fileHash': 'abc', PROJECT_LABEL: '/some/other/project'}})
+			danglingVolume = daemon.addVolume(size=500)
+			daemon.addVolume('named')
+
+			garbage = gc.find(r=r)
+			self.assertEqual(sorted((g.kind, g.id) for g in garbage), [('container', daemon.getContainer('old')['Id']), ('image', oldImage), ('volume', oldVolume)])
+			self.assertEqual([g.size for g in garbage if g.kind == 'volume'], [3000])
+
+			# dry run
+			gc.report(garbage, r)
+			self.assertIn("volume     {0}  2.9KiB".format(oldVolume[:12]), out.getvalue())
+			self.assertIn("Total: ", out.getvalue())
+			self.assertNotEqual(daemon.getContainer('old'), None)
+
+			self.assertEqual(gc.remove(garbage, parallel=3, r=r), [])
+			self.assertEqual(daemon.getContainer('old'), None)
+			self.assertEqual(daemon.getImage(oldImage), None)
+			self.assertNotIn(oldVolume, daemon.getVolumes())
+			self.assertTrue(container.inspect('web', r).isRunning())
+			self.assertNotEqual(daemon.getContainer('foreign'), None)
+
+			# nothing left (unless unused anonymous volumes are included)
+			self.assertEqual(gc.find(r=r), [])
+			self.assertEqual(sorted((g.kind, g.id) for g in gc.find(includeVolumes=True, r=r)), sorted([('volume', webVolume), ('volume', danglingVolume)]))
+
+	def testImageChain(self):
+		self._writeDockerfile('base', "FROM debian\n")
+		self._writeDockerfile('app', "FROM base\n")
+		self._writeDockerfile('tool', "FROM base\n")
+
+		with FakeDaemon() as daemon, patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()):
+			daemon.addImage('debian')
+			r = Rocker(daemon.getUrl())
+			self.assertTrue(image.build('app', r))
+			self.assertTrue(image.build('tool', r))
+			oldIds = [daemon.getImage(name)['Id'] for name in ['base', 'app', 'tool']]
+
+			# rebuilding 'base' rebuilds 'app' as well, the old 'app' and 'base' images are superseded
+			self._writeDockerfile('base', "FROM debian\nRUN true\n")
+			self.assertTrue(image.build('app', r))
+
+			# ... but the old 'base' image is still the parent of 'tool'
+			self.assertEqual([g.id for g in gc.find(r=r)], [oldIds[1]])
+
+			# once 'tool' is removed from the project, its image and the old 'base' can go
+			os.remove(os.path.join('tool', 'Dockerfile'))
+			garbage = gc.find(r=r)
+			self.assertEqual(sorted((g.id, g.level) for g in garbage), sorted([(oldIds[0], 1), (oldIds[1], 0), (oldIds[2], 0)]))
+
+			# children are removed before their parents (the fake daemon refuses to remove images with children)
+			self.assertEqual(gc.remove(garbage, r=r), [])
+			for imgId in oldIds:
+				self.assertEqual(daemon.getImage(imgId), None)
+			self.assertIn("Removed image: ", out.getvalue())
+			self.assertNotEqual(daemon.getImage('base'), None)
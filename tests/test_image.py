@@ -0,0 +1,93 @@
+from rocker import image
+from rocker.image import BuildOptions
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest.mock import patch
+
+import json
+import os
+import urllib.parse
+
+class ImageTest(ProjectTestCase):
+	def testBuild(self):
+		os.makedirs('base')
+		with open('base/Dockerfile', 'w') as f:
+			f.write("FROM debian:latest\nRUN apt-get update\n")
+		os.makedirs('app/src')
+		with open('app/Dockerfile', 'w') as f:
+			f.write("FROM base\nADD src /src\n")
+		with open('app/src/main.py', 'w') as f:
+			f.write("print('hello')\n")
+
+		with FakeDaemon(chunkSize=16) as daemon, patch('sys.stdout', new=StringIO()) as out:
+			daemon.addImage('debian')
+			r = Rocker(daemon.getUrl())
+
+			# builds the parent image (which is part of the project) first
+			self.assertTrue(image.build('app', r))
+			self.assertIn("Successfully tagged app:latest", out.getvalue())
+			base = daemon.getImage('base')
+			self.assertEqual(daemon.getImage('app')['Parent'], base['Id'])
+			self.assertEqual(image.inspect('app', r).parent, base['Id'])
+
+			# nothing changed => skip the build
+			count = len(daemon.requests)
+			self.assertFalse(image.build('app', r))
+			self.assertEqual([req for req in daemon.requests[count:] if req[0] == 'POST'], [])
+
+	def testBuildOptions(self):
+		os.makedirs('app')
+		with open('app/Dockerfile', 'w') as f:
+			f.write("FROM debian\nARG VERSION\n")
+		with open('app/rocker-build.json', 'w') as f:
+			json.dump({"args": {"VERSION": 1.2}, "cacheFrom": ["registry:5000/acme/app:cache", "acme/unpushed"], "labels": {"team": "backend"}, "target": "prod"}, f)
+
+		with FakeDaemon() as daemon, patch('sys.stdout', new=StringIO()), patch('sys.stderr', new=StringIO()) as err:
+			daemon.addImage('debian')
+			daemon.unknownImages.add('acme/unpushed')
+			r = Rocker(daemon.getUrl())
+
+			# command line options are applied on top of rocker-build.json
+			self.assertTrue(image.build('app', r, BuildOptions(args={'EXTRA': 'x'}, cacheFrom=['acme/app:v1'], pull=True)))
+			builds = [req[1] for req in daemon.requests if req[1].split('?')[0].endswith('/build')]
+			query = dict(urllib.parse.parse_qsl(builds[0].split('?', 1)[1]))
+			self.assertEqual(json.loads(query['buildargs']), {'VERSION': '1.2', 'EXTRA': 'x'})
+			self.assertEqual(json.loads(query['cachefrom']), ['registry:5000/acme/app:cache', 'acme/unpushed', 'acme/app:v1'])
+			self.assertEqual(json.loads(query['labels'])['team'], 'backend')
+			self.assertEqual((query['target'], query['pull'], query.get('nocache')), ('prod', '1', None))
+
+			# missing cacheFrom images are pulled first (the ones that can't be pulled are skipped)
+			self.assertNotEqual(daemon.getImage('registry:5000/acme/app:cache'), None)
+			self.assertNotEqual(daemon.getImage('acme/app:v1'), None)
+			self.assertIn("Couldn't pull cache image acme/unpushed (code: 404)", err.getvalue())
+
+			# noCache => always rebuild
+			self.assertFalse(image.build('app', r))
+			self.assertTrue(image.build('app', r, BuildOptions(noCache=True)))
+
+		with open('app/rocker-build.json', 'w') as f:
+			json.dump({"cacheFrom": [{"image": "acme/app"}]}, f)
+		with self.assertRaises(ValueError):
+			BuildOptions.fromFile('app')
+
+		# unsupported keys are reported using the Rocker instance
+		with open('app/rocker-build.json', 'w') as f:
+			json.dump({"target": "prod", "squash": True}, f)
+		r = Rocker()
+		r.setOutputMode('jsonl')
+		with patch('sys.stdout', new=StringIO()) as out:
+			self.assertEqual(BuildOptions.fromFile('app', r).target, 'prod')
+		event = json.loads(out.getvalue())
+		self.assertEqual(event['level'], 'warning')
+		self.assertIn("unsupported rocker-build.json key: 'squash'", event['msg'])
+
+	def testPull(self):
+		with FakeDaemon(progressSteps=10) as daemon, patch('sys.stdout', new=StringIO()):
+			r = Rocker(daemon.getUrl())
+			self.assertFalse(image.exists('debian', r))
+			image.pull('debian', r)
+			self.assertTrue(image.exists('debian', r))
+			self.assertEqual([img.repoTags for img in image.list(r)], [['debian:latest']])
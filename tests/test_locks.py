@@ -0,0 +1,111 @@
+from rocker import container, image, locks
+from rocker.locks import Lock
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+class LockTest(TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.TemporaryDirectory()
+		self.env = patch.dict('os.environ', {'ROCKER_LOCK_DIR': os.path.join(self.tmpDir.name, 'locks')})
+		self.env.start()
+
+	def tearDown(self):
+		self.env.stop()
+		self.tmpDir.cleanup()
+
+	def testLock(self):
+		a = Lock('image unix:///docker.sock /project/app')
+		b = Lock('image unix:///docker.sock /project/app')
+		other = Lock('image unix:///docker.sock /project/db')
+		self.assertEqual(os.path.dirname(a.getPath()), locks.getLockDir())
+
+		try:
+			self.assertTrue(a.acquire(blocking=False))
+			self.assertFalse(b.acquire(blocking=False))
+			self.assertTrue(other.acquire(blocking=False))
+
+			# blocks until the lock is released
+			acquired = threading.Event()
+			def wait():
+				b.acquire()
+				acquired.set()
+			thread = threading.Thread(target=wait)
+			thread.start()
+			self.assertFalse(acquired.wait(.1))
+
+			a.release()
+			thread.join()
+			self.assertTrue(b.isLocked())
+			self.assertFalse(a.isLocked())
+		finally:
+			for l in [a, b, other]:
+				l.release()
+
+# Two rocker "processes" (threads with their own Rocker instance) doing the same thing at the same time
+class SingleFlightTest(ProjectTestCase):
+	# runs first() and (once the daemon got the given request) second() concurrently
+	def _race(self, daemon, request, first, second):
+		results = {}
+		threads = [threading.Thread(target=lambda: results.__setitem__('first', first()))]
+		threads[0].start()
+
+		deadline = time.monotonic()+5
+		while not any(req == request for req in [(m, p.split('?')[0]) for m, p in list(daemon.requests)]):
+			self.assertLess(time.monotonic(), deadline, "{0} wasn't sent".format(request))
+			time.sleep(.005)
+
+		threads.append(threading.Thread(target=lambda: results.__setitem__('second', second())))
+		threads[1].start()
+		for thread in threads:
+			thread.join()
+		return results
+
+	def _count(self, daemon, method, path):
+		return len([req for req in daemon.requests if req[0] == method and req[1].split('?')[0].endswith(path)])
+
+	def testBuild(self):
+		os.makedirs('app')
+		with open('app/Dockerfile', 'w') as f:
+			f.write("FROM debian\n")
+
+		with FakeDaemon(latency=.1) as daemon, patch('sys.stdout', new=StringIO()) as out:
+			daemon.addImage('debian')
+			Rocker(daemon.getUrl()).getDockerVersion() # fill the version cache
+
+			results = self._race(daemon, ('POST', '/v1.41/build'),
+				lambda: image.build('app', Rocker(daemon.getUrl())),
+				lambda: image.build('app', Rocker(daemon.getUrl())))
+
+			self.assertEqual(results, {'first': True, 'second': True})
+			self.assertEqual(self._count(daemon, 'POST', '/build'), 1)
+			self.assertIn("Image app was built by another rocker process", out.getvalue())
+
+	def testRun(self):
+		with open('web.rocker', 'w') as f:
+			json.dump({"image": "nginx"}, f)
+
+		with FakeDaemon(latency=.1) as daemon, patch('sys.stdout', new=StringIO()) as out:
+			daemon.addImage('nginx')
+			Rocker(daemon.getUrl()).getDockerVersion()
+
+			# both of them find out that the container doesn't exist yet
+			results = self._race(daemon, ('GET', '/v1.41/images/nginx/json'),
+				lambda: container.run('web', r=Rocker(daemon.getUrl())),
+				lambda: container.run('web', r=Rocker(daemon.getUrl())))
+
+			# no 409 conflict, the second run reuses the container the first one created
+			self.assertEqual(results, {'first': True, 'second': True})
+			self.assertEqual(self._count(daemon, 'POST', '/containers/create'), 1)
+			self.assertTrue(daemon.getContainer('web')['State']['Running'])
+			self.assertIn("Container web was deployed by another rocker process", out.getvalue())
@@ -0,0 +1,126 @@
+from rocker import logs
+from rocker.logs import FrameDecoder
+from rocker.restclient import Request
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import struct
+import tempfile
+import threading
+import time
+
+def frame(stream, data):
+	return struct.pack('>BxxxL', stream, len(data))+data
+
+class FrameDecoderTest(TestCase):
+	# feeds data to the decoder in pieces of the given size and returns the decoded frames
+	def _decode(self, decoder, data, pieceSize):
+		rc = []
+		pos = 0
+		while pos < len(data):
+			buff = decoder.getWritable()
+			count = min(pieceSize, len(buff), len(data)-pos)
+			buff[:count] = data[pos:pos+count]
+			pos += count
+			decoder.commit(count)
+
+			for streamType, payload in decoder.frames():
+				rc.append((streamType, bytes(payload)))
+		return rc
+
+	def testFrames(self):
+		frames = [(1, b'hello\n'), (2, b'oops\n'), (1, b''), (1, b'x'*100)]
+		data = b''.join(frame(s, d) for s, d in frames)
+
+		# frames (and their headers) straddling reads
+		for pieceSize in [1, 3, 8, 13, len(data)]:
+			self.assertEqual(self._decode(FrameDecoder(bufferSize=32), data, pieceSize), frames, "pieceSize={0}".format(pieceSize))
+
+	def testLargeFrame(self):
+		# frames larger than the buffer make it grow
+		frames = [(1, b'a'*10), (2, b'b'*1000), (1, b'c'*10)]
+		data = b''.join(frame(s, d) for s, d in frames)
+		self.assertEqual(self._decode(FrameDecoder(bufferSize=16), data, 100), frames)
+
+	def testTty(self):
+		decoder = FrameDecoder(multiplexed=False, bufferSize=16)
+		frames = self._decode(decoder, b'raw output, no headers', 5)
+		self.assertEqual(b''.join(d for _, d in frames), b'raw output, no headers')
+		self.assertTrue(all(s == logs.STDOUT for s, _ in frames))
+
+class LogsTest(TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.TemporaryDirectory()
+		self.env = patch.dict('os.environ', {'XDG_CACHE_HOME': self.tmpDir.name})
+		self.env.start()
+
+	def tearDown(self):
+		self.env.stop()
+		self.tmpDir.cleanup()
+
+	def _createContainer(self, daemon, name, tty=False):
+		daemon.addImage('debian')
+		with Request(daemon.getUrl()) as req:
+			req.doPost('/containers/create?name={0}'.format(name)).send({'Image': 'debian', 'Tty': tty}).getObject()
+		with Request(daemon.getUrl()) as req:
+			req.doPost('/containers/{0}/start'.format(name)).send()
+
+	def testStreamLogs(self):
+		with FakeDaemon(chunkSize=5) as daemon:
+			self._createContainer(daemon, 'web')
+			daemon.addLogs('web', "starting\n")
+			daemon.addLogs('web', "warning: häh\n", stream=2) # multibyte character split across chunks
+			daemon.addLogs('web', "ready\n")
+
+			out = StringIO()
+			err = StringIO()
+			r = Rocker(daemon.getUrl())
+			self.assertTrue(logs.streamLogs('web', out, err, r=r))
+			self.assertEqual(out.getvalue(), "starting\nready\n")
+			self.assertEqual(err.getvalue(), "warning: häh\n")
+
+			out = StringIO()
+			self.assertTrue(logs.streamLogs('web', out, StringIO(), tail='1', r=r))
+			self.assertEqual(out.getvalue(), "ready\n")
+
+			with patch('sys.stderr', new=StringIO()):
+				self.assertFalse(logs.streamLogs('nonexistent', StringIO(), StringIO(), r=r))
+
+	def testTty(self):
+		with FakeDaemon(chunkSize=3) as daemon:
+			self._createContainer(daemon, 'shell', tty=True)
+			daemon.addLogs('shell', "$ ls\r\nfoo\r\n")
+
+			out = StringIO()
+			self.assertTrue(logs.streamLogs('shell', out, StringIO(), r=Rocker(daemon.getUrl())))
+			self.assertEqual(out.getvalue(), "$ ls\r\nfoo\r\n")
+
+	# following several containers until they stop
+	def testFollow(self):
+		with FakeDaemon(chunkSize=16) as daemon, patch('sys.stdout', new=StringIO()) as out:
+			for name in ['db', 'web']:
+				self._createContainer(daemon, name)
+				daemon.addLogs(name, "{0} started\n".format(name))
+
+			def produce():
+				time.sleep(.1)
+				for i in range(3):
+					daemon.addLogs('web', "request {0}\n".format(i))
+					daemon.addLogs('db', "query {0}\n".format(i), stream=2)
+				for name in ['db', 'web']:
+					with Request(daemon.getUrl()) as req:
+						req.doPost('/containers/{0}/stop'.format(name)).send()
+
+			producer = threading.Thread(target=produce)
+			producer.start()
+			self.assertTrue(logs.show(['db', 'web'], follow=True, r=Rocker(daemon.getUrl())))
+			producer.join()
+
+		lines = out.getvalue().splitlines()
+		self.assertEqual([l for l in lines if l.startswith('[db] ')], ["[db] db started", "[db] query 0", "[db] query 1", "[db] query 2"])
+		self.assertEqual([l for l in lines if l.startswith('[web] ')], ["[web] web started", "[web] request 0", "[web] request 1", "[web] request 2"])
+		self.assertEqual(len(lines), 8)
@@ -0,0 +1,103 @@
+from rocker import metrics
+from rocker.metrics import Histogram
+from rocker.restclient import Request
+
+from io import StringIO
+from unittest import TestCase
+
+import os
+import socket
+import tempfile
+import threading
+
+class HistogramTest(TestCase):
+	def testPrecision(self):
+		for value in [.0000005, .0002, .0013, .05, 1, 2.5, 20]:
+			hist = Histogram()
+			hist.add(value)
+			bound = hist.getQuantile(.5)
+			self.assertGreaterEqual(bound, value)
+			self.assertLessEqual(bound, max(value*(1+1/Histogram.SUB_BUCKETS), 1e-6))
+
+	def testQuantiles(self):
+		hist = Histogram()
+		self.assertEqual(hist.getQuantile(.5), None)
+
+		for i in range(99):
+			hist.add(.001)
+		hist.add(1)
+
+		self.assertEqual(hist.getCount(), 100)
+		self.assertEqual(hist.getMax(), 1)
+		self.assertAlmostEqual(hist.getSum(), 1.099)
+		self.assertLess(hist.getQuantile(.5), .0012)
+		self.assertLess(hist.getQuantile(.99), .0012)
+		self.assertGreaterEqual(hist.getQuantile(1), 1)
+
+class MetricsTest(TestCase):
+	def tearDown(self):
+		metrics._registry = None
+
+	def testEndpoint(self):
+		self.assertEqual(metrics.getEndpoint('/containers/myApp/json?size=1'), '/containers/{}/json')
+		self.assertEqual(metrics.getEndpoint('/containers/json?all=1'), '/containers/json')
+		self.assertEqual(metrics.getEndpoint('/containers/myApp'), '/containers/{}')
+		self.assertEqual(metrics.getEndpoint('/images/library/debian/json'), '/images/{}/json')
+		self.assertEqual(metrics.getEndpoint('/images/create?fromImage=debian'), '/images/create')
+		self.assertEqual(metrics.getEndpoint('/version'), '/version')
+		self.assertEqual(metrics.getEndpoint('/system/df'), '/system/df')
+
+	def testDisabled(self):
+		self.assertEqual(metrics.newRequestStats(), None)
+		metrics.finish() # no-op
+
+	def testRequests(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			sockPath = os.path.join(tmpDir, 'docker.sock')
+			server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			server.bind(sockPath)
+			server.listen(5)
+
+			def respond():
+				for i in range(2):
+					conn, _ = server.accept()
+					with conn, conn.makefile('rb') as f:
+						while f.readline() not in (b'\r\n', b''):
+							pass # skip the request headers
+						conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}')
+			thread = threading.Thread(target=respond)
+			thread.start()
+
+			textfile = os.path.join(tmpDir, 'rocker.prom')
+			metrics.enable(printTable=True)
+			metrics.enable(textfilePath=textfile)
+
+			for name in ['foo', 'bar']:
+				with Request('unix://'+sockPath, '/v1.24') as req:
+					self.assertEqual(req.doGet('/containers/{0}/json'.format(name)).send().getObject(), {})
+			thread.join()
+			server.close()
+
+			stats = metrics.getRegistry().getEndpoints()[('GET', '/containers/{}/json')]
+			self.assertEqual(stats.count, 2)
+			self.assertGreater(stats.bytesSent, 0)
+			self.assertGreater(stats.bytesReceived, 0)
+			self.assertGreater(stats.sendCalls, 0)
+			self.assertGreater(stats.selectWaits, 0)
+			self.assertEqual(stats.ttfb.getCount(), 2)
+			self.assertEqual(stats.latency.getCount(), 2)
+
+			out = StringIO()
+			metrics.finish(out)
+			self.assertEqual(metrics.getRegistry(), None)
+
+			lines = out.getvalue().splitlines()
+			self.assertEqual(len(lines), 2)
+			self.assertTrue(lines[0].startswith('METHOD'))
+			self.assertTrue(lines[1].startswith('GET     /containers/{}/json'))
+
+			with open(textfile) as f:
+				prom = f.read()
+			self.assertIn('rocker_http_requests_total{method="GET",endpoint="/containers/{}/json"} 2\n', prom)
+			self.assertIn('rocker_http_duration_seconds_bucket{method="GET",endpoint="/containers/{}/json",le="+Inf"} 2\n', prom)
+			self.assertIn('# TYPE rocker_http_ttfb_seconds histogram\n', prom)
@@ -0,0 +1,50 @@
+from rocker import prefetch
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+from tests.projectdir import ProjectTestCase
+
+from io import StringIO
+from unittest.mock import patch
+
+import json
+
+class PrefetchTest(ProjectTestCase):
+	def setUp(self):
+		super().setUp()
+
+		# web (built by the project, based on another project image) links to db and cache
+		self.writeFile('web.rocker', json.dumps({"image": "app", "links": ["db", "cache"]}))
+		self.writeFile('db.rocker', json.dumps({"image": "mysql:8"}))
+		self.writeFile('cache.rocker', json.dumps({"image": "redis", "links": ["db"]}))
+		self.writeFile('app/Dockerfile', "FROM --platform=linux/amd64 golang:1.21 AS build\nFROM base\nCOPY --from=build /app /app\n")
+		self.writeFile('base/Dockerfile', "FROM debian\n")
+
+	def testFindImages(self):
+		with FakeDaemon() as daemon:
+			r = Rocker(daemon.getUrl())
+			self.assertEqual(prefetch.findImages(['web'], r), ['golang:1.21', 'debian', 'redis', 'mysql:8'])
+
+			daemon.addImage('debian')
+			daemon.addImage('redis:latest')
+			self.assertEqual(prefetch.findMissing(['golang:1.21', 'debian', 'mysql:8', 'redis'], r), ['golang:1.21', 'mysql:8'])
+
+	def testRun(self):
+		with FakeDaemon(chunkSize=64, chunkDelay=.002) as daemon, patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()) as err:
+			daemon.addImage('debian')
+			daemon.unknownImages.add('redis')
+			r = Rocker(daemon.getUrl())
+
+			self.assertEqual(prefetch.run(['web'], parallel=4, r=r), ['golang:1.21', 'mysql:8'])
+			self.assertEqual(daemon.maxConcurrentPulls, 2)
+			self.assertNotEqual(daemon.getImage('golang:1.21'), None)
+			self.assertNotEqual(daemon.getImage('mysql:8'), None)
+
+			self.assertIn("Pulling 3 missing images: golang:1.21, redis, mysql:8", out.getvalue())
+			self.assertIn("Pulled image: mysql:8", out.getvalue())
+			self.assertNotIn("Pulled image: redis", out.getvalue())
+			self.assertIn("Couldn't pull image redis: pull access denied for redis", err.getvalue())
+
+			# nothing left to do (except for redis)
+			daemon.unknownImages.clear()
+			self.assertEqual(prefetch.run(['web'], r=r), ['redis'])
+			self.assertEqual(len([req for req in daemon.requests if req[1].split('?')[0].endswith('/images/create')]), 4)
@@ -0,0 +1,64 @@
+from rocker import profiler
+from rocker.profiler import Sampler
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import os
+import pstats
+import tempfile
+import time
+
+def _busyLoop(seconds):
+	end = time.monotonic()+seconds
+	while time.monotonic() < end:
+		pass
+
+class ProfilerTest(TestCase):
+	def tearDown(self):
+		profiler._mode = profiler._outPath = None
+
+	def testSampler(self):
+		sampler = Sampler(interval=.001)
+		sampler.start()
+		_busyLoop(.1)
+		sampler.stop()
+
+		self.assertGreater(sampler.getSampleCount(), 0)
+		stacks = sampler.getStacks()
+		for stack in stacks.keys():
+			self.assertFalse(stack.startswith('sampler;')) # the sampler doesn't sample itself
+			self.assertNotIn(' ', stack)
+
+		busy = [s for s in stacks.keys() if s.startswith('MainThread;') and s.endswith('.{0}'.format(_busyLoop.__name__))]
+		self.assertGreater(len(busy), 0)
+
+	def testSessions(self):
+		with tempfile.TemporaryDirectory() as tmpDir, patch('sys.stderr', new=StringIO()):
+			# profiling is disabled by default
+			with profiler.session('run'):
+				pass
+			self.assertEqual(os.listdir(tmpDir), [])
+
+			path = os.path.join(tmpDir, 'run.pstats')
+			profiler.enable('cprofile')
+			profiler.setOutputPath(path)
+			with profiler.session('run'):
+				_busyLoop(.01)
+			self.assertEqual(profiler.getMode(), None) # only one command is profiled
+			stats = pstats.Stats(path)
+			self.assertIn(_busyLoop.__name__, [key[2] for key in stats.stats.keys()])
+
+			path = os.path.join(tmpDir, 'run.folded')
+			profiler.enable('sample')
+			profiler.setOutputPath(path)
+			with profiler.session('run'):
+				_busyLoop(.05)
+			with open(path) as f:
+				for line in f:
+					stack, count = line.rsplit(' ', 1)
+					self.assertGreater(int(count), 0)
+
+		with self.assertRaises(ValueError):
+			profiler.enable('perf')
@@ -0,0 +1,152 @@
+from rocker.restclient import ConnectionPool, HttpResponseError, Request, ResponseParser
+from tests.fakedaemon import FakeDaemon
+
+from unittest import TestCase
+
+import json
+import select
+
+class RequestTest(TestCase):
+	def testGet(self):
+		with FakeDaemon(apiVersion='1.24') as daemon:
+			with Request(daemon.getUrl(), '/v1.24') as req:
+				resp = req.doGet('/version').send()
+				self.assertFalse(resp.isChunked())
+				self.assertEqual(resp.getObject()['ApiVersion'], '1.24')
+
+			self.assertEqual(daemon.requests, [('GET', '/v1.24/version')])
+
+	def testErrors(self):
+		with FakeDaemon() as daemon:
+			with Request(daemon.getUrl()) as req:
+				with self.assertRaises(HttpResponseError) as ctx:
+					req.doGet('/containers/nonexistent/json').send()
+			self.assertEqual(ctx.exception.getCode(), 404)
+			self.assertIn(b'No such container', ctx.exception.getData())
+
+	# Large responses written in small pieces (with delays in between) have to be reassembled properly
+	def testSlowLargeResponse(self):
+		with FakeDaemon(chunkSize=1000, chunkDelay=.001, payloadSize=64*1024) as daemon:
+			img = daemon.addImage('debian')
+			with Request(daemon.getUrl()) as req:
+				data = req.doGet('/images/debian/json').send().getObject()
+			self.assertEqual(data['Id'], img['Id'])
+			self.assertEqual(len(data['FakePadding']), 64*1024)
+
+	# Chunked request bodies (e.g. build contexts) and chunked responses split at arbitrary positions
+	def testChunked(self):
+		with FakeDaemon(chunkSize=7) as daemon:
+			with Request(daemon.getUrl()) as req:
+				req.enableChunkedMode()
+				req.doPost('/images/create?fromImage=debian')
+				resp = req.send()
+				self.assertTrue(resp.isChunked())
+
+				data = []
+				while True:
+					chunk = resp.readChunk()
+					if chunk == None:
+						break
+					self.assertLessEqual(len(chunk), 7)
+					data.append(chunk)
+
+			messages = [json.loads(l) for l in ''.join(data).splitlines()]
+			self.assertEqual(messages[-1]['status'], "Status: Downloaded newer image for debian:latest")
+			self.assertNotEqual(daemon.getImage('debian'), None)
+
+class ConnectionPoolTest(TestCase):
+	def testReuse(self):
+		with FakeDaemon(keepAlive=True) as daemon:
+			daemon.addImage('debian')
+			pool = ConnectionPool()
+
+			for i in range(3):
+				with Request(daemon.getUrl(), pool=pool) as req:
+					self.assertEqual(req.doGet('/version').send().getObject()['ApiVersion'], '1.41')
+
+			# chunked responses can be reused once they've been read completely
+			with Request(daemon.getUrl(), pool=pool) as req:
+				resp = req.doPost('/images/create?fromImage=debian').send()
+				while resp.readChunk() != None:
+					pass
+			self.assertEqual(daemon.connections, 1)
+
+			# ... but not if they haven't
+			with Request(daemon.getUrl(), pool=pool) as req:
+				req.doPost('/images/create?fromImage=debian').send().readChunk()
+			with Request(daemon.getUrl(), pool=pool) as req:
+				req.doGet('/version').send().getObject()
+			self.assertEqual(daemon.connections, 2)
+			pool.close()
+
+	# connections closed by the server in the meantime are replaced by new ones
+	def testClosedConnections(self):
+		with FakeDaemon() as daemon:
+			pool = ConnectionPool()
+			for i in range(3):
+				with Request(daemon.getUrl(), pool=pool) as req:
+					self.assertEqual(req.doGet('/version').send().getObject()['ApiVersion'], '1.41')
+			self.assertEqual(daemon.connections, 3)
+
+class ResponseParserTest(TestCase):
+	def _parse(self, data, pieceSize):
+		parser = ResponseParser()
+		body = []
+		for pos in range(0, len(data), pieceSize):
+			body += parser.feed(data[pos:pos+pieceSize])
+		return parser, b''.join(body)
+
+	def testChunked(self):
+		data = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n7\r\n world\n\r\n0\r\n\r\n'
+		for pieceSize in [1, 2, 5, len(data)]:
+			parser, body = self._parse(data, pieceSize)
+			self.assertEqual(parser.getStatus(), 200)
+			self.assertEqual(parser.getHeader('content-type'), 'application/json')
+			self.assertEqual(body, b'hello world\n')
+			self.assertTrue(parser.isDone())
+
+	def testContentLength(self):
+		parser, body = self._parse(b'HTTP/1.1 404 Not Found\r\nContent-Length: 12\r\n\r\n{"message":}', 4)
+		self.assertEqual(parser.getStatus(), 404)
+		self.assertEqual(body, b'{"message":}')
+		self.assertTrue(parser.isDone())
+
+		# incomplete response
+		parser, body = self._parse(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n12345', 3)
+		self.assertEqual(body, b'12345')
+		self.assertFalse(parser.isDone())
+		parser.feed(b'') # EOF
+		self.assertTrue(parser.isDone())
+
+	# sendAsync() + recvAvailable() (as used by rocker.stats)
+	def testAsync(self):
+		with FakeDaemon(chunkSize=3) as daemon:
+			with Request(daemon.getUrl()) as req:
+				req.doGet('/version').sendAsync()
+
+				parser = ResponseParser()
+				body = []
+				while not parser.isDone():
+					readable, _, _ = select.select([req], [], [], 2)
+					self.assertEqual(readable, [req])
+					body += parser.feed(req.recvAvailable())
+
+			self.assertEqual(parser.getStatus(), 200)
+			self.assertEqual(json.loads(b''.join(body))['ApiVersion'], '1.41')
+
+class ReadIntoTest(TestCase):
+	# large bodies (i.e. more than the response header parser reads ahead)
+	def testReadInto(self):
+		with FakeDaemon(chunkSize=1000, payloadSize=100*1024) as daemon:
+			img = daemon.addImage('debian')
+			with Request(daemon.getUrl()) as req:
+				resp = req.doGet('/images/debian/json').send()
+				buff = bytearray(4096)
+				data = []
+				while True:
+					count = resp.readInto(buff)
+					if count == 0:
+						break
+					data.append(bytes(buff[:count]))
+
+			self.assertEqual(json.loads(b''.join(data))['Id'], img['Id'])
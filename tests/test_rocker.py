@@ -0,0 +1,271 @@
+from rocker.restclient import HttpResponseError
+from rocker.rocker import Col, JsonProgressAggregator, OutputMux, ProgressRenderer, Rocker, formatBytes, getErrorMessage, runParallel
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+# StringIO pretending to be a terminal
+class TtyIO(StringIO):
+	def __init__(self):
+		super().__init__()
+		self.writes = 0
+
+	def isatty(self):
+		return True
+
+	def write(self, data):
+		self.writes += 1
+		return super().write(data)
+
+class ProgressRendererTest(TestCase):
+	def setUp(self):
+		self.now = 0
+
+	def clock(self):
+		return self.now
+
+	def testThrottling(self):
+		out = TtyIO()
+		renderer = ProgressRenderer(out, fps=10, clock=self.clock)
+
+		renderer.update({'id': 'layer1', 'status': 'Pulling fs layer'})
+		self.assertEqual(out.writes, 1) # the first frame is drawn right away
+
+		# updates within the same frame will only be drawn in the next one
+		for i in range(100):
+			renderer.update({'id': 'layer1', 'status': 'Downloading', 'progress': str(i)})
+			renderer.update({'id': 'layer2', 'status': 'Downloading', 'progress': str(i)})
+		self.assertEqual(out.writes, 1)
+
+		self.now = 0.1
+		renderer.update({'id': 'layer1', 'status': 'Download complete'})
+		self.assertEqual(out.writes, 2)
+
+		# the frame overwrites the previous one (which had one line)
+		frame = out.getvalue()[len(out.getvalue().split('\033[1A')[0]):]
+		self.assertTrue(frame.startswith('\033[1A'))
+		self.assertIn('layer1: Download complete', frame)
+		self.assertIn('layer2: Downloading 99', frame)
+
+		# regular messages will be printed right away
+		renderer.update({'stream': 'Step 2 : RUN true\n'})
+		self.assertEqual(out.writes, 3)
+		self.assertTrue(out.getvalue().endswith('Step 2 : RUN true\n'))
+
+		renderer.finish()
+		self.assertEqual(out.writes, 3) # nothing left to draw
+
+	def testNonTty(self):
+		out = StringIO()
+		renderer = ProgressRenderer(out, clock=self.clock)
+
+		renderer.update({'id': 'layer1', 'status': 'Pulling fs layer'})
+		for i in range(100):
+			renderer.update({'id': 'layer1', 'status': 'Downloading', 'progress': str(i), 'progressDetail': {'current': i}})
+		renderer.update({'id': 'layer1', 'status': 'Pull complete', 'progressDetail': {}})
+		renderer.update({'status': 'Digest: sha256:123'})
+		renderer.finish()
+
+		lines = out.getvalue().splitlines()
+		self.assertEqual(len(lines), 3)
+		self.assertIn('layer1: ', lines[0])
+		self.assertIn('Pull complete', lines[1])
+		self.assertNotIn('\033[1A', out.getvalue())
+
+class OutputMuxTest(TestCase):
+	def testConcurrentLanes(self):
+		out = TtyIO()
+		mux = OutputMux(out, maxBuffer=1024*1024)
+
+		def worker(name):
+			lane = mux.lane(name)
+			for i in range(200):
+				# write lines in pieces (to make sure they're only passed on once complete)
+				lane.write("line ")
+				lane.write("{0}\nfoo".format(i))
+				lane.write("bar\n")
+			lane.write("unterminated")
+			lane.close()
+
+		threads = [threading.Thread(target=worker, args=("t{0}".format(i),)) for i in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		lines = out.getvalue().split('\n')
+		self.assertEqual(lines.pop(), '')
+		self.assertEqual(len(lines), 8*401)
+
+		for i in range(8):
+			prefix = "[t{0}] ".format(i)
+			laneLines = [l[len(prefix):] for l in lines if l.startswith(prefix)]
+			expected = []
+			for j in range(200):
+				expected += ["line {0}".format(j), "foobar"]
+			self.assertEqual(laneLines, expected+["unterminated"])
+
+		# output is written in batches
+		self.assertLess(out.writes, 100)
+
+	def testRockerLanes(self):
+		r = Rocker()
+		with patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()) as err:
+			with r.lane('host1') as r1, r.lane('host2') as r2:
+				r1.info("deploying", duplicateId='deploy')
+				r2.info("deploying", duplicateId='deploy') # shared duplicate detection
+				r2.info("done")
+				r1.warning("slow")
+				r1.error("failed", exitCode=None)
+			r.printQueuedMessages()
+
+		self.assertEqual(out.getvalue(), "[host1] deploying\n[host2] done\n")
+		# errors and warnings have their own (stderr) lanes
+		self.assertEqual(err.getvalue(), "[host1] {0}slow{1}\n[host1] {2}ERROR: failed{1}\n".format(Col.WARNING, Col.ENDC, Col.FAIL))
+
+class JsonOutputTest(TestCase):
+	def setUp(self):
+		self.rocker = Rocker()
+		self.rocker.setOutputMode('jsonl')
+
+	def _events(self, out):
+		return [json.loads(line) for line in out.getvalue().splitlines()]
+
+	def testMessages(self):
+		with patch('sys.stdout', new=StringIO()) as out:
+			self.rocker.info("hello")
+			self.rocker.info("hello", duplicateId='foo')
+			self.rocker.info("hello", duplicateId='foo')
+			self.rocker.warning("careful")
+			self.rocker.debug(1, "not shown")
+			with self.rocker.phase('build', 'img'):
+				pass
+
+		events = self._events(out)
+		self.assertEqual([e['level'] for e in events], ['info', 'info', 'warning', 'info', 'info'])
+		self.assertEqual(events[0]['msg'], 'hello')
+		self.assertNotIn('\033', out.getvalue())
+		self.assertEqual(events[3]['phase'], 'build')
+		self.assertEqual(events[3]['event'], 'start')
+		self.assertEqual(events[4]['event'], 'end')
+		self.assertTrue(events[4]['duration'] >= 0)
+		for e in events:
+			self.assertIn('ts', e)
+
+	# events emitted after the lanes are closed mustn't get stuck in the mux's buffer
+	def testEventsAfterLanes(self):
+		with patch('sys.stdout', new=StringIO()) as out:
+			with self.rocker.lane('host1') as lr:
+				lr.info("deploying")
+			self.rocker.event('host', 'host1', status='changed')
+			self.rocker.error("boom", exitCode=None)
+
+			events = self._events(out)
+			self.assertEqual([(e.get('lane'), e['level']) for e in events], [('host1', 'info'), (None, 'info'), (None, 'error')])
+			self.assertEqual(events[1]['status'], 'changed')
+			self.assertIn('boom', events[2]['msg'])
+
+	def testProgressAggregation(self):
+		with patch('sys.stdout', new=StringIO()) as out:
+			aggregator = JsonProgressAggregator(self.rocker, 'pull', 'postgres')
+			aggregator.update({'status': 'Pulling from library/postgres', 'id': 'latest'})
+			for layer, total in [('l1', 1000), ('l2', 500)]:
+				for i in range(10):
+					aggregator.update({'id': layer, 'status': 'Downloading', 'progressDetail': {'current': i, 'total': total}, 'progress': '[==>  ]'})
+				aggregator.update({'id': layer, 'status': 'Pull complete', 'progressDetail': {}})
+			aggregator.update({'stream': 'Step 1 : FROM '})
+			aggregator.update({'stream': 'foo\nStep 2 : RUN true\n'})
+			aggregator.update({'status': 'Status: Downloaded newer image for postgres:latest'})
+			aggregator.finish()
+
+		events = self._events(out)
+		self.assertEqual([e.get('daemon') for e in events[:3]], ['Step 1 : FROM foo', 'Step 2 : RUN true', 'Status: Downloaded newer image for postgres:latest'])
+		self.assertEqual(events[3]['event'], 'progress')
+		self.assertEqual(events[3]['layers'], 3)
+		self.assertEqual(events[3]['bytes'], 1500)
+		self.assertEqual(len(events), 4)
+		for e in events:
+			self.assertEqual(e['phase'], 'pull')
+			self.assertEqual(e['name'], 'postgres')
+
+class VersionCacheTest(TestCase):
+	def testVersionCache(self):
+		with tempfile.TemporaryDirectory() as tmpDir, patch.dict('os.environ', {'XDG_CACHE_HOME': tmpDir}):
+			sockPath = os.path.join(tmpDir, 'docker.sock')
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.bind(sockPath) # there's nobody listening, so actual requests would fail
+
+			try:
+				r = Rocker('unix://'+sockPath)
+				r._writeVersionCache(r._getVersionCacheKey(), {'ApiVersion': '1.24', 'Version': '1.12.0'})
+
+				r = Rocker('unix://'+sockPath)
+				self.assertEqual(r.getDockerVersion()['Version'], '1.12.0')
+				self.assertEqual(r.getApiPrefix(), '/v1.24')
+				self.assertTrue(r.checkApiVersion('1.17'))
+				self.assertFalse(r.checkApiVersion('1.25'))
+
+				# daemon restarts recreate the socket (and invalidate the cache)
+				sock.close()
+				os.unlink(sockPath)
+				sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				sock.bind(sockPath)
+				os.utime(sockPath, ns=(0, 0))
+				r = Rocker('unix://'+sockPath)
+				self.assertEqual(r._readVersionCache(r._getVersionCacheKey()), None)
+			finally:
+				sock.close()
+
+	def testApiVersion(self):
+		r = Rocker()
+		r._cachedDockerVersion = {'ApiVersion': '1.99'}
+		self.assertEqual(r.getApiVersion(), '1.41') # never use a version newer than MAX_API_VERSION
+		r._cachedDockerVersion = {'ApiVersion': '1.9'}
+		self.assertEqual(r.getApiPrefix(), '/v1.9')
+
+class GetoptTest(TestCase):
+	def testSplitArgs(self):
+		self.assertEqual(Rocker._splitArgs(['logs', '-f', '--stats', 'web']), (['--stats'], ['logs', '-f', 'web']))
+		self.assertEqual(Rocker._splitArgs(['-v', '--output', 'jsonl', 'run', '--trace=t.json', 'web']), (['-v', '--output', 'jsonl', '--trace=t.json'], ['run', 'web']))
+		self.assertEqual(Rocker._splitArgs(['logs', '--', '--stats']), ([], ['logs', '--stats']))
+
+class HelperTest(TestCase):
+	def testFormatBytes(self):
+		self.assertEqual([formatBytes(v) for v in [None, 0, 1000, 3000, 90*1024**2, 2048*1024**3]], ['--', '0B', '1000B', '2.9KiB', '90.0MiB', '2048.0GiB'])
+
+	def testGetErrorMessage(self):
+		self.assertEqual(getErrorMessage(HttpResponseError('Not Found', 404, b'{"message": "No such image: foo"}')), "No such image: foo")
+		self.assertEqual(getErrorMessage(HttpResponseError('Server Error', 500, b'<html>')), "Docker error (code: 500)")
+		self.assertEqual(getErrorMessage(ValueError("oops")), "oops")
+
+	def testRunParallel(self):
+		lock = threading.Lock()
+		running = [0, 0] # current, max
+		done = []
+
+		def fn(item):
+			with lock:
+				running[0] += 1
+				running[1] = max(running[1], running[0])
+			time.sleep(.02)
+			with lock:
+				running[0] -= 1
+				done.append((item, threading.current_thread().name.split('-')[0]))
+			if item % 3 == 0:
+				raise ValueError("item {0}".format(item))
+
+		errors = runParallel(range(10), fn, 3, 'test')
+		self.assertEqual(sorted(done), [(i, 'test') for i in range(10)])
+		self.assertEqual(running[1], 3)
+		self.assertEqual(sorted(errors.keys()), [0, 3, 6, 9])
+		self.assertEqual(str(errors[6]), "item 6")
+
+		self.assertEqual(runParallel([], fn, 3), {})
@@ -0,0 +1,103 @@
+from rocker import server
+from rocker.commands import isStreaming
+from rocker.rocker import Rocker
+from tests.fakedaemon import FakeDaemon
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+class ServerTest(TestCase):
+	def testForward(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			# fake docker socket (nobody's listening, the version info will be read from the cache)
+			dockerSock = os.path.join(tmpDir, 'docker.sock')
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.bind(dockerSock)
+
+			serverSock = os.path.join(tmpDir, 'serve.sock')
+			env = dict(os.environ, XDG_CACHE_HOME=tmpDir, DOCKER_HOST='unix://'+dockerSock, ROCKER_SERVER=serverSock)
+
+			with patch.dict('os.environ', env):
+				r = Rocker()
+				r._writeVersionCache(r._getVersionCacheKey(), {'ApiVersion': '1.24', 'Version': '1.12.0', 'KernelVersion': '4.4.0', 'GitCommit': '78d1802', 'GoVersion': 'go1.6.3'})
+
+			# the server runs commands in-process (and redirects sys.stdout) => run it in a separate process
+			proc = subprocess.Popen([sys.executable, '-c', 'import rocker, sys; sys.argv = ["rocker", "serve"]; sys.exit(rocker.main())'],
+				env=dict(env, PYTHONPATH=os.getcwd()), stdout=subprocess.DEVNULL)
+
+			try:
+				for i in range(100):
+					if os.path.exists(serverSock):
+						break
+					time.sleep(.05)
+
+				with patch.dict('os.environ', env), patch('sys.stdout', new=StringIO()) as out:
+					self.assertEqual(server.forward(['version'], serverSock), 0)
+					self.assertIn("Docker version: 1.12.0", out.getvalue())
+
+				# commands are rejected if they'd use another docker daemon
+				with patch.dict('os.environ', dict(env, DOCKER_HOST='unix:///nonexistent.sock')):
+					self.assertEqual(server.forward(['version'], serverSock), None)
+
+				# ... or another config index, lock or cache directory
+				for key in ['ROCKER_CONTEXT_CACHE', 'ROCKER_CONTEXT_CACHE_DIR', 'ROCKER_INDEX', 'ROCKER_LOCK_DIR', 'XDG_CACHE_HOME']:
+					with patch.dict('os.environ', dict(env, **{key: os.path.join(tmpDir, 'other')})):
+						self.assertEqual(server.forward(['version'], serverSock), None)
+
+				# no server running
+				self.assertEqual(server.forward(['version'], os.path.join(tmpDir, 'nope.sock')), None)
+			finally:
+				proc.terminate()
+				proc.wait()
+				sock.close()
+
+	# The server's inspect cache is invalidated using docker's event stream
+	def testEvents(self):
+		with tempfile.TemporaryDirectory() as tmpDir, patch.dict('os.environ', {'XDG_CACHE_HOME': tmpDir}), FakeDaemon(chunkSize=5) as daemon:
+			daemon.addImage('debian')
+			srv = server.Server(os.path.join(tmpDir, 'serve.sock'), Rocker(daemon.getUrl()), watchEvents=False)
+			cache = srv._cache
+
+			# the cache gets cleared once we're connected to the event stream
+			cache['connected'] = False
+			thread = threading.Thread(target=srv._eventLoop)
+			thread.start()
+			try:
+				self._waitFor(lambda: not 'connected' in cache)
+
+				cache[('containers', 'web')] = {}
+				cache[('containers', 'other')] = {}
+				cache[('images', 'debian')] = {}
+
+				daemon._emit('container', 'start', 'abc123', {'name': 'web'})
+				self._waitFor(lambda: not ('containers', 'web') in cache)
+				daemon.addImage('alpine')
+				self._waitFor(lambda: not ('images', 'debian') in cache)
+				self.assertIn(('containers', 'other'), cache)
+			finally:
+				srv.shutdown()
+				daemon.stop()
+				thread.join()
+
+	# commands that don't finish on their own aren't forwarded (they'd block the server)
+	def testStreamingCommands(self):
+		for args in [['logs', '-f'], ['logs', 'web', '--follow'], ['logs', '--tail=10', '-f', 'web'], ['stats'], ['stats', '--interval=2', 'web']]:
+			self.assertTrue(isStreaming(args), args)
+		for args in [['logs'], ['logs', '--tail=10', 'web'], ['stats', '--no-stream'], ['run', 'web.rocker'], ['logs', '--nope']]:
+			self.assertFalse(isStreaming(args), args)
+
+	def _waitFor(self, fn, timeout=5):
+		end = time.monotonic()+timeout
+		while not fn():
+			if time.monotonic() > end:
+				self.fail("Timeout")
+			time.sleep(.01)
@@ -0,0 +1,18 @@
+from benchmarks import startup
+
+from unittest import TestCase
+
+import subprocess
+import sys
+
+class StartupTest(TestCase):
+	# Importing rocker must not pull in modules that are only needed by some of the commands
+	def testNoSlowImports(self):
+		_, modules = startup.measure()
+		self.assertIn('rocker', modules)
+		self.assertEqual(set(startup.FORBIDDEN) & modules, set())
+
+	def testUsage(self):
+		proc = subprocess.run([sys.executable, '-c', 'import rocker; rocker.getCommand("help").usage()'], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+		for cmd in ['backup', 'build', 'gc', 'help', 'logs', 'rerun', 'restore', 'run', 'serve', 'stats', 'version']:
+			self.assertIn("\t{0} ".format(cmd), proc.stdout)
@@ -0,0 +1,137 @@
+from rocker import stats
+from rocker.restclient import Request
+from rocker.rocker import Rocker
+from rocker.stats import ContainerStats, StatsCollector
+from tests.fakedaemon import FakeDaemon
+
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import json
+import tempfile
+
+class ContainerStatsTest(TestCase):
+	def _sample(self, read, cpu, system, rx, tx, precpu=None):
+		return {
+			'read': read,
+			'cpu_stats': {'cpu_usage': {'total_usage': cpu, 'percpu_usage': [0, 0, 0, 0]}, 'system_cpu_usage': system},
+			'precpu_stats': precpu or {},
+			'memory_stats': {'usage': 300, 'limit': 1000, 'stats': {'total_inactive_file': 100}},
+			'networks': {'eth0': {'rx_bytes': rx, 'tx_bytes': tx}, 'eth1': {'rx_bytes': rx, 'tx_bytes': 0}},
+			'pids_stats': {'current': 7}
+		}
+
+	def testRates(self):
+		ctr = ContainerStats('web')
+		ctr.update(self._sample('2020-01-01T00:00:00.5Z', 1000, 10000, 100, 50))
+		self.assertEqual(ctr.cpuPercent, None) # no precpu_stats
+		self.assertEqual(ctr.netRx, None)
+		self.assertEqual(ctr.memUsage, 200)
+		self.assertEqual(ctr.getMemPercent(), 20)
+		self.assertEqual(ctr.pids, 7)
+
+		# samples may be skipped, the counters are cumulative
+		ctr.update(self._sample('2020-01-01T00:00:02.500000000Z', 3000, 30000, 500, 250))
+		self.assertAlmostEqual(ctr.cpuPercent, 2000*100*4/20000)
+		self.assertAlmostEqual(ctr.netRx, 400)
+		self.assertAlmostEqual(ctr.netTx, 100)
+
+		# first sample with precpu_stats
+		ctr = ContainerStats('db')
+		ctr.update(self._sample('2020-01-01T00:00:00Z', 1500, 12000, 0, 0, precpu={'cpu_usage': {'total_usage': 1000}, 'system_cpu_usage': 10000}))
+		self.assertAlmostEqual(ctr.cpuPercent, 100)
+
+class StatsTest(TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.TemporaryDirectory()
+		self.env = patch.dict('os.environ', {'XDG_CACHE_HOME': self.tmpDir.name})
+		self.env.start()
+
+	def tearDown(self):
+		self.env.stop()
+		self.tmpDir.cleanup()
+
+	def _createContainers(self, daemon, names):
+		daemon.addImage('debian')
+		for name in names:
+			with Request(daemon.getUrl()) as req:
+				req.doPost('/containers/create?name={0}'.format(name)).send({'Image': 'debian'}).getObject()
+			with Request(daemon.getUrl()) as req:
+				req.doPost('/containers/{0}/start'.format(name)).send()
+
+	def testStream(self):
+		names = ['ctr{0}'.format(i) for i in range(20)]
+		with FakeDaemon(chunkSize=100, statsInterval=.01) as daemon:
+			self._createContainers(daemon, names)
+
+			renders = []
+			collector = StatsCollector(names+['nonexistent'], Rocker(daemon.getUrl()))
+			collector.run(lambda containers: renders.append(stats.formatTable(containers)), interval=.1, iterations=3)
+			self.assertEqual(len(renders), 3)
+			self.assertEqual(collector.getOpenStreams(), 0)
+
+			containers = collector.getContainers()
+			for ctr in containers[:-1]:
+				self.assertAlmostEqual(ctr.cpuPercent, 25)
+				self.assertAlmostEqual(ctr.netRx, 1000)
+				self.assertAlmostEqual(ctr.netTx, 500)
+				self.assertEqual(ctr.memUsage, 90*1024*1024)
+			self.assertEqual(containers[-1].error, "No such container: nonexistent")
+
+			lines = renders[-1].splitlines()
+			self.assertEqual(lines[0].split(), ['NAME', 'CPU', '%', 'MEM', 'USAGE', '/', 'LIMIT', 'MEM', '%', 'NET', 'RX/s', 'NET', 'TX/s', 'PIDS'])
+			self.assertEqual(lines[1].split(), ['ctr0', '25.0%', '90.0MiB', '/', '1.0GiB', '8.8%', '1000B', '500B', '3'])
+
+	# stopping the containers ends the streams (and run())
+	def testStop(self):
+		with FakeDaemon(statsInterval=.01) as daemon:
+			self._createContainers(daemon, ['web'])
+
+			def render(containers):
+				if daemon.getContainer('web')['State']['Running']:
+					with Request(daemon.getUrl()) as req:
+						req.doPost('/containers/web/stop').send()
+
+			collector = StatsCollector(['web'], Rocker(daemon.getUrl()))
+			collector.run(render, interval=.05)
+			self.assertEqual(collector.getOpenStreams(), 0)
+			self.assertEqual(collector.getContainers()[0].error, None)
+
+	# a connection error only ends the affected container's stream
+	def testConnectionError(self):
+		with FakeDaemon(statsInterval=.01) as daemon:
+			self._createContainers(daemon, ['web', 'db'])
+
+			def reset(length=0):
+				raise ConnectionResetError(104, "Connection reset by peer")
+
+			collector = StatsCollector(['web', 'db'], Rocker(daemon.getUrl()))
+			collector.start()
+			for key in collector._selector.get_map().values():
+				if key.data._ctr.name == 'web':
+					key.fileobj.recvAvailable = reset
+
+			renders = []
+			collector.run(lambda containers: renders.append(stats.formatTable(containers)), interval=.05, iterations=2)
+			self.assertEqual(len(renders), 2)
+
+			web, db = collector.getContainers()
+			self.assertEqual(web.error, "Lost connection to the Docker daemon: [Errno 104] Connection reset by peer")
+			self.assertEqual(db.error, None)
+			self.assertAlmostEqual(db.cpuPercent, 25)
+			self.assertIn("Lost connection", renders[-1].splitlines()[1])
+
+	def testNoStreamJson(self):
+		with FakeDaemon() as daemon, patch('sys.stdout', new=StringIO()) as out:
+			self._createContainers(daemon, ['web', 'db'])
+
+			r = Rocker(daemon.getUrl())
+			r.setOutputMode('jsonl')
+			self.assertTrue(stats.show(['web', 'db'], stream=False, r=r))
+
+		events = [json.loads(line) for line in out.getvalue().splitlines()]
+		self.assertEqual([e['name'] for e in events], ['web', 'db'])
+		self.assertEqual(events[0]['cpu'], 25)
+		self.assertEqual(events[0]['memLimit'], 1024*1024*1024)
+		self.assertEqual(events[0]['netRx'], None) # needs two samples
@@ -0,0 +1,56 @@
+from rocker import trace
+
+from unittest import TestCase
+
+import json
+import os
+import tempfile
+
+@trace.traced('test.fn')
+def _tracedFn(name, rc):
+	with trace.span('inner', foo='bar'):
+		return rc
+
+class TraceTest(TestCase):
+	def tearDown(self):
+		trace._tracer = None
+
+	def testDisabled(self):
+		self.assertEqual(trace.getTracer(), None)
+		self.assertIs(trace.span('a'), trace.span('b', name='myImage')) # shared no-op context manager
+		self.assertEqual(_tracedFn('x', 42), 42)
+		trace.finish() # no-op
+
+	def testSpans(self):
+		with tempfile.TemporaryDirectory() as tmpDir:
+			path = os.path.join(tmpDir, 'trace.json')
+			trace.enable(path)
+
+			with trace.span('outer', cat='http', url='/version', name='myApp'):
+				self.assertEqual(_tracedFn('myImage', 23), 23)
+			with self.assertRaises(ValueError):
+				with trace.span('failing'):
+					raise ValueError("spans are recorded even if an exception is raised")
+
+			trace.finish()
+			self.assertEqual(trace.getTracer(), None)
+
+			with open(path) as f:
+				events = json.load(f)['traceEvents']
+
+		meta = [e for e in events if e['ph'] == 'M']
+		self.assertEqual(len(meta), 1)
+		self.assertEqual(meta[0]['args']['name'], 'MainThread')
+
+		spans = dict((e['name'], e) for e in events if e['ph'] == 'X')
+		self.assertEqual(set(spans.keys()), {'outer', 'test.fn', 'inner', 'failing'})
+		self.assertEqual(spans['outer']['cat'], 'http')
+		self.assertEqual(spans['outer']['args'], {'url': '/version', 'name': 'myApp'})
+		self.assertEqual(spans['test.fn']['args'], {'name': 'myImage'})
+		self.assertEqual(spans['inner']['args'], {'foo': 'bar'})
+
+		# nested spans are contained in their parent's time range (allowing for rounding to 0.1µs)
+		for parent, child in [('outer', 'test.fn'), ('test.fn', 'inner')]:
+			p, c = spans[parent], spans[child]
+			self.assertLessEqual(p['ts'], c['ts'])
+			self.assertGreaterEqual(p['ts']+p['dur']+.2, c['ts']+c['dur'])